@@ -1,7 +1,31 @@
 """dsctriage module."""
 
-from dsctriage.discourse_post import DiscoursePost
-from dsctriage.discourse_topic import DiscourseTopic
-from dsctriage.discourse_category import DiscourseCategory
+import importlib
+
+# Equivalent to typing.TYPE_CHECKING without importing typing, so linters and type checkers still see the models
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from dsctriage.discourse_post import DiscoursePost
+    from dsctriage.discourse_topic import DiscourseTopic
+    from dsctriage.discourse_category import DiscourseCategory
 
 __all__ = ["DiscoursePost", "DiscourseTopic", "DiscourseCategory"]
+
+# Models are imported on first access so importing a single submodule, or starting the cli, does not load them all
+_MODEL_MODULES = {
+    "DiscoursePost": "dsctriage.discourse_post",
+    "DiscourseTopic": "dsctriage.discourse_topic",
+    "DiscourseCategory": "dsctriage.discourse_category",
+}
+
+
+def __getattr__(name):
+    """Import a model class when it is first accessed from the package."""
+    if name in _MODEL_MODULES:
+        return getattr(importlib.import_module(_MODEL_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    """List the package's attributes, including models not imported yet."""
+    return sorted(list(globals()) + __all__)
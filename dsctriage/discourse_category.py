@@ -42,6 +42,21 @@ class DiscourseCategory:
             return "Invalid Category"
         return "Category: " + str(self._name)
 
+    def to_json(self):
+        """Convert the category and its subcategories, without topics, back into a JSON object."""
+        category_json = {
+            "id": self._id,
+            "name": self._name,
+            "slug": self._slug,
+            "description_text": self._description,
+        }
+        category_json = {key: value for key, value in category_json.items() if value is not None}
+
+        if len(self._subcategories) > 0:
+            category_json["subcategory_list"] = [subcategory.to_json() for subcategory in self._subcategories]
+
+        return category_json
+
     def get_id(self):
         """Get the global discourse id for the category."""
         return self._id
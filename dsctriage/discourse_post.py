@@ -6,13 +6,13 @@ from datetime import datetime
 class DiscoursePost:
     """Class that contains discourse post data extracted from a JSON object."""
 
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes,too-many-branches
     def __init__(self, post_json):
         """
         Create a post object using a JSON object.
 
         Valid keys: 'id', 'username', 'name', 'created_at', 'updated_at', 'post_number', 'raw', 'reply_count',
-        'reply_to_post_number'
+        'reply_to_post_number', 'topic_id', 'editor_name'
         """
         self._id = None
         self._author_username = None
@@ -23,6 +23,8 @@ class DiscoursePost:
         self._data = None
         self._num_replies = None
         self._reply_to_number = None
+        self._topic_id = None
+        self._editor_name = None
 
         if "id" in post_json:
             self._id = post_json["id"]
@@ -57,12 +59,35 @@ class DiscoursePost:
         if "reply_to_post_number" in post_json:
             self._reply_to_number = post_json["reply_to_post_number"]
 
+        if "topic_id" in post_json:
+            self._topic_id = post_json["topic_id"]
+
+        if "editor_name" in post_json:
+            self._editor_name = post_json["editor_name"]
+
     def __str__(self):
         """Display post as invalid or by its id."""
         if self._id is None:
             return "Invalid Post"
         return "Post #" + str(self._id)
 
+    def to_json(self):
+        """Convert the post back into a JSON object that can be used to recreate it."""
+        post_json = {
+            "id": self._id,
+            "username": self._author_username,
+            "name": self._author_name,
+            "created_at": None if self._created_at is None else self._created_at.isoformat(),
+            "updated_at": None if self._updated_at is None else self._updated_at.isoformat(),
+            "post_number": self._post_number,
+            "raw": self._data,
+            "reply_count": self._num_replies,
+            "reply_to_post_number": self._reply_to_number,
+            "topic_id": self._topic_id,
+            "editor_name": self._editor_name,
+        }
+        return {key: value for key, value in post_json.items() if value is not None}
+
     def get_id(self):
         """Get discourse post global id."""
         return self._id
@@ -99,6 +124,18 @@ class DiscoursePost:
         """Get the post number that this post is a reply to if any."""
         return self._reply_to_number
 
+    def get_topic_id(self):
+        """Get the id of the topic the post belongs to."""
+        return self._topic_id
+
+    def get_editor_name(self):
+        """Get the name of the post's most recent editor, if it has been looked up."""
+        return self._editor_name
+
+    def set_editor_name(self, editor_name):
+        """Set the name of the post's most recent editor."""
+        self._editor_name = editor_name
+
     def is_main_post_for_topic(self):
         """Check if this post is the main post a given topic is about."""
         return self._post_number == 1
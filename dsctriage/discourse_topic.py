@@ -7,17 +7,21 @@ from .discourse_post import DiscoursePost
 class DiscourseTopic:
     """Class that contains discourse topic data extracted from a JSON object."""
 
+    # pylint: disable=too-many-instance-attributes,too-many-branches
     def __init__(self, topic_json):
         """
         Create a topic object using a JSON object.
 
-        Valid keys: 'id', 'title', 'slug'
+        Valid keys: 'id', 'title', 'slug', 'pinned', 'bumped', 'bumped_at', 'last_posted_at', 'posts_count', 'tags',
+        'fetch_failed'
         """
         self._id = None
         self._name = None
         self._slug = None
         self._latest_update_time = None
         self._pinned = False
+        self._posts_count = None
+        self._fetch_failed = False
 
         if "id" in topic_json:
             self._id = topic_json["id"]
@@ -31,13 +35,22 @@ class DiscourseTopic:
         if "pinned" in topic_json:
             self._pinned = topic_json["pinned"]
 
+        if "posts_count" in topic_json:
+            self._posts_count = topic_json["posts_count"]
+
+        if "fetch_failed" in topic_json:
+            self._fetch_failed = topic_json["fetch_failed"]
+
         try:
             if "bumped" in topic_json and topic_json["bumped"] and "bumped_at" in topic_json:
                 self._latest_update_time = datetime.fromisoformat(topic_json["bumped_at"].replace("Z", "+00:00"))
 
             if "last_posted_at" in topic_json:
                 last_posted_at = datetime.fromisoformat(topic_json["last_posted_at"].replace("Z", "+00:00"))
-                self._latest_update_time = max(self._latest_update_time, last_posted_at)
+                if self._latest_update_time is None:
+                    self._latest_update_time = last_posted_at
+                else:
+                    self._latest_update_time = max(self._latest_update_time, last_posted_at)
 
         except (OSError, ValueError):
             pass
@@ -55,6 +68,28 @@ class DiscourseTopic:
             return "Invalid Topic"
         return "Topic: " + str(self._name)
 
+    def to_json(self):
+        """Convert the topic, without its posts, back into a JSON object that can be used to recreate it."""
+        topic_json = {
+            "id": self._id,
+            "title": self._name,
+            "slug": self._slug,
+            "pinned": self._pinned,
+            "posts_count": self._posts_count,
+        }
+
+        if self._latest_update_time is not None:
+            topic_json["bumped"] = True
+            topic_json["bumped_at"] = self._latest_update_time.isoformat()
+
+        if len(self._tags) > 0:
+            topic_json["tags"] = list(self._tags)
+
+        if self._fetch_failed:
+            topic_json["fetch_failed"] = True
+
+        return {key: value for key, value in topic_json.items() if value is not None}
+
     def get_id(self):
         """Get the global discourse id of the topic."""
         return self._id
@@ -71,6 +106,18 @@ class DiscourseTopic:
         """Get the pinned status of the topic."""
         return self._pinned
 
+    def get_posts_count(self):
+        """Get the number of posts the topic had when it was listed, or None if unknown."""
+        return self._posts_count
+
+    def get_fetch_failed(self):
+        """Get whether downloading the topic's posts failed or was stopped, so they may be missing."""
+        return self._fetch_failed
+
+    def set_fetch_failed(self, fetch_failed):
+        """Set whether downloading the topic's posts failed or was stopped."""
+        self._fetch_failed = fetch_failed
+
     def add_post(self, post):
         """Add a DiscoursePost object to the topic."""
         if isinstance(post, DiscoursePost):
@@ -0,0 +1,324 @@
+"""Activity analytics over many posts, computed on contiguous arrays of post data."""
+
+import bisect
+import math
+from array import array
+from datetime import datetime, timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SECONDS_PER_DAY = 86400
+
+# Upper bounds, in seconds, of the response time histogram buckets, with everything slower in a final bucket
+RESPONSE_TIME_BUCKETS = (("1 hour", 3600), ("1 day", SECONDS_PER_DAY), ("1 week", 7 * SECONDS_PER_DAY))
+
+
+def get_timestamp(time):
+    """Get a datetime as seconds since the epoch, or NaN if it is None so it never falls within a range."""
+    return math.nan if time is None else time.timestamp()
+
+
+class PostActivity:  # pylint: disable=too-many-instance-attributes
+    """
+    Creation and update times, authors, and topics of posts, stored column by column in contiguous arrays.
+
+    Authors and topics are stored as codes, which index into the authors and topic_ids lists. Times are seconds since
+    the epoch, and posts that were never edited have an update time equal to their creation time.
+    """
+
+    def __init__(self):
+        """Create empty activity columns."""
+        self.created = array("d")
+        self.updated = array("d")
+        self.author_codes = array("l")
+        self.topic_codes = array("l")
+        self.post_numbers = array("l")
+        self.authors = []
+        self.topic_ids = []
+        self.topic_names = []
+        self._author_code_by_name = {}
+        self._topic_code_by_id = {}
+
+    def __len__(self):
+        """Get the number of posts."""
+        return len(self.created)
+
+    def get_author_code(self, author):
+        """Get the code of an author, adding them if they are new."""
+        code = self._author_code_by_name.get(author)
+        if code is None:
+            code = self._author_code_by_name[author] = len(self.authors)
+            self.authors.append(author)
+        return code
+
+    def get_topic_code(self, topic_id, topic_name=None):
+        """Get the code of a topic by its id, adding it if it is new."""
+        code = self._topic_code_by_id.get(topic_id)
+        if code is None:
+            code = self._topic_code_by_id[topic_id] = len(self.topic_ids)
+            self.topic_ids.append(topic_id)
+            self.topic_names.append(topic_name)
+        return code
+
+    # pylint: disable=too-many-arguments
+    def add(self, created, updated, author, topic_id, post_number, topic_name=None):
+        """Add a post from its creation and update timestamps, author name, topic id, and post number."""
+        self.created.append(created)
+        self.updated.append(created if updated is None or math.isnan(updated) else updated)
+        self.author_codes.append(self.get_author_code(author))
+        self.topic_codes.append(self.get_topic_code(topic_id, topic_name))
+        self.post_numbers.append(post_number or 0)
+
+    def add_post(self, post, topic_id=None, topic_name=None):
+        """Add a DiscoursePost, belonging to the topic of the given id if it does not know its own."""
+        self.add(
+            get_timestamp(post.get_creation_time()),
+            get_timestamp(post.get_update_time()),
+            post.get_author_username(),
+            topic_id if post.get_topic_id() is None else post.get_topic_id(),
+            post.get_post_number(),
+            topic_name,
+        )
+
+    def add_topic(self, topic):
+        """Add every post of a DiscourseTopic."""
+        for post in topic.get_posts():
+            self.add_post(post, topic.get_id(), topic.get_name())
+
+    def add_categories(self, categories):
+        """Add every post of every topic in an iterable of (name, DiscourseCategory) pairs."""
+        for _, category in categories:
+            for topic in category.get_topics():
+                self.add_topic(topic)
+
+
+class ActivityStats:  # pylint: disable=too-many-instance-attributes
+    """Post activity counts and response times within a date range."""
+
+    def __init__(self, activity, start, end):
+        """Create empty statistics for activity within [start, end), given as timestamps."""
+        num_days = max(0, math.ceil((end - start) / SECONDS_PER_DAY))
+        self.activity = activity
+        self.start = start
+        self.end = end
+        self.new_by_author = [0] * len(activity.authors)
+        self.updated_by_author = [0] * len(activity.authors)
+        self.new_by_topic = [0] * len(activity.topic_ids)
+        self.updated_by_topic = [0] * len(activity.topic_ids)
+        self.new_by_day = [0] * num_days
+        self.updated_by_day = [0] * num_days
+        self.response_times = []
+        self.unanswered_topics = 0
+
+    def get_num_new(self):
+        """Get the number of posts created within the range."""
+        return sum(self.new_by_day)
+
+    def get_num_updated(self):
+        """Get the number of posts updated within the range, other than those created in it and never edited since."""
+        return sum(self.updated_by_day)
+
+    def get_top_contributors(self, count=10):
+        """Get up to count (author, new posts, updated posts) tuples, for the authors with the most posts in range."""
+        totals = [
+            (new + updated, code) for code, (new, updated) in enumerate(zip(self.new_by_author, self.updated_by_author))
+        ]
+        totals.sort(key=lambda total: (-total[0], self.activity.authors[total[1]] or ""))
+
+        return [
+            (self.activity.authors[code], self.new_by_author[code], self.updated_by_author[code])
+            for total, code in totals[:count]
+            if total > 0
+        ]
+
+    def get_busiest_topics(self, count=10):
+        """Get up to count (topic id, topic name, new posts, updated posts) tuples, for the most active topics."""
+        totals = [
+            (new + updated, code) for code, (new, updated) in enumerate(zip(self.new_by_topic, self.updated_by_topic))
+        ]
+        totals.sort(key=lambda total: -total[0])
+
+        return [
+            (
+                self.activity.topic_ids[code],
+                self.activity.topic_names[code],
+                self.new_by_topic[code],
+                self.updated_by_topic[code],
+            )
+            for total, code in totals[:count]
+            if total > 0
+        ]
+
+    def get_response_time_percentile(self, percentile):
+        """Get the response time in seconds that a percentage of answered topics were answered within, or None."""
+        if len(self.response_times) == 0:
+            return None
+
+        return self.response_times[min(len(self.response_times) - 1, int(len(self.response_times) * percentile / 100))]
+
+    def get_response_time_histogram(self):
+        """Get a list of (bucket name, number of topics) pairs of how quickly topics opened in range were answered."""
+        histogram = []
+        previous_index = 0
+
+        for name, bound in RESPONSE_TIME_BUCKETS:
+            index = bisect.bisect_left(self.response_times, bound)
+            histogram.append((f"< {name}", index - previous_index))
+            previous_index = index
+
+        histogram.append((f">= {RESPONSE_TIME_BUCKETS[-1][0]}", len(self.response_times) - previous_index))
+        histogram.append(("unanswered", self.unanswered_topics))
+        return histogram
+
+    def format_report(self, count=10):
+        """Create a readable report of post counts, top contributors, busiest topics, and response times."""
+        lines = [
+            f"New posts: {self.get_num_new()}, updated posts: {self.get_num_updated()}",
+            "",
+            f"{'Top contributors':<40} {'new':>6} {'updated':>8}",
+        ]
+        lines.extend(
+            f"{str(author):<40} {new:>6} {updated:>8}" for author, new, updated in self.get_top_contributors(count)
+        )
+
+        lines.extend(["", f"{'Busiest topics':<40} {'new':>6} {'updated':>8}"])
+        for topic_id, topic_name, new, updated in self.get_busiest_topics(count):
+            lines.append(f"{str(topic_name or topic_id)[:40]:<40} {new:>6} {updated:>8}")
+
+        lines.extend(["", f"{'Day':<40} {'new':>6} {'updated':>8}"])
+        for day, (new, updated) in enumerate(zip(self.new_by_day, self.updated_by_day)):
+            if new > 0 or updated > 0:
+                day_str = datetime.fromtimestamp(self.start + day * SECONDS_PER_DAY, timezone.utc).strftime("%Y-%m-%d")
+                lines.append(f"{day_str:<40} {new:>6} {updated:>8}")
+
+        lines.extend(
+            [
+                "",
+                f"Response times: median {format_duration(self.get_response_time_percentile(50))}, "
+                + f"90th percentile {format_duration(self.get_response_time_percentile(90))}",
+            ]
+        )
+        lines.extend(f"{name:<40} {num_topics:>6}" for name, num_topics in self.get_response_time_histogram())
+        return "\n".join(lines)
+
+
+def compute_activity_stats(activity, start, end, use_numpy=None):
+    """
+    Count new and updated posts by author, topic, and day, and find topic response times, within [start, end).
+
+    Start and end are timezone aware datetimes. As in reports, a post counts as updated if it was edited after it was
+    created and its update time is in range, or otherwise as new if its creation time is. The response time of a topic
+    opened in range is the time from its first post until the first reply by someone else.
+
+    The counts are computed with NumPy, when it is installed and use_numpy is not False, or plain loops otherwise.
+    """
+    stats = ActivityStats(activity, start.timestamp(), end.timestamp())
+
+    if use_numpy is None:
+        use_numpy = numpy is not None
+
+    if use_numpy:
+        compute_activity_stats_with_numpy(stats)
+    else:
+        compute_activity_stats_with_loops(stats)
+
+    return stats
+
+
+def compute_activity_stats_with_numpy(stats):  # pylint: disable=too-many-locals
+    """Fill in activity statistics with vectorized NumPy operations over the activity's arrays, without copying them."""
+    activity = stats.activity
+    if len(activity) == 0:
+        return
+
+    created = numpy.frombuffer(activity.created, dtype=numpy.float64)
+    updated = numpy.frombuffer(activity.updated, dtype=numpy.float64)
+    author_codes = numpy.frombuffer(activity.author_codes, dtype=numpy.dtype(f"i{activity.author_codes.itemsize}"))
+    topic_codes = numpy.frombuffer(activity.topic_codes, dtype=numpy.dtype(f"i{activity.topic_codes.itemsize}"))
+    post_numbers = numpy.frombuffer(activity.post_numbers, dtype=numpy.dtype(f"i{activity.post_numbers.itemsize}"))
+    num_authors = len(activity.authors)
+    num_topics = len(activity.topic_ids)
+    num_days = len(stats.new_by_day)
+
+    is_updated = (updated != created) & (updated >= stats.start) & (updated < stats.end)
+    is_new = ~is_updated & (created >= stats.start) & (created < stats.end)
+
+    for is_counted, times, by_author, by_topic, by_day in (
+        (is_new, created, "new_by_author", "new_by_topic", "new_by_day"),
+        (is_updated, updated, "updated_by_author", "updated_by_topic", "updated_by_day"),
+    ):
+        setattr(stats, by_author, numpy.bincount(author_codes[is_counted], minlength=num_authors).tolist())
+        setattr(stats, by_topic, numpy.bincount(topic_codes[is_counted], minlength=num_topics).tolist())
+        days = ((times[is_counted] - stats.start) // SECONDS_PER_DAY).astype(numpy.int64)
+        setattr(stats, by_day, numpy.bincount(days, minlength=num_days).tolist())
+
+    is_first_post = post_numbers == 1
+    topic_opened = numpy.full(num_topics, numpy.nan)
+    topic_opened[topic_codes[is_first_post]] = created[is_first_post]
+    topic_author = numpy.full(num_topics, -1, dtype=numpy.int64)
+    topic_author[topic_codes[is_first_post]] = author_codes[is_first_post]
+
+    is_reply = (post_numbers > 1) & (author_codes != topic_author[topic_codes]) & ~numpy.isnan(created)
+    first_reply = numpy.full(num_topics, numpy.inf)
+    numpy.minimum.at(first_reply, topic_codes[is_reply], created[is_reply])
+
+    opened_in_range = (topic_opened >= stats.start) & (topic_opened < stats.end)
+    response_times = first_reply[opened_in_range] - topic_opened[opened_in_range]
+    is_answered = numpy.isfinite(response_times)
+
+    stats.response_times = numpy.sort(response_times[is_answered]).tolist()
+    stats.unanswered_topics = int(numpy.count_nonzero(~is_answered))
+
+
+def compute_activity_stats_with_loops(stats):
+    """Fill in activity statistics by looping over the activity's arrays, for when NumPy is not installed."""
+    activity = stats.activity
+    topic_opened = [math.nan] * len(activity.topic_ids)
+    topic_author = [-1] * len(activity.topic_ids)
+
+    for created, author_code, topic_code, post_number in zip(
+        activity.created, activity.author_codes, activity.topic_codes, activity.post_numbers
+    ):
+        if post_number == 1:
+            topic_opened[topic_code] = created
+            topic_author[topic_code] = author_code
+
+    first_reply = [math.inf] * len(activity.topic_ids)
+
+    for created, updated, author_code, topic_code, post_number in zip(
+        activity.created, activity.updated, activity.author_codes, activity.topic_codes, activity.post_numbers
+    ):
+        if updated != created and stats.start <= updated < stats.end:
+            stats.updated_by_author[author_code] += 1
+            stats.updated_by_topic[topic_code] += 1
+            stats.updated_by_day[int((updated - stats.start) // SECONDS_PER_DAY)] += 1
+        elif stats.start <= created < stats.end:
+            stats.new_by_author[author_code] += 1
+            stats.new_by_topic[topic_code] += 1
+            stats.new_by_day[int((created - stats.start) // SECONDS_PER_DAY)] += 1
+
+        if post_number > 1 and author_code != topic_author[topic_code] and created < first_reply[topic_code]:
+            first_reply[topic_code] = created
+
+    for opened, replied in zip(topic_opened, first_reply):
+        if stats.start <= opened < stats.end:
+            if math.isinf(replied):
+                stats.unanswered_topics += 1
+            else:
+                stats.response_times.append(replied - opened)
+
+    stats.response_times.sort()
+
+
+def format_duration(seconds):
+    """Format a number of seconds as a short duration in minutes, hours, or days."""
+    if seconds is None:
+        return "-"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < SECONDS_PER_DAY:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / SECONDS_PER_DAY:.1f}d"
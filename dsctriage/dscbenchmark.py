@@ -0,0 +1,407 @@
+"""dsctriage micro-benchmarks, run with python3 -m dsctriage.dscbenchmark."""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from . import dscjson, dsctriage
+from .discourse_category import DiscourseCategory
+from .discourse_post import DiscoursePost
+from .discourse_topic import DiscourseTopic
+
+SAMPLE_TOPIC_POSTS = 200
+
+DEFAULT_REPEAT = 20
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+
+DEFAULT_STAGE_REPEAT = 3
+
+DEFAULT_NUM_TOPICS = 10
+
+DEFAULT_REPLY_DEPTH = 4
+
+DEFAULT_FAN_OUT = 3
+
+DEFAULT_EDIT_RATIO = 0.2
+
+# Stages slower than this are too quick to tell how they scale
+MIN_SCALING_TIME = 0.001
+
+# Growth in time per growth in posts, as a power, above which a stage is flagged as scaling quadratically
+QUADRATIC_EXPONENT = 1.5
+
+SYNTHETIC_START = datetime(2022, 5, 1, tzinfo=timezone.utc)
+
+SYNTHETIC_DAYS = 28
+
+BENCHMARK_STAGES = ("models", "classify", "tree", "render")
+
+
+def create_sample_topic_payload(num_posts=SAMPLE_TOPIC_POSTS):
+    """Create the JSON body of a topic download with a number of posts, for when no recorded payloads are given."""
+    posts = []
+    for i in range(1, num_posts + 1):
+        posts.append(
+            {
+                "id": 4592173 + i,
+                "name": f"User {i % 17}",
+                "username": f"username{i % 17}",
+                "avatar_template": f"/user_avatar/discourse.ubuntu.com/username{i % 17}/{{size}}/103124_2.png",
+                "created_at": "2022-05-16T13:59:43.661Z",
+                "updated_at": "2022-05-19T15:32:33.361Z",
+                "cooked": "<p>Test comment with <a href='https://ubuntu.com/server/docs'>a link</a></p>" * 4,
+                "post_number": i,
+                "post_type": 1,
+                "reply_count": i % 3,
+                "reply_to_post_number": None if i == 1 else max(1, i // 2),
+                "reads": 33,
+                "score": 26.6,
+                "topic_id": 11522,
+                "topic_slug": "virtualization-libvirt",
+                "actions_summary": [{"id": action_id, "can_act": True} for action_id in (2, 3, 4, 8, 6, 7)],
+            }
+        )
+
+    topic = {
+        "id": 11522,
+        "title": "Virtualization - libvirt",
+        "posts_count": num_posts,
+        "chunk_size": 20,
+        "post_stream": {"posts": posts, "stream": [post["id"] for post in posts]},
+    }
+    return json.dumps(topic).encode()
+
+
+def get_json_decoders():
+    """
+    Get a dictionary of JSON decoding functions by name, for each installed backend.
+
+    "json (str)" decodes the body into a str before parsing, as downloads were originally parsed.
+    """
+    decoders = {"json (str)": lambda body: json.loads(body.decode()), "json": json.loads}
+
+    if dscjson.orjson is not None:
+        decoders["orjson"] = dscjson.orjson.loads  # pylint: disable=no-member
+
+    return decoders
+
+
+def benchmark_json_decoding(payloads, repeat=DEFAULT_REPEAT):
+    """
+    Time how long each installed JSON backend takes to decode every payload, a list of response bodies as bytes.
+
+    Returns a dictionary of the fastest time in seconds, out of repeat passes over all payloads, by backend name.
+    """
+    results = {}
+
+    for name, decode in get_json_decoders().items():
+        fastest_time = None
+
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            for payload in payloads:
+                decode(payload)
+            pass_time = time.perf_counter() - start_time
+
+            if fastest_time is None or pass_time < fastest_time:
+                fastest_time = pass_time
+
+        results[name] = fastest_time
+
+    return results
+
+
+def format_json_benchmark(results, payloads):
+    """Create a table of decoding time and throughput per backend, marking the one dsctriage uses."""
+    total_bytes = sum(len(payload) for payload in payloads)
+    baseline = results.get("json (str)")
+    lines = [
+        f"Decoding {len(payloads)} payloads, {total_bytes / 1024:.1f} KiB",
+        f"{'backend':<12} {'ms/pass':>9} {'MiB/s':>8} {'speedup':>8}",
+    ]
+
+    for name, seconds in results.items():
+        speedup = f"{baseline / seconds:.2f}x" if baseline and seconds else "-"
+        active = " *" if name == dscjson.BACKEND else ""
+        throughput = total_bytes / 1024 / 1024 / seconds if seconds else 0
+        lines.append(f"{name:<12} {seconds * 1000:>9.3f} {throughput:>8.1f} {speedup:>8}{active}")
+
+    lines.append("* used for downloads")
+    return "\n".join(lines)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def create_synthetic_topics_json(
+    num_topics,
+    posts_per_topic,
+    reply_depth=DEFAULT_REPLY_DEPTH,
+    fan_out=DEFAULT_FAN_OUT,
+    edit_ratio=DEFAULT_EDIT_RATIO,
+    seed=0,
+):
+    """
+    Create (topic JSON, list of post JSON) pairs of synthetic topics, for timing report stages without downloading.
+
+    Posts after the main post reply in a tree where each post has up to fan_out replies, down to reply_depth replies
+    deep, after which posts reply to the main post. An edit_ratio fraction of posts are edited after being created.
+    Posts are spread over SYNTHETIC_DAYS days from SYNTHETIC_START.
+    """
+    random_generator = random.Random(seed)
+    window = SYNTHETIC_DAYS * 86400
+    topics_json = []
+
+    for topic_index in range(num_topics):
+        topic_id = 100000 + topic_index
+        topic_created = random_generator.uniform(0, window / 2)
+        depths = {1: 0}
+        posts_json = []
+
+        for post_number in range(1, posts_per_topic + 1):
+            reply_to = None
+            if post_number > 1:
+                parent = (post_number - 2) // fan_out + 1
+                if 1 < parent and depths[parent] < reply_depth:
+                    reply_to = parent
+                depths[post_number] = 1 if reply_to is None else depths[parent] + 1
+
+            created = SYNTHETIC_START + timedelta(seconds=topic_created + post_number * window / 2 / posts_per_topic)
+            updated = created
+            if random_generator.random() < edit_ratio:
+                updated += timedelta(seconds=random_generator.uniform(0, window / 4))
+
+            posts_json.append(
+                {
+                    "id": topic_id * 100000 + post_number,
+                    "username": f"user{random_generator.randrange(50)}",
+                    "name": f"User {post_number % 50}",
+                    "created_at": created.isoformat(),
+                    "updated_at": updated.isoformat(),
+                    "post_number": post_number,
+                    "reply_count": 0,
+                    "reply_to_post_number": reply_to,
+                    "topic_id": topic_id,
+                }
+            )
+
+        last_posted_at = max(post_json["updated_at"] for post_json in posts_json) if posts_json else None
+        topic_json = {"id": topic_id, "title": f"Synthetic topic {topic_index}", "slug": f"synthetic-{topic_index}"}
+        if last_posted_at is not None:
+            topic_json["last_posted_at"] = last_posted_at
+
+        topics_json.append((topic_json, posts_json))
+
+    return topics_json
+
+
+def create_synthetic_category(topics_json):
+    """Create a DiscourseCategory holding topics and posts created from (topic JSON, list of post JSON) pairs."""
+    category = DiscourseCategory({"id": 1, "name": "Synthetic"})
+
+    for topic_json, posts_json in topics_json:
+        topic = DiscourseTopic(topic_json)
+        for post_json in posts_json:
+            topic.add_post(DiscoursePost(post_json))
+        category.add_topic(topic)
+
+    return category
+
+
+def get_synthetic_date_range():
+    """Get the (start, end) datetime range reported on by the stage benchmarks, the middle half of synthetic posts."""
+    return SYNTHETIC_START + timedelta(days=SYNTHETIC_DAYS / 4), SYNTHETIC_START + timedelta(
+        days=SYNTHETIC_DAYS * 3 / 4
+    )
+
+
+def time_fastest(function, repeat, setup=None):
+    """Get the fastest time in seconds of repeat calls to a function, passing it the result of setup if given."""
+    fastest_time = None
+
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start_time = time.perf_counter()
+        function(argument)
+        call_time = time.perf_counter() - start_time
+
+        if fastest_time is None or call_time < fastest_time:
+            fastest_time = call_time
+
+    return fastest_time
+
+
+def benchmark_report_stages(topics_json, repeat=DEFAULT_STAGE_REPEAT):
+    """
+    Time each stage of showing a report on synthetic topics, returning the fastest time in seconds by stage name.
+
+    The stages are building models from JSON, classifying posts as new, updated, or unchanged, building reply trees,
+    and rendering the report into memory.
+    """
+    start, end = get_synthetic_date_range()
+    category = create_synthetic_category(topics_json)
+    topics = category.get_topics()
+
+    def classify(_):
+        return [dsctriage.get_metadata_for_posts_of_topic(topic, start, end)[0] for topic in topics]
+
+    def build_trees(metadata_lists):
+        trees = []
+        for post_metadata_list in metadata_lists:
+            top_level_posts = dsctriage.create_reply_tree(post_metadata_list)
+            for post_with_meta in top_level_posts:
+                dsctriage.set_relevant_post_metadata(post_with_meta)
+            trees.append(top_level_posts)
+        return trees
+
+    def render(trees):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for topic, top_level_posts in zip(topics, trees):
+                dsctriage.print_comments_within_topic(topic, top_level_posts, True)
+
+    return {
+        "models": time_fastest(lambda _: create_synthetic_category(topics_json), repeat),
+        "classify": time_fastest(classify, repeat),
+        "tree": time_fastest(build_trees, repeat, lambda: classify(None)),
+        "render": time_fastest(render, repeat, lambda: build_trees(classify(None))),
+    }
+
+
+def benchmark_scaling(sizes=DEFAULT_SIZES, num_topics=DEFAULT_NUM_TOPICS, repeat=DEFAULT_STAGE_REPEAT, **kwargs):
+    """
+    Time each report stage for synthetic categories with each total number of posts in sizes.
+
+    Posts are split between up to num_topics topics, so larger sizes also mean longer topics. Other keyword arguments
+    are passed to create_synthetic_topics_json. Returns a list of (number of posts, times by stage) pairs.
+    """
+    results = []
+
+    for size in sizes:
+        size_topics = max(1, min(num_topics, size))
+        topics_json = create_synthetic_topics_json(size_topics, max(1, size // size_topics), **kwargs)
+        num_posts = sum(len(posts_json) for _, posts_json in topics_json)
+        results.append((num_posts, benchmark_report_stages(topics_json, repeat)))
+
+    return results
+
+
+def get_scaling_exponent(previous_result, result, stage):
+    """Get how a stage's time grew with the number of posts between two results, as a power, or None if too quick."""
+    previous_posts, previous_times = previous_result
+    num_posts, times = result
+
+    if num_posts <= previous_posts or min(previous_times[stage], times[stage]) < MIN_SCALING_TIME:
+        return None
+
+    return math.log(times[stage] / previous_times[stage]) / math.log(num_posts / previous_posts)
+
+
+def find_quadratic_stages(results):
+    """Get the names of stages whose time grew at least quadratically with the number of posts between any sizes."""
+    return [
+        stage
+        for stage in BENCHMARK_STAGES
+        if any(
+            (get_scaling_exponent(previous_result, result, stage) or 0) > QUADRATIC_EXPONENT
+            for previous_result, result in zip(results, results[1:])
+        )
+    ]
+
+
+def format_scaling_benchmark(results):
+    """Create a table of time per post for each stage and size, marking stages that grew quadratically with a !."""
+    lines = [f"{'posts':>8} " + " ".join(f"{stage + ' us/post':>16}" for stage in BENCHMARK_STAGES)]
+
+    for i, (num_posts, times) in enumerate(results):
+        cells = []
+        for stage in BENCHMARK_STAGES:
+            exponent = get_scaling_exponent(results[i - 1], results[i], stage) if i > 0 else None
+            growth = "" if exponent is None else f"n^{exponent:.1f}"
+            flag = "!" if exponent is not None and exponent > QUADRATIC_EXPONENT else " "
+            cells.append(f"{times[stage] / num_posts * 1e6:>8.2f} {growth:>6}{flag}")
+        lines.append(f"{num_posts:>8} " + " ".join(cells))
+
+    quadratic_stages = find_quadratic_stages(results)
+    if len(quadratic_stages) > 0:
+        lines.append(f"! quadratic scaling in: {', '.join(quadratic_stages)}")
+
+    return "\n".join(lines)
+
+
+def run_stages_benchmark(args):
+    """Benchmark report stages on synthetic categories of growing size, exiting with an error if any scale badly."""
+    results = benchmark_scaling(
+        [int(size) for size in args.sizes.split(",")],
+        args.topics,
+        args.repeat,
+        reply_depth=args.reply_depth,
+        fan_out=args.fan_out,
+        edit_ratio=args.edit_ratio,
+    )
+    print(format_scaling_benchmark(results))
+
+    return 1 if len(find_quadratic_stages(results)) > 0 else 0
+
+
+def run_json_benchmark(args):
+    """Benchmark JSON decoding of recorded payload files, or a sample topic if there are none."""
+    payloads = []
+    for payload_file in args.payload_files:
+        with open(payload_file, "rb") as payload_data:
+            payloads.append(payload_data.read())
+
+    if len(payloads) == 0:
+        payloads.append(create_sample_topic_payload())
+
+    print(format_json_benchmark(benchmark_json_decoding(payloads, args.repeat), payloads))
+
+
+def main(argv=None):
+    """Run a benchmark chosen on the command line."""
+    parser = argparse.ArgumentParser(prog="python3 -m dsctriage.dscbenchmark", description="dsctriage benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    json_parser = subparsers.add_parser("json", help="compare JSON decoding backends on topic payloads")
+    json_parser.add_argument(
+        "payload_files",
+        nargs="*",
+        help="recorded Discourse responses, such as saved from https://discourse.ubuntu.com/t/11522.json",
+    )
+    json_parser.add_argument("-n", "--repeat", type=int, default=DEFAULT_REPEAT, help="number of timed passes")
+    json_parser.set_defaults(run=run_json_benchmark)
+
+    stages_parser = subparsers.add_parser(
+        "stages", help="time building models, classifying posts, building reply trees, and rendering as posts grow"
+    )
+    stages_parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="comma separated numbers of posts to time each stage with",
+    )
+    stages_parser.add_argument(
+        "--topics", type=int, default=DEFAULT_NUM_TOPICS, help="number of topics to split the posts between"
+    )
+    stages_parser.add_argument(
+        "--reply-depth", dest="reply_depth", type=int, default=DEFAULT_REPLY_DEPTH, help="deepest chain of replies"
+    )
+    stages_parser.add_argument(
+        "--fan-out", dest="fan_out", type=int, default=DEFAULT_FAN_OUT, help="most replies to a single post"
+    )
+    stages_parser.add_argument(
+        "--edit-ratio", dest="edit_ratio", type=float, default=DEFAULT_EDIT_RATIO, help="fraction of posts edited"
+    )
+    stages_parser.add_argument(
+        "-n", "--repeat", type=int, default=DEFAULT_STAGE_REPEAT, help="number of timed passes per stage and size"
+    )
+    stages_parser.set_defaults(run=run_stages_benchmark)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
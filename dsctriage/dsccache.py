@@ -0,0 +1,70 @@
+"""Cache of rendered reports, so repeated runs only download and render the topics that changed."""
+
+import json
+import os
+import tempfile
+
+CACHE_VERSION = 1
+
+
+# pylint: disable=too-many-arguments
+def create_report_key(site, category_names, tag, start, end, shorten_links=True):
+    """Create the key a report is cached under from everything that changes its output."""
+    return json.dumps([site, category_names, tag, start.isoformat(), end.isoformat(), shorten_links])
+
+
+class ReportCache:
+    """
+    Rendered reports saved in a JSON file, each with the bump time and rendered output of every topic in it.
+
+    A cached report is a dictionary holding a 'categories' list, with the 'name', 'category' JSON, 'watermark' bump
+    time of the newest topic listed, and 'topics' list of each category in the report. Every topic is a dictionary
+    with its 'id', 'bumped_at' time, and rendered 'output', in listing order.
+    """
+
+    def __init__(self, filename):
+        """Load cached reports from a file, starting empty if it does not exist or is from another version."""
+        self.filename = filename
+        self._reports = self.read_reports()
+        self._updated_keys = set()
+
+    def read_reports(self):
+        """Read every report in the cache file as a dictionary by key, or an empty one if it cannot be read."""
+        try:
+            with open(self.filename, "r", encoding="utf-8") as cache_file:
+                cache_json = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(cache_json, dict) or cache_json.get("version") != CACHE_VERSION:
+            return {}
+
+        return cache_json.get("reports", {})
+
+    def get_report(self, key):
+        """Get the cached report for a key, or None if there is none."""
+        return self._reports.get(key)
+
+    def set_report(self, key, report):
+        """Replace the cached report for a key."""
+        self._reports[key] = report
+        self._updated_keys.add(key)
+
+    def save(self):
+        """
+        Write the reports set since the cache was loaded to the cache file, keeping any others saved in the meantime.
+
+        The file is replaced at once, so runs sharing a cache never read a partly written one.
+        """
+        reports = self.read_reports()
+        reports.update({key: self._reports[key] for key in self._updated_keys})
+
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False) as cache_file:
+            json.dump({"version": CACHE_VERSION, "reports": reports}, cache_file, separators=(",", ":"))
+
+        os.replace(cache_file.name, self.filename)
+        self._reports = reports
+        self._updated_keys.clear()
@@ -9,6 +9,8 @@ default_config = {
         "site": "https://discourse.ubuntu.com",
         "progress_bar": True,
         "shorten_links": True,
+        "index": "",
+        "cache": "",
     }
 }
 
@@ -86,3 +88,23 @@ class Config:
     def shorten_links(self, value):
         """Set the configuration for whether to use hyperlinks or full links in the output."""
         self._config.set("dsctriage", "shorten_links", value)
+
+    @property
+    def index(self):
+        """Get the file of the local post search index to fill while downloading, or None if there is none."""
+        return self._config.get("dsctriage", "index") or None
+
+    @index.setter
+    def index(self, value):
+        """Set the file of the local post search index to fill while downloading."""
+        self._config.set("dsctriage", "index", value or "")
+
+    @property
+    def cache(self):
+        """Get the file to keep reports in for repeated runs, or None if reports are not cached."""
+        return self._config.get("dsctriage", "cache") or None
+
+    @cache.setter
+    def cache(self, value):
+        """Set the file to keep reports in for repeated runs."""
+        self._config.set("dsctriage", "cache", value or "")
@@ -1,9 +1,9 @@
 """Discourse API handler module."""
 
-from urllib import request
-from urllib.error import HTTPError
-import json
+from urllib.error import HTTPError, URLError
 import logging
+import threading
+from . import dschttp, dscstats, dsctrace
 from .discourse_post import DiscoursePost
 from .discourse_topic import DiscourseTopic
 from .discourse_category import DiscourseCategory
@@ -14,6 +14,9 @@ POST_JSON_URL = "#url/posts/#id.json"
 
 POST_LATEST_EDIT_JSON_URL = "#url/posts/#id/revisions/latest.json"
 
+# The id of a post by number is the topic id and post number separated by a slash
+POST_BY_NUMBER_JSON_URL = "#url/posts/by_number/#id.json"
+
 CATEGORY_JSON_URL = "#url/c/#id/show.json"
 
 CATEGORY_TOPIC_LIST_JSON_URL = "#url/c/#id.json?state=muted"
@@ -26,6 +29,29 @@ TOPIC_POST_BATCH_JSON_URL = "#url/t/#id/posts.json"
 
 USER_JSON_URL = "#url/u/#id.json"
 
+# Number of posts to request in a single batch from a site until it refuses a batch that large
+DEFAULT_POST_BATCH_SIZE = 200
+
+# Longest batch URL to request, since servers and proxies refuse longer ones before any batch size limit applies
+MAX_URL_LENGTH = 2000
+
+# HTTP statuses sites answer with when a batch request's URL or query is too long, after which smaller batches are used
+BATCH_TOO_LARGE_STATUSES = (400, 413, 414)
+
+_clients = {}
+
+_clients_lock = threading.Lock()
+
+
+def get_client(site=None):
+    """Get the DiscourseClient shared by the functions of this module for a site, or the default site if None."""
+    site_url = get_site_url(site)
+
+    with _clients_lock:
+        if site_url not in _clients:
+            _clients[site_url] = DiscourseClient(site_url)
+        return _clients[site_url]
+
 
 def create_url(template, id_var, site=None):
     """
@@ -58,18 +84,16 @@ def get_post_by_id(post_id, site=None):
 
     Returns None if download fails or id is invalid.
     """
-    post_url = create_url(POST_JSON_URL, post_id, site)
+    return get_client(site).get_post(post_id)
 
-    try:
-        with request.urlopen(post_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
 
-        logging.debug("Post downloaded from %s", post_url)
+def get_posts_by_id(post_ids, site=None):
+    """
+    Download posts for a list of ids concurrently and return them as a dictionary of DiscoursePosts by string id.
 
-        return DiscoursePost(json_output)
-    except HTTPError:
-        logging.debug("Failed to get post from URL %s", post_url)
-        return None
+    Ids that could not be downloaded are left out.
+    """
+    return get_client(site).get_posts(post_ids)
 
 
 def get_batch_of_posts_by_id(topic_id, post_ids, site=None):
@@ -79,27 +103,7 @@ def get_batch_of_posts_by_id(topic_id, post_ids, site=None):
     Invalid post ids are ignored
     Returns None if download fails, or an emtpy list if there are no valid ids
     """
-    if post_ids is None or len(post_ids) == 0:
-        return []
-
-    posts_url = create_url(TOPIC_POST_BATCH_JSON_URL, topic_id, site)
-
-    # append post ids to the url through params with the format post_ids[]=<id>
-    posts_url += f"?post_ids[]={post_ids[0]}"
-    for post_id in post_ids[1::]:
-        posts_url += f"&post_ids[]={post_id}"
-
-    try:
-        with request.urlopen(posts_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
-
-        logging.debug("Post stream downloaded from %s", posts_url)
-
-        return extract_posts_from_json_post_stream(json_output)
-
-    except HTTPError:
-        logging.debug("Failed to get post stream from URL %s", posts_url)
-        return None
+    return get_client(site).get_batch_of_posts(topic_id, post_ids)
 
 
 def get_category_by_id(category_id, site=None):
@@ -108,20 +112,7 @@ def get_category_by_id(category_id, site=None):
 
     Returns None if download fails or id is invalid.
     """
-    category_url = create_url(CATEGORY_JSON_URL, category_id, site)
-
-    try:
-        with request.urlopen(category_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
-
-        logging.debug("Category downloaded from URL %s", category_url)
-
-        if "category" in json_output:
-            return DiscourseCategory(json_output["category"])
-    except HTTPError:
-        logging.debug("Failed to get category from URL %s", category_url)
-
-    return None
+    return get_client(site).get_category(category_id)
 
 
 def get_category_by_name(category_name, site=None):
@@ -130,123 +121,98 @@ def get_category_by_name(category_name, site=None):
 
     Returns result as a DiscourseCategory object or None if download fails or name is invalid.
     """
-    category_nav = category_name.split("/")
-    final_category = None
-    categories_url = create_url(CATEGORY_LIST_JSON_URL, "", site)
+    return get_client(site).get_category_by_name(category_name)
 
-    try:
-        with request.urlopen(categories_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
 
-        logging.debug("Getting category list from URL %s", categories_url)
+def add_subcategories_to_category_by_ids(category, subcategory_ids, site=None):
+    """Add subcategories with ids contained in an array to a parent category."""
+    get_client(site).add_subcategories_to_category(category, subcategory_ids)
 
-        if "category_list" in json_output and "categories" in json_output["category_list"]:
-            for category in json_output["category_list"]["categories"]:
-                if (
-                    category["name"].lower() == category_nav[0].lower()
-                    or category["slug"].lower() == category_nav[0].lower()
-                ):
-                    final_category = DiscourseCategory(category)
 
-                    # Some discourse sites fail to provide a subcategory list, check subcategory ids in this case
-                    if "subcategory_list" not in category and "subcategory_ids" in category:
-                        add_subcategories_to_category_by_ids(final_category, category["subcategory_ids"], site)
+def create_post_batch_url(topic_id, post_ids, site=None):
+    """Create the URL of a topic's batch endpoint for a list of post ids, given as params like post_ids[]=<id>."""
+    post_id_params = "&".join(f"post_ids[]={post_id}" for post_id in post_ids)
+    return f"{create_url(TOPIC_POST_BATCH_JSON_URL, topic_id, site)}?{post_id_params}"
 
-    except HTTPError:
-        logging.debug("Failed to get category list from URL %s", categories_url)
 
-    for i in range(1, len(category_nav)):
-        if final_category:
-            final_category = final_category.get_subcategory_by_name(category_nav[i])
-        else:
-            break
+def get_post_batch_size(site=None):
+    """Get the largest number of posts a site has accepted in a single batch request."""
+    return get_client(site).get_post_batch_size()
 
-    return final_category
 
+def reduce_post_batch_size(batch_size, site=None):
+    """Lower the number of posts requested in a single batch from a site after it refused a larger batch."""
+    get_client(site).reduce_post_batch_size(batch_size)
 
-def add_subcategories_to_category_by_ids(category, subcategory_ids, site=None):
-    """Add subcategories with ids contained in an array to a parent category."""
-    for subcategory_id in subcategory_ids:
-        new_subcategory = get_category_by_id(subcategory_id, site)
-        if new_subcategory:
-            category.add_subcategory(new_subcategory)
 
+def split_post_ids_into_batches(topic_id, post_ids, batch_size, site=None):
+    """Split post ids into lists of at most batch_size ids, each short enough for its URL to fit MAX_URL_LENGTH."""
+    base_url_length = len(create_url(TOPIC_POST_BATCH_JSON_URL, topic_id, site)) + 1
+    batches = []
+    batch = []
+    url_length = base_url_length
 
-def add_posts_to_topic(topic, site=None):
-    """Download data for all posts under a given topic and add them as DiscoursePosts to that topic."""
-    topic_url = create_url(TOPIC_POST_LIST_JSON_URL, topic.get_id(), site)
+    for post_id in post_ids:
+        param_length = len(f"post_ids[]={post_id}&")
 
-    try:
-        with request.urlopen(topic_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
+        if len(batch) > 0 and (len(batch) >= batch_size or url_length + param_length > MAX_URL_LENGTH):
+            batches.append(batch)
+            batch = []
+            url_length = base_url_length
 
-        logging.debug("Getting posts from %s", topic_url)
+        batch.append(post_id)
+        url_length += param_length
 
-        # get initial set of posts from the post_stream > posts section of the JSON
-        for new_post in extract_posts_from_json_post_stream(json_output):
-            topic.add_post(new_post)
+    if len(batch) > 0:
+        batches.append(batch)
 
-        # not all posts always show up in the posts section, so determine which ones are missing
-        posts_to_get = []
-        if "post_stream" in json_output and "stream" in json_output["post_stream"]:
-            for post_id in json_output["post_stream"]["stream"]:
-                post_exists = False
-                for post in topic.get_posts():
-                    if str(post_id) == str(post.get_id()):
-                        post_exists = True
-                        break
-                if not post_exists:
-                    posts_to_get.append(post_id)
-
-        # download missing posts that show up in the stream section batching requests if the chunk size is known
-        chunk_size = int(json_output["chunk_size"]) if "chunk_size" in json_output else 1
-        for i in range(0, len(posts_to_get), chunk_size):
-            if i + chunk_size > len(posts_to_get):
-                new_posts = get_batch_of_posts_by_id(topic.get_id(), posts_to_get[i::], site)
-            else:
-                new_posts = get_batch_of_posts_by_id(topic.get_id(), posts_to_get[i : i + chunk_size], site)
+    return batches
+
+
+def get_posts_in_batches(topic_id, post_ids, site=None):
+    """
+    Download posts in a topic with as few batch requests as the site accepts, made in parallel.
+
+    Returns a dictionary of DiscoursePosts by string id, in the order of post_ids.
+    """
+    return get_client(site).get_posts_in_batches(topic_id, post_ids)
 
-            if new_posts is not None:
-                for new_post in new_posts:
-                    topic.add_post(new_post)
 
-    except HTTPError:
-        logging.debug("Failed to get topic from URL %s", topic_url)
+def add_posts_to_topic(topic, site=None, known_posts=None):
+    """
+    Download data for all posts under a given topic and add them as DiscoursePosts to that topic.
+
+    Posts in known_posts, a dictionary of DiscoursePosts by id, are added in place of downloaded posts that have not
+    been updated since, keeping anything already looked up for them. Returns whether every post in the topic's stream
+    was added.
+    """
+    return get_client(site).add_posts_to_topic(topic, known_posts)
 
 
 def add_topics_to_category(category, ignore_before_date=None, site=None):
     """Download data for all topics under a given category and add them as DiscourseTopics to that category."""
-    category_url = create_url(CATEGORY_TOPIC_LIST_JSON_URL, category.get_id(), site)
-    add_topics_to_category_from_url(category, category_url, ignore_before_date, site)
+    add_topics_to_category_from_url(category, get_first_category_page_url(category, site), ignore_before_date, site)
 
 
-def add_topics_to_category_from_url(category, page_url, ignore_before_date=None, site=None):
-    """Recursively get all topics from pages in a given category, then add them as DiscourseTopics to the category."""
-    try:
-        with request.urlopen(page_url) as url_data:
-            json_output = json.loads(url_data.read().decode())
-
-        logging.debug("Getting topics from %s", page_url)
+def get_first_category_page_url(category, site=None):
+    """Get the URL of the first page of topics in a category, which holds the most recently updated topics."""
+    return create_url(CATEGORY_TOPIC_LIST_JSON_URL, category.get_id(), site)
 
-        if "topic_list" in json_output and "topics" in json_output["topic_list"]:
-            for topic in json_output["topic_list"]["topics"]:
-                new_topic = DiscourseTopic(topic)
 
-                update_time = None if new_topic is None else new_topic.get_latest_update_time()
-                accept_date = ignore_before_date is None or update_time is None or update_time >= ignore_before_date
+def get_topics_from_category_page(page_url, site=None):
+    """
+    Download a single page of topics in a category.
 
-                if new_topic is not None:
-                    if accept_date:
-                        category.add_topic(new_topic)
-                    elif not new_topic.get_pinned():
-                        return
+    Returns a list of DiscourseTopics along with the URL of the next page, or None if it is the last page. The list
+    is empty if the download fails.
+    """
+    return get_client(site).get_topics_from_category_page(page_url)
 
-        if "topic_list" in json_output and "more_topics_url" in json_output["topic_list"]:
-            next_url = get_next_category_page_url(json_output["topic_list"]["more_topics_url"], site)
-            add_topics_to_category_from_url(category, next_url, ignore_before_date, site)
 
-    except HTTPError:
-        logging.debug("Failed to get category from URL %s", page_url)
+def add_topics_to_category_from_url(category, page_url, ignore_before_date=None, site=None):
+    """Get all topics from pages in a given category starting at page_url, then add them to the category."""
+    for new_topic in get_client(site).iter_topics_from_url(page_url, ignore_before_date):
+        category.add_topic(new_topic)
 
 
 def get_site_url(site=None):
@@ -286,35 +252,667 @@ def create_author_name_str(post):
 
 
 def create_editor_name_str(post, site=None):
-    """Create a formatted author string based on either name or username of a post's most recent editor."""
-    author_name = post.get_author_username() if post.get_author_name() in (None, "") else post.get_author_name()
+    """
+    Create a formatted author string based on either name or username of a post's most recent editor.
+
+    The editor of a main post is downloaded unless it has already been added to the post.
+    """
+    return get_client(site).create_editor_name_str(post)
+
+
+def add_editor_name_to_topic(topic, since=None, site=None):
+    """Download the latest editor of a topic's main post if it was edited on or after since, and add it to the post."""
+    get_client(site).add_editor_name_to_topic(topic, since)
+
+
+class DiscourseClient:
+    """
+    Download categories, topics, and posts from a Discourse site.
+
+    The client keeps its own keep-alive connections to the site, the site's category list, category and user names
+    it has looked up, and the largest post batch the site accepts. Topics and posts can be streamed one page or batch
+    at a time with iter_topics and iter_posts.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    def __init__(self, site=None, max_connections=None, requests_per_second=None, stats=None):
+        """
+        Create a client for a site, or the default site if None.
+
+        Requests are limited to max_connections at once, starting at most requests_per_second, if either is set, or
+        otherwise to the site's limits set with dschttp.set_site_limits. Requests are recorded in the given RunStats,
+        or the run statistics if None.
+        """
+        self.site = get_site_url(site)
+        self.stats = stats if stats is not None else dscstats.get_stats()
+        self._limiter = None
+        if max_connections is not None or requests_per_second is not None:
+            self._limiter = dschttp.SiteLimiter(max_connections or dschttp.DEFAULT_MAX_CONNECTIONS, requests_per_second)
+        self._connection_pool = dschttp.ConnectionPool(dschttp.get_site_key(self.site))
+        self._lock = threading.Lock()
+        self._category_list = None
+        self._categories = {}
+        self._user_names = {}
+        self._post_batch_size = DEFAULT_POST_BATCH_SIZE
+        self._post_index = None
+        self._parse_pool = None
+        self._relevant_posts_only = False
+
+    def __enter__(self):
+        """Use the client in a with statement, closing its connections at the end."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the client's connections."""
+        self.close()
+
+    def close(self):
+        """Close the client's idle connections."""
+        self._connection_pool.close()
+
+    def get_limiter(self):
+        """Get the SiteLimiter requests from this client are made within."""
+        return self._limiter if self._limiter is not None else dschttp.get_site_limiter(self.site)
+
+    def get_max_connections(self):
+        """Get the maximum number of concurrent requests to make to the site."""
+        return self.get_limiter().max_connections
+
+    def set_post_index(self, post_index):
+        """Add every post downloaded from now on to a dscindex.PostIndex, or stop if None."""
+        self._post_index = post_index
+
+    def index_posts(self, posts_json):
+        """Add downloaded post JSON objects to the post index, if there is one."""
+        if self._post_index is not None and len(posts_json) > 0:
+            self._post_index.add_posts(posts_json, self.site)
+
+    def set_relevant_posts_only(self, relevant_posts_only):
+        """Set whether topics are filled with only their relevant posts and their ancestors, see add_relevant_posts."""
+        self._relevant_posts_only = relevant_posts_only
+
+    def get_relevant_posts_only(self):
+        """Check whether topics are filled with only their relevant posts and the posts they reply to."""
+        return self._relevant_posts_only
+
+    def set_parse_pool(self, parse_pool):
+        """Decode large post stream downloads in a dscparse.ParsePool from now on, or stop if None."""
+        self._parse_pool = parse_pool
+
+    def get_post_stream(self, url, template):
+        """
+        Download a post stream document at a URL created from a template, raising URLError on failure.
+
+        Returns the posts included in the document as DiscoursePosts, and the ids of every post in its stream. The
+        document is decoded by the parse pool, if there is one and posts are not being indexed, since the index needs
+        every post's JSON.
+        """
+        if self._parse_pool is None or self._post_index is not None:
+            json_output = self.get_json(url, template)
+
+            stream = []
+            if "post_stream" in json_output and "stream" in json_output["post_stream"]:
+                stream = json_output["post_stream"]["stream"]
+
+            self.index_posts(json_output.get("post_stream", {}).get("posts", []))
+
+            with dsctrace.span("create posts", "model") as span_args:
+                posts = extract_posts_from_json_post_stream(json_output)
+                span_args["posts"] = len(posts)
+            return posts, stream
+
+        body = dschttp.get_body_from_url(url, template, self.get_limiter(), self._connection_pool, self.stats)
+
+        with self.stats.timer("parse"), dsctrace.span("decode JSON and create posts", "json", bytes=len(body)):
+            return self._parse_pool.parse_post_stream(body)
+
+    def get_json(self, url, template):
+        """Download and decode the JSON document at a URL created from a template, raising URLError on failure."""
+        return dschttp.get_json_from_url(url, template, self.get_limiter(), self._connection_pool, self.stats)
+
+    def get_post(self, post_id):
+        """
+        Download post data for a given id and return it as a DiscoursePost object.
+
+        Returns None if download fails or id is invalid.
+        """
+        post_url = create_url(POST_JSON_URL, post_id, self.site)
+
+        try:
+            json_output = self.get_json(post_url, POST_JSON_URL)
+
+            logging.debug("Post downloaded from %s", post_url)
+
+            self.index_posts([json_output])
+            return DiscoursePost(json_output)
+        except URLError:
+            logging.debug("Failed to get post from URL %s", post_url)
+            return None
+
+    def get_post_by_number(self, topic_id, post_number):
+        """
+        Download a post by its number within a topic and return it as a DiscoursePost object.
+
+        Returns None if download fails or there is no such post.
+        """
+        post_url = create_url(POST_BY_NUMBER_JSON_URL, f"{topic_id}/{post_number}", self.site)
+
+        try:
+            json_output = self.get_json(post_url, POST_BY_NUMBER_JSON_URL)
+
+            logging.debug("Post downloaded from %s", post_url)
+
+            self.index_posts([json_output])
+            return DiscoursePost(json_output)
+        except URLError:
+            logging.debug("Failed to get post from URL %s", post_url)
+            return None
+
+    def get_posts(self, post_ids):
+        """
+        Download posts for a list of ids concurrently and return them as a dictionary of DiscoursePosts by string id.
+
+        Posts are downloaded one per connection to the site at a time. Once two of the downloaded posts are found to
+        share a topic, the ids left to download are also requested from that topic's batch endpoint, so the rest of
+        the posts in it are found together. Ids in different topics are only downloaded one at a time, since batches
+        for them would find nothing. Ids that could not be downloaded are left out.
+        """
+        from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+        remaining_post_ids = list(dict.fromkeys(str(post_id) for post_id in post_ids))
+        num_workers = self.get_max_connections()
+        topic_post_counts = {}
+        searched_topic_ids = set()
+        posts = {}
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            while len(remaining_post_ids) > 0:
+                next_post_ids = remaining_post_ids[:num_workers]
+                remaining_post_ids = remaining_post_ids[num_workers:]
+                new_topic_ids = []
+
+                for post_id, post in zip(next_post_ids, executor.map(self.get_post, next_post_ids)):
+                    if post is None:
+                        continue
+
+                    posts[post_id] = post
+                    topic_id = post.get_topic_id()
+                    if topic_id is None or topic_id in searched_topic_ids:
+                        continue
+
+                    topic_post_counts[topic_id] = topic_post_counts.get(topic_id, 0) + 1
+                    if topic_post_counts[topic_id] >= 2:
+                        searched_topic_ids.add(topic_id)
+                        new_topic_ids.append(topic_id)
+
+                if len(remaining_post_ids) > 0 and len(new_topic_ids) > 0:
+                    for topic_posts in executor.map(
+                        lambda i: self.get_posts_in_batches(i, remaining_post_ids),
+                        new_topic_ids,
+                    ):
+                        posts.update(topic_posts)
+
+                    remaining_post_ids = [post_id for post_id in remaining_post_ids if post_id not in posts]
+
+        return posts
+
+    def get_batch_of_posts(self, topic_id, post_ids):
+        """
+        Download post data for a list of given post ids in a topic and return it as a list of DiscoursePost objects.
+
+        Invalid post ids are ignored
+        Returns None if download fails, or an emtpy list if there are no valid ids
+        """
+        try:
+            return self.download_batch_of_posts(topic_id, post_ids)
+        except URLError:
+            return None
+
+    def download_batch_of_posts(self, topic_id, post_ids):
+        """
+        Download post data for a list of given post ids in a topic and return it as a list of DiscoursePost objects.
+
+        Invalid post ids are ignored. Raises URLError if the download fails.
+        """
+        if post_ids is None or len(post_ids) == 0:
+            return []
+
+        posts_url = create_post_batch_url(topic_id, post_ids, self.site)
+
+        try:
+            posts, _ = self.get_post_stream(posts_url, TOPIC_POST_BATCH_JSON_URL)
+        except URLError:
+            logging.debug("Failed to get post stream from URL %s", posts_url)
+            raise
 
-    if post.is_main_post_for_topic():
-        revision_url = create_url(POST_LATEST_EDIT_JSON_URL, post.get_id(), site)
-        user_url = ""
+        logging.debug("Post stream downloaded from %s", posts_url)
+        return posts
+
+    def get_post_batch_size(self):
+        """Get the largest number of posts the site has accepted in a single batch request."""
+        with self._lock:
+            return self._post_batch_size
+
+    def reduce_post_batch_size(self, batch_size):
+        """Lower the number of posts requested in a single batch after the site refused a larger batch."""
+        with self._lock:
+            self._post_batch_size = max(1, min(batch_size, self._post_batch_size))
+
+    def get_posts_in_batches(self, topic_id, post_ids):
+        """
+        Download posts in a topic with as few batch requests as the site accepts, made in parallel.
+
+        Returns a dictionary of DiscoursePosts by string id, in the order of post_ids. When the site refuses a batch
+        as too large, the batch size is halved and the batch's posts are requested again in smaller batches. Posts in
+        batches that fail for any other reason are left out.
+        """
+        from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+        def get_batch(batch):
+            try:
+                return self.download_batch_of_posts(topic_id, batch), None
+            except URLError as error:
+                return None, error
+
+        downloaded_posts = {}
+        remaining_post_ids = list(post_ids)
+
+        with ThreadPoolExecutor(max_workers=self.get_max_connections()) as executor:
+            while len(remaining_post_ids) > 0:
+                batches = split_post_ids_into_batches(
+                    topic_id, remaining_post_ids, self.get_post_batch_size(), self.site
+                )
+                remaining_post_ids = []
+
+                for batch, (new_posts, error) in zip(batches, executor.map(get_batch, batches)):
+                    if new_posts is not None:
+                        for new_post in new_posts:
+                            downloaded_posts[str(new_post.get_id())] = new_post
+                    elif len(batch) > 1 and is_batch_too_large_error(error):
+                        self.reduce_post_batch_size(len(batch) // 2)
+                        remaining_post_ids.extend(batch)
+
+        return {
+            str(post_id): downloaded_posts[str(post_id)] for post_id in post_ids if str(post_id) in downloaded_posts
+        }
+
+    def get_category(self, category_id):
+        """
+        Download category data for a given id and return it as a DiscourseCategory object.
+
+        Categories are downloaded once, then created again from the saved data. Returns None if download fails or id
+        is invalid.
+        """
+        with self._lock:
+            category_json = self._categories.get(category_id)
+
+        if category_json is None:
+            category_url = create_url(CATEGORY_JSON_URL, category_id, self.site)
+
+            try:
+                json_output = self.get_json(category_url, CATEGORY_JSON_URL)
+
+                logging.debug("Category downloaded from URL %s", category_url)
+
+                if "category" not in json_output:
+                    return None
+
+                category_json = json_output["category"]
+                with self._lock:
+                    self._categories[category_id] = category_json
+            except URLError:
+                logging.debug("Failed to get category from URL %s", category_url)
+                return None
+
+        return DiscourseCategory(category_json)
+
+    def get_category_list(self):
+        """Get the JSON list of the site's top level categories and their subcategories, downloading it only once."""
+        with self._lock:
+            if self._category_list is not None:
+                return self._category_list
+
+        categories_url = create_url(CATEGORY_LIST_JSON_URL, "", self.site)
 
         try:
-            with request.urlopen(revision_url) as url_data:
-                json_output = json.loads(url_data.read().decode())
+            json_output = self.get_json(categories_url, CATEGORY_LIST_JSON_URL)
+
+            logging.debug("Getting category list from URL %s", categories_url)
+
+            category_list = []
+            if "category_list" in json_output and "categories" in json_output["category_list"]:
+                category_list = json_output["category_list"]["categories"]
+
+            with self._lock:
+                self._category_list = category_list
+            return category_list
 
-            logging.debug("Extracting editor username from latest edit at %s", revision_url)
+        except URLError:
+            logging.debug("Failed to get category list from URL %s", categories_url)
+            return []
 
-            if "username" in json_output:
-                author_name = json_output["username"]
+    def get_category_by_name(self, category_name):
+        """
+        Get category data for a given category or category/subcategory/... name or slug (case-insensitive).
 
-                user_url = create_url(USER_JSON_URL, json_output["username"], site)
-            with request.urlopen(user_url) as user_url_data:
-                user_json_output = json.loads(user_url_data.read().decode())
+        Returns result as a DiscourseCategory object or None if download fails or name is invalid.
+        """
+        category_nav = category_name.split("/")
+        final_category = None
 
-            logging.debug("Extracting user info from %s", user_url)
+        for category in self.get_category_list():
+            if (
+                category["name"].lower() == category_nav[0].lower()
+                or category["slug"].lower() == category_nav[0].lower()
+            ):
+                final_category = DiscourseCategory(category)
 
-            if "user" in user_json_output and "name" in user_json_output["user"]:
-                author_name = user_json_output["user"]["name"]
+                # Some discourse sites fail to provide a subcategory list, check subcategory ids in this case
+                if "subcategory_list" not in category and "subcategory_ids" in category:
+                    self.add_subcategories_to_category(final_category, category["subcategory_ids"])
 
-        except HTTPError:
-            if user_url != "":
-                logging.debug("Failed to get user from URL %s", user_url)
+        for i in range(1, len(category_nav)):
+            if final_category:
+                final_category = final_category.get_subcategory_by_name(category_nav[i])
             else:
-                logging.debug("Failed to get latest edit from URL %s", revision_url)
+                break
+
+        return final_category
+
+    def add_subcategories_to_category(self, category, subcategory_ids):
+        """Add subcategories with ids contained in an array to a parent category."""
+        for subcategory_id in subcategory_ids:
+            new_subcategory = self.get_category(subcategory_id)
+            if new_subcategory:
+                category.add_subcategory(new_subcategory)
+
+    def get_topics_from_category_page(self, page_url):
+        """
+        Download a single page of topics in a category.
+
+        Returns a list of DiscourseTopics along with the URL of the next page, or None if it is the last page. The
+        list is empty if the download fails.
+        """
+        topics = []
+        next_url = None
+
+        try:
+            json_output = self.get_json(page_url, CATEGORY_TOPIC_LIST_JSON_URL)
+
+            logging.debug("Getting topics from %s", page_url)
+
+            if "topic_list" in json_output and "topics" in json_output["topic_list"]:
+                with dsctrace.span("create topics", "model", topics=len(json_output["topic_list"]["topics"])):
+                    for topic in json_output["topic_list"]["topics"]:
+                        topics.append(DiscourseTopic(topic))
+
+            if "topic_list" in json_output and "more_topics_url" in json_output["topic_list"]:
+                next_url = get_next_category_page_url(json_output["topic_list"]["more_topics_url"], self.site)
+
+        except URLError:
+            logging.debug("Failed to get category from URL %s", page_url)
+
+        return topics, next_url
+
+    def iter_topics_from_url(self, page_url, since=None):
+        """
+        Yield topics from pages of a category starting at page_url, downloading each page once the previous one is used.
+
+        Only topics updated at or after since are yielded, and pages stop being downloaded at the first older topic
+        that is not pinned, since topics are listed by most recent update.
+        """
+        while page_url is not None:
+            topics, page_url = self.get_topics_from_category_page(page_url)
+
+            for topic in topics:
+                update_time = topic.get_latest_update_time()
+
+                if since is None or update_time is None or update_time >= since:
+                    yield topic
+                elif not topic.get_pinned():
+                    return
+
+    def iter_topics(self, category, since=None):
+        """Yield the topics of a category, most recently updated first, updated at or after since if given."""
+        return self.iter_topics_from_url(create_url(CATEGORY_TOPIC_LIST_JSON_URL, category.get_id(), self.site), since)
+
+    def get_topic_post_stream(self, topic):
+        """
+        Download the post stream of a topic.
+
+        Returns the posts included with the topic, and the ids of every post in the topic in order. Both are empty if
+        the download fails.
+        """
+        try:
+            return self.download_topic_post_stream(topic)
+        except URLError:
+            return [], []
+
+    def download_topic_post_stream(self, topic):
+        """
+        Download the post stream of a topic, raising URLError on failure.
+
+        Returns the posts included with the topic, and the ids of every post in the topic in order.
+        """
+        topic_url = create_url(TOPIC_POST_LIST_JSON_URL, topic.get_id(), self.site)
+
+        try:
+            posts, stream = self.get_post_stream(topic_url, TOPIC_POST_LIST_JSON_URL)
+        except URLError:
+            logging.debug("Failed to get topic from URL %s", topic_url)
+            raise
+
+        logging.debug("Getting posts from %s", topic_url)
+        return posts, stream
+
+    def iter_posts(self, topic, since=None):
+        """
+        Yield the posts of a topic in order, downloading one batch of posts at a time as they are used.
+
+        Only posts created or updated at or after since are yielded, if given.
+        """
+        for _, post in self.iter_stream_posts(topic):
+            if post is not None and (since is None or is_post_changed_since(post, since)):
+                yield post
+
+    def iter_stream_posts(self, topic, post_stream=None):
+        """
+        Yield the id and DiscoursePost of every post in a topic's stream in order, downloading a batch at a time.
+
+        The post stream is downloaded first unless given as returned by get_topic_post_stream. The post is None for
+        ids whose batch could not be downloaded.
+        """
+        included_posts, stream = post_stream if post_stream is not None else self.get_topic_post_stream(topic)
+        posts = {str(post.get_id()): post for post in included_posts}
+        missing_post_ids = [post_id for post_id in stream if str(post_id) not in posts]
+        batches = iter(
+            split_post_ids_into_batches(topic.get_id(), missing_post_ids, self.get_post_batch_size(), self.site)
+        )
+        requested_post_ids = set()
+
+        for post_id in stream if len(stream) > 0 else list(posts):
+            # download the batch holding the next missing post, then keep only its posts until they are yielded
+            if str(post_id) not in posts and str(post_id) not in requested_post_ids:
+                batch = next(batches, [])
+                requested_post_ids = {str(batch_post_id) for batch_post_id in batch}
+                posts.update(self.get_posts_in_batches(topic.get_id(), batch))
+
+            yield post_id, posts.pop(str(post_id), None)
+
+    def add_posts_to_topic(self, topic, known_posts=None):
+        """
+        Download data for all posts under a given topic and add them as DiscoursePosts to that topic.
+
+        Posts in known_posts, a dictionary of DiscoursePosts by id, are added in place of downloaded posts that have
+        not been updated since, keeping anything already looked up for them. Every post is still downloaded, since the
+        stream does not show which posts were edited. Returns whether the topic's post stream was downloaded and every
+        post in it was added.
+        """
+        try:
+            included_posts, stream = self.download_topic_post_stream(topic)
+        except URLError:
+            return False
+
+        # get initial set of posts from the post_stream > posts section of the JSON
+        for new_post in included_posts:
+            topic.add_post(get_unchanged_known_post(new_post, known_posts))
+
+        # not all posts always show up in the posts section, so determine which ones are missing
+        included_post_ids = {str(post.get_id()) for post in included_posts}
+        remaining_post_ids = [post_id for post_id in stream if str(post_id) not in included_post_ids]
+
+        # download missing posts that show up in the stream section in parallel batches
+        downloaded_posts = self.get_posts_in_batches(topic.get_id(), remaining_post_ids)
+
+        # add the remaining posts in stream order
+        for post_id in remaining_post_ids:
+            if str(post_id) in downloaded_posts:
+                topic.add_post(get_unchanged_known_post(downloaded_posts[str(post_id)], known_posts))
+
+        return len(downloaded_posts) == len(remaining_post_ids)
+
+    def add_relevant_posts(self, topic, since):
+        """
+        Download the posts of a topic created or updated at or after since, and add them to the topic.
+
+        The main post, and every post the added posts reply to through their chains of replies, are added too, which
+        is all that is needed to show the topic's relevant comments. Posts are streamed a batch at a time and every
+        other post is dropped as it arrives, so memory grows with the relevant posts rather than the size of the
+        topic. Replied to posts that were already dropped are downloaded again by post number, in parallel.
+
+        Returns whether the topic's post stream, every post in it, and every replied to post could be downloaded.
+        """
+        from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+        try:
+            post_stream = self.download_topic_post_stream(topic)
+        except URLError:
+            return False
+
+        complete = True
+        posts_by_number = {}
+        for _, post in self.iter_stream_posts(topic, post_stream):
+            if post is None:
+                complete = False
+            elif post.is_main_post_for_topic() or is_post_changed_since(post, since):
+                posts_by_number[post.get_post_number()] = post
+
+        new_posts = list(posts_by_number.values())
+        with ThreadPoolExecutor(max_workers=self.get_max_connections()) as executor:
+            while len(new_posts) > 0:
+                missing_numbers = list(
+                    dict.fromkeys(
+                        post.get_reply_to_number()
+                        for post in new_posts
+                        if post.get_reply_to_number() is not None and post.get_reply_to_number() not in posts_by_number
+                    )
+                )
+                new_posts = []
+
+                for post_number, post in zip(
+                    missing_numbers,
+                    executor.map(lambda number: self.get_post_by_number(topic.get_id(), number), missing_numbers),
+                ):
+                    # posts that cannot be downloaded are remembered so they are not requested again
+                    posts_by_number[post_number] = post
+                    if post is not None:
+                        new_posts.append(post)
+                    else:
+                        complete = False
+
+        for post in sorted(
+            (post for post in posts_by_number.values() if post is not None),
+            key=lambda post: post.get_post_number() or 0,
+        ):
+            topic.add_post(post)
+
+        return complete
+
+    def get_user_name(self, username):
+        """Get the full name of a user, or None if they have none, downloading it only once."""
+        with self._lock:
+            if username in self._user_names:
+                return self._user_names[username]
+
+        user_url = create_url(USER_JSON_URL, username, self.site)
+        user_json_output = self.get_json(user_url, USER_JSON_URL)
+
+        logging.debug("Extracting user info from %s", user_url)
+
+        user_name = None
+        if "user" in user_json_output and "name" in user_json_output["user"]:
+            user_name = user_json_output["user"]["name"]
+
+        with self._lock:
+            self._user_names[username] = user_name
+        return user_name
+
+    def create_editor_name_str(self, post):
+        """
+        Create a formatted author string based on either name or username of a post's most recent editor.
+
+        The editor of a main post is downloaded unless it has already been added to the post.
+        """
+        author_name = post.get_author_username() if post.get_author_name() in (None, "") else post.get_author_name()
+
+        if post.get_editor_name() is not None:
+            return post.get_editor_name()
+
+        if post.is_main_post_for_topic():
+            revision_url = create_url(POST_LATEST_EDIT_JSON_URL, post.get_id(), self.site)
+            username = None
+
+            try:
+                json_output = self.get_json(revision_url, POST_LATEST_EDIT_JSON_URL)
+
+                logging.debug("Extracting editor username from latest edit at %s", revision_url)
+
+                if "username" in json_output:
+                    username = json_output["username"]
+                    author_name = username
+
+                    user_name = self.get_user_name(username)
+                    if user_name is not None:
+                        author_name = user_name
+
+            except URLError:
+                if username is not None:
+                    logging.debug("Failed to get user %s", username)
+                else:
+                    logging.debug("Failed to get latest edit from URL %s", revision_url)
+
+        return author_name
+
+    def add_editor_name_to_topic(self, topic, since=None):
+        """Download the latest editor of a topic's main post if it was edited on or after since, and add it to it."""
+        for post in topic.get_posts():
+            if not post.is_main_post_for_topic() or post.get_editor_name() is not None:
+                continue
+
+            update_time = post.get_update_time()
+            if (
+                update_time is not None
+                and update_time != post.get_creation_time()
+                and (since is None or update_time >= since)
+            ):
+                post.set_editor_name(self.create_editor_name_str(post))
+
+
+def is_batch_too_large_error(error):
+    """Check if a failed batch request was refused for asking for too many posts at once."""
+    return isinstance(error, HTTPError) and error.code in BATCH_TOO_LARGE_STATUSES
+
+
+def get_unchanged_known_post(post, known_posts=None):
+    """Get the post in known_posts with the id of a downloaded post if it was not updated since, or else the post."""
+    known_post = known_posts.get(post.get_id()) if known_posts else None
+    if known_post is not None and known_post.get_update_time() == post.get_update_time():
+        return known_post
+    return post
+
 
-    return author_name
+def is_post_changed_since(post, since):
+    """Check if a post was created or updated at or after a given time."""
+    return any(
+        post_time is not None and post_time >= since for post_time in (post.get_creation_time(), post.get_update_time())
+    )
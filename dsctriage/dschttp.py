@@ -0,0 +1,616 @@
+"""HTTP fetch layer shared by all Discourse API requests."""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from . import dscstats, dsctrace
+
+DEFAULT_MAX_CONNECTIONS = 4
+
+MAX_REDIRECTS = 10
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+REQUEST_HEADERS = {"Accept": "application/json", "User-Agent": "dsctriage"}
+
+DEFAULT_TIMEOUT = 30
+
+DEFAULT_RETRIES = 2
+
+# Error responses worth retrying, as the site is busy or briefly unavailable rather than refusing the request
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+RETRY_DELAY = 0.5
+
+MAX_RETRY_DELAY = 30
+
+DEFAULT_HEDGE_PERCENTILE = 95
+
+# Largest fraction of extra requests hedging may add to the requests made to a site
+DEFAULT_HEDGE_MAX_EXTRA = 0.1
+
+# Number of recent response times per endpoint that hedging delays are learned from, and the fewest needed to hedge
+HEDGE_SAMPLES = 100
+
+MIN_HEDGE_SAMPLES = 10
+
+
+class DeadlineExceeded(URLError):
+    """Raised instead of making a request once the run deadline has passed."""
+
+
+class RunDeadline:
+    """A time limit for every request of the run, if one has been set."""
+
+    def __init__(self):
+        """Create a deadline that has not been set."""
+        self._end_time = None
+
+    def set(self, seconds):
+        """Set the deadline to a number of seconds from now, or remove it if None."""
+        self._end_time = None if seconds is None else time.monotonic() + seconds
+
+    def get_time_remaining(self):
+        """Get the number of seconds left until the deadline, or None if there is no deadline."""
+        if self._end_time is None:
+            return None
+        return max(0.0, self._end_time - time.monotonic())
+
+    def is_expired(self):
+        """Check if the deadline has passed."""
+        return self.get_time_remaining() == 0
+
+    def get_request_timeout(self, timeout):
+        """Get the timeout of a request starting now, within the deadline. Raises DeadlineExceeded once passed."""
+        time_remaining = self.get_time_remaining()
+        if time_remaining is None:
+            return timeout
+        if time_remaining == 0:
+            raise DeadlineExceeded("run time limit reached")
+        return time_remaining if timeout is None else min(timeout, time_remaining)
+
+
+_run_deadline = RunDeadline()
+
+
+def get_deadline():
+    """Get the deadline for the current run."""
+    return _run_deadline
+
+
+class SiteLimiter:
+    """Limit the number of concurrent connections to, and optionally the request rate of, a single site."""
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(
+        self,
+        max_connections=DEFAULT_MAX_CONNECTIONS,
+        requests_per_second=None,
+        timeout=DEFAULT_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+    ):
+        """
+        Allow up to max_connections requests at once, starting at most requests_per_second, if set.
+
+        Each request may take up to timeout seconds, and is retried up to retries times if it fails transiently.
+        """
+        self.max_connections = max_connections
+        self.requests_per_second = requests_per_second
+        self.timeout = timeout
+        self.retries = retries
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._interval = 1 / requests_per_second if requests_per_second else 0
+        self._lock = threading.Lock()
+        self._next_request_time = 0.0
+
+    def wait_for_rate_budget(self):
+        """Wait until the rate budget allows another request to start."""
+        if self._interval <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_request_time - now
+            self._next_request_time = max(now, self._next_request_time) + self._interval
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    @contextmanager
+    def limit(self):
+        """Hold one of the site's connections, within its rate budget, for the enclosed request."""
+        with self._connections:
+            self.wait_for_rate_budget()
+            yield
+
+    def try_acquire(self):
+        """
+        Take one of the site's connections without waiting, if one is free and the rate budget allows a request now.
+
+        Returns whether a connection was taken, which must then be given back with release.
+        """
+        if not self._connections.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            if self._interval > 0 and self._next_request_time > now:
+                self._connections.release()
+                return False
+            self._next_request_time = max(now, self._next_request_time) + self._interval
+
+        return True
+
+    def release(self):
+        """Give back a connection taken with try_acquire."""
+        self._connections.release()
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to a single site, reused by one request after another."""
+
+    def __init__(self, site_key):
+        """Create an empty pool for a site given as scheme://host[:port]."""
+        split_site = urlsplit(site_key)
+        self.site_key = site_key
+        self._https = split_site.scheme == "https"
+        self._netloc = split_site.netloc
+        self._idle_connections = []
+        self._lock = threading.Lock()
+
+    def get_connection(self):
+        """
+        Take an idle connection from the pool, or open a new one if there are none.
+
+        Returns the connection and whether it was reused, since a reused connection may have been closed by the server
+        while it was idle.
+        """
+        with self._lock:
+            if len(self._idle_connections) > 0:
+                return self._idle_connections.pop(), True
+
+        import http.client  # pylint: disable=import-outside-toplevel
+
+        if self._https:
+            return http.client.HTTPSConnection(self._netloc), False
+        return http.client.HTTPConnection(self._netloc), False
+
+    def put_connection(self, connection):
+        """Return a connection to the pool once its response has been fully read."""
+        with self._lock:
+            self._idle_connections.append(connection)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            for connection in self._idle_connections:
+                connection.close()
+            self._idle_connections.clear()
+
+
+_site_limiters = {}
+
+_site_limiters_lock = threading.Lock()
+
+
+def get_site_key(url):
+    """Get the scheme and host of a URL, which identify the site it belongs to."""
+    split_url = urlsplit(url)
+    return f"{split_url.scheme}://{split_url.netloc}"
+
+
+# pylint: disable=too-many-arguments
+def set_site_limits(
+    site,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    requests_per_second=None,
+    timeout=DEFAULT_TIMEOUT,
+    retries=DEFAULT_RETRIES,
+):
+    """Set the maximum number of concurrent connections, optional request rate, timeout, and retries for a site."""
+    with _site_limiters_lock:
+        _site_limiters[get_site_key(site)] = SiteLimiter(max_connections, requests_per_second, timeout, retries)
+
+
+def get_site_limiter(url):
+    """Get the SiteLimiter for the site a URL belongs to, creating one with default limits if needed."""
+    site_key = get_site_key(url)
+
+    with _site_limiters_lock:
+        if site_key not in _site_limiters:
+            _site_limiters[site_key] = SiteLimiter()
+        return _site_limiters[site_key]
+
+
+class HedgePolicy:
+    """
+    Decide when to send a duplicate of a slow request to a site, so the first response can be used.
+
+    The delay before hedging a request is a percentile of the recent response times of its endpoint, and hedges are
+    limited to a fraction of the requests made to the site.
+    """
+
+    def __init__(self, percentile=DEFAULT_HEDGE_PERCENTILE, max_extra=DEFAULT_HEDGE_MAX_EXTRA):
+        """Hedge requests slower than the given percentile of their endpoint, adding at most max_extra requests each."""
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._num_requests = 0
+        self._num_hedges = 0
+
+    def record_latency(self, template, latency):
+        """Learn from the response time of a successful request to an endpoint template."""
+        with self._lock:
+            if template not in self._latencies:
+                self._latencies[template] = deque(maxlen=HEDGE_SAMPLES)
+            self._latencies[template].append(latency)
+
+    def get_hedge_delay(self, template):
+        """Get the number of seconds to wait for a request before hedging it, or None until enough are recorded."""
+        with self._lock:
+            self._num_requests += 1
+            latencies = sorted(self._latencies.get(template, ()))
+
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+
+    def start_hedge(self):
+        """Check if another hedge is within the extra load limit, counting it if so."""
+        with self._lock:
+            if self._num_hedges + 1 > self._num_requests * self.max_extra:
+                return False
+            self._num_hedges += 1
+            return True
+
+
+class RequestHandle:
+    """A request that can be cancelled from another thread by shutting down its connection."""
+
+    def __init__(self):
+        """Create a handle for a request that has not connected yet."""
+        self.cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def set_connection(self, connection):
+        """Set the connection the request is using, or None once done with it. Returns whether it was cancelled."""
+        with self._lock:
+            self._connection = connection
+            if self.cancelled and connection is not None and connection.sock is not None:
+                shutdown_connection(connection)
+            return self.cancelled
+
+    def cancel(self):
+        """Cancel the request, interrupting any response it is waiting for."""
+        with self._lock:
+            self.cancelled = True
+            if self._connection is not None and self._connection.sock is not None:
+                shutdown_connection(self._connection)
+
+
+def shutdown_connection(connection):
+    """Shut down a connection's socket, waking a thread blocked reading from it, which then closes it."""
+    import socket  # pylint: disable=import-outside-toplevel
+
+    try:
+        connection.sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+_hedge_policies = {}
+
+_hedge_policies_lock = threading.Lock()
+
+
+def set_site_hedging(site, percentile=DEFAULT_HEDGE_PERCENTILE, max_extra=DEFAULT_HEDGE_MAX_EXTRA):
+    """Hedge requests to a site slower than a percentile of their endpoint, or stop hedging if percentile is None."""
+    with _hedge_policies_lock:
+        if percentile is None:
+            _hedge_policies.pop(get_site_key(site), None)
+        else:
+            _hedge_policies[get_site_key(site)] = HedgePolicy(percentile, max_extra)
+
+
+def get_hedge_policy(url):
+    """Get the HedgePolicy of the site a URL belongs to, or None if requests to it are not hedged."""
+    with _hedge_policies_lock:
+        return _hedge_policies.get(get_site_key(url))
+
+
+_connection_pools = {}
+
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(url):
+    """Get the ConnectionPool for the site a URL belongs to, creating it if needed."""
+    site_key = get_site_key(url)
+
+    with _connection_pools_lock:
+        if site_key not in _connection_pools:
+            _connection_pools[site_key] = ConnectionPool(site_key)
+        return _connection_pools[site_key]
+
+
+def close_connections():
+    """Close the idle connections of every site."""
+    with _connection_pools_lock:
+        for connection_pool in _connection_pools.values():
+            connection_pool.close()
+
+
+def uses_proxy(url):
+    """Check if requests to a URL should go through a proxy set in the environment."""
+    from urllib import request  # pylint: disable=import-outside-toplevel
+
+    split_url = urlsplit(url)
+    return split_url.scheme in request.getproxies() and not request.proxy_bypass(split_url.hostname or "")
+
+
+def get_pooled_response(url, connection_pool=None, timeout=None, request_handle=None):
+    """
+    Send a GET request for a URL over a pooled connection to its site, from the given pool if it is for that site.
+
+    Returns the response and its body. Connecting and each read may take up to timeout seconds, if set. A reused
+    connection closed by the server is replaced once, and any other connection failure, including a timeout, is
+    raised as a URLError like urlopen does. The request can be cancelled through a RequestHandle, if given.
+    """
+    import http.client  # pylint: disable=import-outside-toplevel
+
+    split_url = urlsplit(url)
+    path = urlunsplit(("", "", split_url.path or "/", split_url.query, ""))
+    if connection_pool is None or connection_pool.site_key != get_site_key(url):
+        connection_pool = get_connection_pool(url)
+
+    while True:
+        connection, reused = connection_pool.get_connection()
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+        try:
+            if connection.sock is None:
+                connection.connect()
+            if request_handle is not None and request_handle.set_connection(connection):
+                raise URLError("request cancelled")
+            connection.request("GET", path, headers=REQUEST_HEADERS)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as error:
+            connection.close()
+            if reused and (request_handle is None or not request_handle.cancelled):
+                continue
+            raise URLError(error) from error
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            if isinstance(error, URLError):
+                raise
+            raise URLError(error) from error
+
+        if request_handle is not None and request_handle.set_connection(None):
+            connection.close()
+        elif response.will_close:
+            connection.close()
+        else:
+            connection_pool.put_connection(connection)
+
+        return response, body
+
+
+def read_url(url, connection_pool=None, timeout=None, request_handle=None):
+    """
+    Download the body of a URL, reusing keep-alive connections to its site and following redirects.
+
+    Connections are taken from connection_pool if given, or otherwise the shared pool of the URL's site.
+    Requests through a proxy set in the environment are left to urlopen. Raises HTTPError for error responses and
+    URLError if the site cannot be reached or does not respond within timeout seconds, if set, or the request is
+    cancelled through its RequestHandle, if given.
+    """
+    if uses_proxy(url):
+        from urllib import request  # pylint: disable=import-outside-toplevel
+
+        try:
+            with request.urlopen(url, timeout=timeout) as url_data:
+                return url_data.read()
+        except URLError:
+            raise
+        except OSError as error:
+            raise URLError(error) from error
+
+    for _ in range(MAX_REDIRECTS + 1):
+        response, body = get_pooled_response(url, connection_pool, timeout, request_handle)
+
+        if response.status in REDIRECT_STATUSES and response.getheader("Location"):
+            url = urljoin(url, response.getheader("Location"))
+            continue
+
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+
+        return body
+
+    raise HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def read_url_hedged(url, template, hedge_policy, connection_pool=None, timeout=None, stats=None, limiter=None):
+    """
+    Download the body of a URL like read_url, sending a duplicate request if the first is slow for its endpoint.
+
+    Once the first request has taken longer than the hedge policy's delay, and the policy's extra load limit allows, a
+    hedge is sent if one of the site's connections is free in the given SiteLimiter, or the site's limiter if None.
+    The first successful response is used and the other request is cancelled. The hedge policy learns the first
+    request's own response time, or if the hedge wins, how long the first request had taken when it was cancelled.
+    Hedges sent and won are recorded in the given RunStats, or the run statistics if None.
+    """
+    import queue  # pylint: disable=import-outside-toplevel
+
+    stats = stats if stats is not None else dscstats.get_stats()
+    limiter = limiter if limiter is not None else get_site_limiter(url)
+    start_time = time.perf_counter()
+    hedge_delay = hedge_policy.get_hedge_delay(template)
+    if hedge_delay is None:
+        body = read_url(url, connection_pool, timeout)
+        hedge_policy.record_latency(template, time.perf_counter() - start_time)
+        return body
+
+    results = queue.Queue()
+
+    def send_request(request_handle, is_hedge):
+        try:
+            results.put((request_handle, is_hedge, read_url(url, connection_pool, timeout, request_handle), None))
+        except URLError as error:
+            results.put((request_handle, is_hedge, None, error))
+        finally:
+            if is_hedge:
+                limiter.release()
+
+    request_handles = [RequestHandle()]
+    threading.Thread(target=send_request, args=(request_handles[0], False), daemon=True).start()
+
+    try:
+        result = results.get(timeout=hedge_delay)
+    except queue.Empty:
+        result = None
+        # the hedge needs a connection of its own, so it is skipped rather than waiting for one
+        if limiter.try_acquire():
+            if hedge_policy.start_hedge():
+                logging.debug("Hedging %s after %.3f seconds", url, hedge_delay)
+                request_handles.append(RequestHandle())
+                threading.Thread(target=send_request, args=(request_handles[1], True), daemon=True).start()
+                stats.record_hedge(template)
+            else:
+                limiter.release()
+
+    num_pending = len(request_handles)
+    first_error = None
+
+    while num_pending > 0:
+        request_handle, is_hedge, body, error = result if result is not None else results.get()
+        result = None
+        num_pending -= 1
+
+        if error is None:
+            # the first request's time so far is a lower bound on its own time if the hedge won, which keeps the
+            # hedge delay from being learned from hedged times
+            hedge_policy.record_latency(template, time.perf_counter() - start_time)
+
+            for other_request_handle in request_handles:
+                if other_request_handle is not request_handle:
+                    other_request_handle.cancel()
+
+            if is_hedge:
+                stats.record_hedge(template, won=True)
+            return body
+
+        if not is_hedge or first_error is None:
+            first_error = error
+
+    raise first_error
+
+
+def is_transient_error(error):
+    """Check if a failed request may succeed if retried, as the site was busy, unavailable, or unreachable."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, HTTPError):
+        return error.code in RETRY_STATUSES
+    return True
+
+
+def get_retry_delay(attempt, error=None):
+    """
+    Get the number of seconds to wait before retrying a request that failed attempt times before.
+
+    The delay doubles with each attempt and is randomly jittered so concurrent requests do not retry all at once. A
+    Retry-After time sent with an error response is used instead if it is longer.
+    """
+    import random  # pylint: disable=import-outside-toplevel
+
+    delay = RETRY_DELAY * 2**attempt * random.uniform(0.5, 1.5)
+
+    if isinstance(error, HTTPError) and error.headers is not None:
+        retry_after = error.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+
+    return min(delay, MAX_RETRY_DELAY)
+
+
+def get_body_from_url(url, template, limiter=None, connection_pool=None, stats=None):
+    """
+    Download the body of the document at a URL created from the given template, without decoding it.
+
+    Requests are made within the limits of the URL's site, over its pooled connections, unless a SiteLimiter or
+    ConnectionPool is given. Slow requests are hedged if the site has a HedgePolicy, see read_url_hedged.
+    Each attempt may take up to the limiter's timeout, and transient failures are retried
+    after a jittered delay up to the limiter's number of retries, while the run deadline allows. Request count, size,
+    latency, and errors are recorded in the run statistics, or the given RunStats, under the template. Raises
+    HTTPError or URLError if the download fails, or DeadlineExceeded once the run deadline has passed.
+    """
+    stats = stats if stats is not None else dscstats.get_stats()
+    limiter = limiter if limiter is not None else get_site_limiter(url)
+    hedge_policy = get_hedge_policy(url)
+    request_error = None
+    attempt = 0
+
+    while True:
+        with limiter.limit(), dsctrace.span(
+            dscstats.get_endpoint_name(template), "http", url=url, attempt=attempt
+        ) as span_args:
+            timeout = get_deadline().get_request_timeout(limiter.timeout)
+            start_time = time.perf_counter()
+
+            try:
+                if hedge_policy is None:
+                    body = read_url(url, connection_pool, timeout)
+                else:
+                    body = read_url_hedged(url, template, hedge_policy, connection_pool, timeout, stats, limiter)
+
+                stats.record_request(template, time.perf_counter() - start_time, len(body))
+                span_args.update(status=200, bytes=len(body))
+                break
+            except URLError as error:
+                stats.record_request(template, time.perf_counter() - start_time, error=True)
+                span_args.update(status=error.code if isinstance(error, HTTPError) else str(error.reason))
+                request_error = error
+
+        retry_delay = get_retry_delay(attempt, request_error)
+        time_remaining = get_deadline().get_time_remaining()
+
+        if (
+            attempt >= limiter.retries
+            or not is_transient_error(request_error)
+            or (time_remaining is not None and retry_delay >= time_remaining)
+        ):
+            raise request_error
+
+        logging.debug("Retrying %s in %.1f seconds after %s", url, retry_delay, request_error)
+        time.sleep(retry_delay)
+        attempt += 1
+
+    return body
+
+
+def get_json_from_url(url, template, limiter=None, connection_pool=None, stats=None):
+    """
+    Download and decode the JSON document at a URL created from the given template, see get_body_from_url.
+
+    Decoding time is recorded as parse time. The body is decoded straight from bytes by the fastest installed JSON
+    backend, see dscjson.
+    """
+    # orjson imports several modules itself, so the backend is chosen on the first download rather than at startup
+    from . import dscjson  # pylint: disable=import-outside-toplevel
+
+    stats = stats if stats is not None else dscstats.get_stats()
+    body = get_body_from_url(url, template, limiter, connection_pool, stats)
+
+    with stats.timer("parse"), dsctrace.span("decode JSON", "json", bytes=len(body)):
+        return dscjson.loads(body)
@@ -0,0 +1,141 @@
+"""Local SQLite full-text index of downloaded post bodies for offline search."""
+
+import html
+import json
+import re
+import sqlite3
+import threading
+from .discourse_post import DiscoursePost
+
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    site TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    topic_id INTEGER,
+    created_at TEXT,
+    updated_at TEXT,
+    post_json TEXT NOT NULL,
+    PRIMARY KEY (site, id)
+);
+CREATE INDEX IF NOT EXISTS posts_created_at ON posts (created_at);
+CREATE INDEX IF NOT EXISTS posts_updated_at ON posts (updated_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS post_text USING fts5(text);
+"""
+
+
+def get_post_text(post_json):
+    """Get the searchable text of a post from its raw markdown, or its cooked HTML without tags if there is no raw."""
+    if post_json.get("raw"):
+        return post_json["raw"]
+
+    return html.unescape(HTML_TAG_PATTERN.sub(" ", post_json.get("cooked") or ""))
+
+
+def create_match_query(terms):
+    """Create an FTS5 query matching posts containing every term, quoting them so punctuation is matched literally."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms if term != "")
+
+
+class PostIndex:
+    """SQLite FTS5 index of post bodies along with the post data needed to show matches."""
+
+    def __init__(self, filename):
+        """Open the index in a file, creating it if needed. Raises sqlite3.OperationalError if FTS5 is unavailable."""
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        """Use the index in a with statement, closing it at the end."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the index."""
+        self.close()
+
+    def close(self):
+        """Close the index file."""
+        with self._lock:
+            self._connection.close()
+
+    def add_posts(self, posts_json, site):
+        """Add or replace posts given as Discourse post JSON objects downloaded from a site."""
+        rows = []
+        for post_json in posts_json:
+            if "id" not in post_json:
+                continue
+
+            post = DiscoursePost(post_json)
+            rows.append(
+                (
+                    site,
+                    post.get_id(),
+                    post.get_topic_id(),
+                    None if post.get_creation_time() is None else post.get_creation_time().isoformat(),
+                    None if post.get_update_time() is None else post.get_update_time().isoformat(),
+                    json.dumps(post.to_json(), separators=(",", ":")),
+                    get_post_text(post_json),
+                )
+            )
+
+        with self._lock, self._connection:
+            for row in rows:
+                previous = self._connection.execute(
+                    "SELECT rowid FROM posts WHERE site = ? AND id = ?", (row[0], row[1])
+                ).fetchone()
+                if previous is not None:
+                    self._connection.execute("DELETE FROM post_text WHERE rowid = ?", previous)
+                    self._connection.execute("DELETE FROM posts WHERE rowid = ?", previous)
+
+                cursor = self._connection.execute(
+                    "INSERT INTO posts (site, id, topic_id, created_at, updated_at, post_json) "
+                    + "VALUES (?, ?, ?, ?, ?, ?)",
+                    row[:6],
+                )
+                self._connection.execute(
+                    "INSERT INTO post_text (rowid, text) VALUES (?, ?)", (cursor.lastrowid, row[6])
+                )
+
+    def get_num_posts(self):
+        """Get the number of posts in the index."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    # pylint: disable=too-many-arguments
+    def search(self, terms, start=None, end=None, site=None, limit=None):
+        """
+        Find posts containing every search term, most recently changed first.
+
+        Only posts created or updated within [start, end) are included if either is given, and only posts from site if
+        it is given. Returns a list of (site, DiscoursePost) pairs.
+        """
+        query = (
+            "SELECT posts.site, posts.post_json FROM post_text JOIN posts ON posts.rowid = post_text.rowid "
+            + "WHERE post_text MATCH ?"
+        )
+        params = [create_match_query(terms)]
+
+        if site is not None:
+            query += " AND posts.site = ?"
+            params.append(site)
+
+        if start is not None or end is not None:
+            start_str = "" if start is None else start.isoformat()
+            end_str = "~" if end is None else end.isoformat()
+            query += (
+                " AND ((posts.created_at >= ? AND posts.created_at < ?)"
+                + " OR (posts.updated_at >= ? AND posts.updated_at < ?))"
+            )
+            params.extend([start_str, end_str, start_str, end_str])
+
+        query += " ORDER BY COALESCE(posts.updated_at, posts.created_at) DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+
+        return [(row_site, DiscoursePost(json.loads(post_json))) for row_site, post_json in rows]
@@ -0,0 +1,13 @@
+"""JSON decoding backend, chosen once when imported: orjson if it is installed, otherwise the standard library."""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "json" if orjson is None else "orjson"
+
+# Both decode JSON straight from bytes, without first copying the body into a str
+loads = json.loads if orjson is None else orjson.loads  # pylint: disable=no-member
@@ -0,0 +1,110 @@
+"""Optional process pool that decodes large post stream downloads on other cores."""
+
+import logging
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from . import dscjson
+from .discourse_post import DiscoursePost
+
+# Smallest body decoded in the pool, since sending smaller ones to another process costs more than decoding them here
+DEFAULT_CUTOVER_BYTES = 1024 * 1024
+
+# Keys of post JSON objects read by DiscoursePost, the only ones sent back from worker processes
+POST_RECORD_KEYS = (
+    "id",
+    "username",
+    "name",
+    "created_at",
+    "updated_at",
+    "post_number",
+    "raw",
+    "reply_count",
+    "reply_to_post_number",
+    "topic_id",
+    "editor_name",
+)
+
+
+def get_post_stream_from_json(json_output):
+    """Get the post JSON objects included in a decoded post stream document, and the ids of every post in its stream."""
+    post_stream = json_output.get("post_stream", {}) if isinstance(json_output, dict) else {}
+    return post_stream.get("posts", []), post_stream.get("stream", [])
+
+
+def decode_post_stream(body):
+    """
+    Decode a post stream document into compact post JSON records and the ids in its stream, in a worker process.
+
+    Each post record holds only the keys DiscoursePost reads, so the rendered HTML and other post data in the document
+    are not copied back to the main process.
+    """
+    posts_json, stream = get_post_stream_from_json(dscjson.loads(body))
+    return [{key: post_json[key] for key in POST_RECORD_KEYS if key in post_json} for post_json in posts_json], stream
+
+
+class ParsePool:
+    """
+    Decode post stream documents at least cutover_bytes long in a pool of worker processes.
+
+    Smaller documents are decoded in the calling thread. Worker processes are only started once the first large
+    document is decoded, so the pool costs nothing for runs that never download one.
+    """
+
+    def __init__(self, max_workers=None, cutover_bytes=DEFAULT_CUTOVER_BYTES):
+        """Create a pool of up to max_workers processes, or one per core if None."""
+        self.max_workers = max_workers
+        self.cutover_bytes = cutover_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """Use the pool in a with statement, stopping its workers at the end."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the pool's workers."""
+        self.close()
+
+    def close(self):
+        """Stop the pool's worker processes, if any were started."""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+
+        if executor is not None:
+            executor.shutdown()
+
+    def is_started(self):
+        """Check if the pool's worker processes have been started."""
+        with self._lock:
+            return self._executor is not None
+
+    def get_executor(self):
+        """Get the pool's ProcessPoolExecutor, starting it if needed."""
+        # pylint: disable=import-outside-toplevel
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                # forking a process with download threads running can copy their held locks, so workers are spawned
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def parse_post_stream(self, body):
+        """
+        Decode a post stream document from bytes.
+
+        Returns the posts included in the document as DiscoursePosts, and the ids of every post in its stream. Raises
+        ValueError if the body is not valid JSON.
+        """
+        if len(body) >= self.cutover_bytes:
+            try:
+                records, stream = self.get_executor().submit(decode_post_stream, body).result()
+                return [DiscoursePost(record) for record in records], stream
+            except BrokenProcessPool:
+                logging.warning("Parse worker stopped unexpectedly, decoding in the main process")
+                self.close()
+
+        posts_json, stream = get_post_stream_from_json(dscjson.loads(body))
+        return [DiscoursePost(post_json) for post_json in posts_json], stream
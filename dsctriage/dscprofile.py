@@ -0,0 +1,157 @@
+"""dsctriage profiling support using cProfile and tracemalloc."""
+
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import tracemalloc
+from pathlib import Path
+
+PSTATS_FILENAME = "dsctriage.pstats"
+
+ALLOCATIONS_FILENAME = "allocations.txt"
+
+HOT_FUNCTIONS_FILENAME = "hot_functions.txt"
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+
+# Number of stack frames to keep per allocation, enough to reach package code from inside json and urllib
+TRACEBACK_FRAMES = 16
+
+
+def get_package_module(filename):
+    """Get the dsctriage module name of a source file, or None if it is not part of the package."""
+    path = Path(filename).resolve()
+    if path.parent != PACKAGE_DIR:
+        return None
+    return path.stem
+
+
+def group_allocations_by_module(snapshot):
+    """
+    Attribute each traced allocation to the most recent dsctriage module on its stack.
+
+    Returns a dictionary mapping module names, or "other" for allocations made outside the package, to a tuple of
+    total size in bytes, allocation count, and a dictionary of size per "module:line" location.
+    """
+    modules = {}
+
+    for stat in snapshot.statistics("traceback"):
+        module_name = "other"
+        location = None
+
+        for frame in reversed(stat.traceback):
+            frame_module = get_package_module(frame.filename)
+            if frame_module is not None:
+                module_name = frame_module
+                location = f"{frame_module}.py:{frame.lineno}"
+                break
+
+        size, count, locations = modules.get(module_name, (0, 0, {}))
+        if location is not None:
+            locations[location] = locations.get(location, 0) + stat.size
+        modules[module_name] = (size + stat.size, count + stat.count, locations)
+
+    return modules
+
+
+def format_allocation_report(snapshot, top=10):
+    """Create a report of memory still allocated at the end of a run, grouped by dsctriage module."""
+    modules = group_allocations_by_module(snapshot)
+    lines = ["Allocated memory by module", ""]
+
+    for module_name, (size, count, locations) in sorted(modules.items(), key=lambda item: item[1][0], reverse=True):
+        lines.append(f"{module_name}: {size / 1024:.1f} KiB in {count} blocks")
+        for location, location_size in sorted(locations.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"    {location}: {location_size / 1024:.1f} KiB")
+
+    return "\n".join(lines) + "\n"
+
+
+class ThreadProfilers:
+    """
+    cProfile profilers for the calling thread and every thread started while enabled, such as download workers.
+
+    Python 3.12 and later profile every thread with the first profiler, so no others are started there.
+    """
+
+    def __init__(self):
+        """Create profilers that are not enabled yet."""
+        self.profilers = [cProfile.Profile()]
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """Profile the calling thread and every thread started from now on."""
+        threading.setprofile(self.profile_new_thread)
+        self.profilers[0].enable()
+
+    def disable(self):
+        """Stop profiling the calling thread and stop profiling threads started from now on."""
+        self.profilers[0].disable()
+        threading.setprofile(None)
+
+    def profile_new_thread(self, *_args):
+        """Start a profiler for the thread this is first called from, replacing itself as the thread's profiler."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already active and profiles this thread too
+            return
+
+        with self._lock:
+            self.profilers.append(profiler)
+
+    def get_stats(self, stream=None):
+        """Get the profiles of every thread combined as pstats.Stats."""
+        with self._lock:
+            profilers = list(self.profilers)
+
+        stats = pstats.Stats(stream=stream)
+        stats.add(*profilers)
+        return stats
+
+
+def format_hot_functions(profiles, top=20):
+    """Create a summary of the functions with the highest cumulative and internal time from ThreadProfilers."""
+    stream = io.StringIO()
+    stats = profiles.get_stats(stream)
+    stats.strip_dirs()
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return stream.getvalue()
+
+
+def write_profile_reports(profiles, snapshot, output_dir, top=20):
+    """Write the pstats file of every thread, allocation report, and hot function summary to a directory."""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    profiles.get_stats().dump_stats(output_path / PSTATS_FILENAME)
+
+    with open(output_path / ALLOCATIONS_FILENAME, "w", encoding="utf-8") as allocations_file:
+        allocations_file.write(format_allocation_report(snapshot, top))
+
+    with open(output_path / HOT_FUNCTIONS_FILENAME, "w", encoding="utf-8") as hot_functions_file:
+        hot_functions_file.write(format_hot_functions(profiles, top))
+
+
+def run_profiled(output_dir, function, *args, top=20, **kwargs):
+    """
+    Run a function under cProfile and tracemalloc, then write profile reports to the given directory.
+
+    Threads started by the function, such as download workers, are profiled too. Returns the result of the function.
+    """
+    profiles = ThreadProfilers()
+    tracemalloc.start(TRACEBACK_FRAMES)
+    profiles.enable()
+
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiles.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        tracemalloc.stop()
+        write_profile_reports(profiles, snapshot, output_dir, top)
+        logging.info("Profile written to %s", str(output_dir))
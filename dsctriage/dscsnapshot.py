@@ -0,0 +1,187 @@
+"""Offline category snapshot files for network-free triage."""
+
+import gzip
+import json
+import logging
+import zlib
+from datetime import datetime, timezone
+from .discourse_post import DiscoursePost
+from .discourse_topic import DiscourseTopic
+from .discourse_category import DiscourseCategory
+
+SNAPSHOT_VERSION = 1
+
+# Each line of a snapshot is a JSON object with one of these keys first, so lines can be skipped without decoding
+CATEGORY_LINE_PREFIX = '{"category"'
+
+TOPIC_LINE_PREFIX = '{"topic"'
+
+POST_LINE_PREFIX = '{"post"'
+
+
+def write_json_line(snapshot_file, line_json):
+    """Write a single compact JSON object as a line of a snapshot."""
+    snapshot_file.write(json.dumps(line_json, separators=(",", ":")))
+    snapshot_file.write("\n")
+
+
+def write_snapshot(filename, categories, site=None, header=None):
+    """
+    Write a list of (name, DiscourseCategory) pairs, including their topics and posts, to a gzip compressed file.
+
+    The first line holds the snapshot version and site, along with any other keys in header, followed by each
+    category line. Every category line is followed by its topics, and every topic line is followed by its posts.
+    """
+    with gzip.open(filename, "wt", encoding="utf-8") as snapshot_file:
+        write_json_line(
+            snapshot_file,
+            {
+                "snapshot": SNAPSHOT_VERSION,
+                "site": site,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                **(header or {}),
+            },
+        )
+
+        for category_name, category in categories:
+            write_json_line(snapshot_file, {"category": category.to_json(), "name": category_name})
+
+            for topic in category.get_topics():
+                write_json_line(snapshot_file, {"topic": topic.to_json()})
+
+                for post in topic.get_posts():
+                    write_json_line(snapshot_file, {"post": post.to_json()})
+
+
+def read_snapshot_header(filename):
+    """Get the header of a snapshot as a dictionary with 'snapshot', 'site', and 'created_at' keys."""
+    with gzip.open(filename, "rt", encoding="utf-8") as snapshot_file:
+        try:
+            header = json.loads(snapshot_file.readline())
+        except ValueError as error:
+            raise ValueError(f"Invalid snapshot file: {filename}") from error
+
+    if not isinstance(header, dict) or header.get("snapshot") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot file: {filename}")
+
+    return header
+
+
+def category_matches_names(category_name, category, category_names):
+    """Check if a snapshot category was saved under, or is named, one of a list of names (case-insensitive)."""
+    if category_names is None:
+        return True
+
+    for name in category_names:
+        name = name.strip().lower()
+        if name in (
+            str(category_name).lower(),
+            str(category.get_name()).lower(),
+            str(category.get_slug()).lower(),
+        ):
+            return True
+
+    return False
+
+
+def iter_snapshot_categories(filename, category_names=None, topic_filter=None):
+    """
+    Read a snapshot line by line, yielding (name, DiscourseCategory) pairs once each category is fully loaded.
+
+    Only categories matching one of category_names are loaded, or all of them if it is None. Topics for which
+    topic_filter returns False are skipped along with their posts, which are then never decoded.
+    """
+    read_snapshot_header(filename)
+
+    current = None
+    current_topic = None
+
+    with gzip.open(filename, "rt", encoding="utf-8") as snapshot_file:
+        snapshot_file.readline()
+
+        for line in snapshot_file:
+            if line.startswith(POST_LINE_PREFIX):
+                if current_topic is not None:
+                    current_topic.add_post(DiscoursePost(json.loads(line)["post"]))
+
+            elif line.startswith(TOPIC_LINE_PREFIX):
+                current_topic = None
+                if current is not None:
+                    topic = DiscourseTopic(json.loads(line)["topic"])
+                    if topic_filter is None or topic_filter(topic):
+                        current_topic = topic
+                        current[1].add_topic(topic)
+
+            elif line.startswith(CATEGORY_LINE_PREFIX):
+                if current is not None:
+                    yield current
+
+                current = None
+                current_topic = None
+                line_json = json.loads(line)
+                category = DiscourseCategory(line_json["category"])
+
+                if category_matches_names(line_json.get("name"), category, category_names):
+                    current = (line_json.get("name"), category)
+
+    if current is not None:
+        yield current
+
+
+def get_topic_shard(topic_id, num_shards):
+    """Get the shard, from 0 to num_shards - 1, a topic belongs to, which is the same on every host and run."""
+    return zlib.crc32(str(topic_id).encode("utf-8")) % num_shards
+
+
+# pylint: disable=too-many-locals
+def merge_shards(filenames):
+    """
+    Combine shard snapshots of the same categories into one list of (name, DiscourseCategory) pairs.
+
+    Every shard lists all topics of its categories, but only has posts for the topics in its own shard, given by the
+    'shard' [index, count] pair in its header. Categories and topics are kept in the order of the first shard, with
+    topics only listed in later shards added at the end of their category. Topics whose own shard is missing, or did
+    not list them, are marked as not fetched. Returns the header of the first shard along with the categories. Raises
+    ValueError if the files are not shards of the same run.
+    """
+    headers = [read_snapshot_header(filename) for filename in filenames]
+    if len(headers) == 0 or any(not isinstance(header.get("shard"), list) for header in headers):
+        raise ValueError("Every merged file must be a shard snapshot")
+
+    num_shards = headers[0]["shard"][1]
+    for filename, header in zip(filenames, headers):
+        if header["shard"][1] != num_shards or header.get("site") != headers[0].get("site"):
+            raise ValueError(f"Shard {filename} is not from the same run as {filenames[0]}")
+
+    shard_indexes = {header["shard"][0] for header in headers}
+    missing_shards = [str(index + 1) for index in range(num_shards) if index not in shard_indexes]
+    if len(missing_shards) > 0:
+        logging.warning(
+            "Missing shards %s of %d, their topics are marked with !", ", ".join(missing_shards), num_shards
+        )
+
+    categories = {}
+    topics = {}
+    owned_topics = set()
+    for filename, header in zip(filenames, headers):
+        for category_name, category in iter_snapshot_categories(filename):
+            categories.setdefault(category_name, category)
+            category_topics = topics.setdefault(category_name, {})
+
+            for topic in category.get_topics():
+                if get_topic_shard(topic.get_id(), num_shards) == header["shard"][0]:
+                    owned_topics.add((category_name, topic.get_id()))
+                    category_topics[topic.get_id()] = topic
+                elif topic.get_id() not in category_topics:
+                    category_topics[topic.get_id()] = topic
+
+    merged_categories = []
+    for category_name, category in categories.items():
+        merged_category = DiscourseCategory(category.to_json())
+        for topic in topics[category_name].values():
+            if (category_name, topic.get_id()) not in owned_topics:
+                topic.set_fetch_failed(True)
+            merged_category.add_topic(topic)
+        merged_categories.append((category_name, merged_category))
+
+    return headers[0], merged_categories
@@ -0,0 +1,192 @@
+"""dsctriage request and timing statistics."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of each latency histogram bucket, with a final bucket for anything slower
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def get_bucket_labels():
+    """Get a short human-readable label for each latency histogram bucket."""
+    labels = [f"<{int(bound * 1000)}ms" if bound < 1 else f"<{bound:g}s" for bound in LATENCY_BUCKETS]
+    labels.append(f">{LATENCY_BUCKETS[-1]:g}s")
+    return labels
+
+
+def get_endpoint_name(template):
+    """Get the printable name of an endpoint template by removing its site placeholder."""
+    return template.replace("#url", "")
+
+
+class EndpointStats:
+    """Request statistics for a single endpoint template."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, template):
+        """Create an empty set of statistics for a given endpoint template."""
+        self.template = template
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, latency, num_bytes=0, error=False):
+        """Add a single request to the statistics."""
+        self.requests += 1
+        self.bytes += num_bytes
+        self.total_time += latency
+        self.max_time = max(self.max_time, latency)
+
+        if error:
+            self.errors += 1
+
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency < bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def get_mean_time(self):
+        """Get the mean latency of requests to the endpoint in seconds."""
+        return self.total_time / self.requests if self.requests > 0 else 0.0
+
+    def as_dict(self):
+        """Get the statistics as a dictionary."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "total_time": self.total_time,
+            "mean_time": self.get_mean_time(),
+            "max_time": self.max_time,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "histogram": dict(zip(get_bucket_labels(), self.histogram)),
+        }
+
+
+class RunStats:
+    """Per-endpoint request statistics along with named timings, such as parse and render time, for a run."""
+
+    def __init__(self):
+        """Create an empty set of run statistics."""
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._timings = {}
+
+    def reset(self):
+        """Remove all recorded statistics."""
+        with self._lock:
+            self._endpoints = {}
+            self._timings = {}
+
+    def record_request(self, template, latency, num_bytes=0, error=False):
+        """Record a request made to a URL created from the given endpoint template."""
+        with self._lock:
+            if template not in self._endpoints:
+                self._endpoints[template] = EndpointStats(template)
+            self._endpoints[template].record(latency, num_bytes, error)
+
+    def record_hedge(self, template, won=False):
+        """Record a duplicate request sent because a request to an endpoint was slow, or that the duplicate won."""
+        with self._lock:
+            if template not in self._endpoints:
+                self._endpoints[template] = EndpointStats(template)
+
+            if won:
+                self._endpoints[template].hedges_won += 1
+            else:
+                self._endpoints[template].hedges += 1
+
+    def add_time(self, name, seconds):
+        """Add time in seconds to a named timing."""
+        with self._lock:
+            total, count = self._timings.get(name, (0.0, 0))
+            self._timings[name] = (total + seconds, count + 1)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block and add it to a named timing."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def get_endpoint_stats(self, template):
+        """Get the EndpointStats for an endpoint template, or None if no requests were made to it."""
+        return self._endpoints.get(template)
+
+    def get_endpoints(self):
+        """Get the EndpointStats of every endpoint requested so far."""
+        with self._lock:
+            return list(self._endpoints.values())
+
+    def get_time(self, name):
+        """Get the total time in seconds recorded for a named timing."""
+        return self._timings.get(name, (0.0, 0))[0]
+
+    def as_dict(self):
+        """Get all statistics as a dictionary with 'endpoints' and 'timings' sections."""
+        with self._lock:
+            return {
+                "endpoints": {template: stats.as_dict() for template, stats in self._endpoints.items()},
+                "timings": {
+                    name: {"total_time": total, "count": count} for name, (total, count) in self._timings.items()
+                },
+            }
+
+    def format_table(self):
+        """Create a printable summary table of the statistics."""
+        endpoints = sorted(self.get_endpoints(), key=lambda stats: stats.total_time, reverse=True)
+        name_width = max([len("Endpoint")] + [len(get_endpoint_name(stats.template)) for stats in endpoints])
+
+        lines = [
+            f"{'Endpoint':<{name_width}} {'Requests':>8} {'Errors':>6} {'KiB':>9} {'Total s':>8} {'Mean ms':>8} "
+            f"{'Max ms':>8}"
+        ]
+        for stats in endpoints:
+            lines.append(
+                f"{get_endpoint_name(stats.template):<{name_width}} {stats.requests:>8} {stats.errors:>6} "
+                f"{stats.bytes / 1024:>9.1f} {stats.total_time:>8.2f} {stats.get_mean_time() * 1000:>8.1f} "
+                f"{stats.max_time * 1000:>8.1f}"
+            )
+
+        labels = get_bucket_labels()
+        lines.append("")
+        lines.append(f"{'Latency':<{name_width}} " + " ".join(f"{label:>7}" for label in labels))
+        for stats in endpoints:
+            lines.append(
+                f"{get_endpoint_name(stats.template):<{name_width}} "
+                + " ".join(f"{count:>7}" for count in stats.histogram)
+            )
+
+        hedged_endpoints = [stats for stats in endpoints if stats.hedges > 0]
+        if len(hedged_endpoints) > 0:
+            lines.append("")
+            lines.append(f"{'Hedged':<{name_width}} {'Sent':>8} {'Won':>6}")
+            for stats in hedged_endpoints:
+                lines.append(
+                    f"{get_endpoint_name(stats.template):<{name_width}} {stats.hedges:>8} {stats.hedges_won:>6}"
+                )
+
+        lines.append("")
+        for name, (total, count) in self._timings.items():
+            lines.append(f"{name.capitalize()} time: {total:.2f}s over {count} call{'s' if count != 1 else ''}")
+
+        return "\n".join(lines)
+
+
+_run_stats = RunStats()
+
+
+def get_stats():
+    """Get the statistics collected for the current run."""
+    return _run_stats
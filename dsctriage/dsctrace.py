@@ -0,0 +1,92 @@
+"""Timeline tracing of a run in Chrome Trace Event format, for viewing in Perfetto or chrome://tracing."""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TraceRecorder:
+    """
+    Spans of time recorded from any thread, each with a name, category, and arguments such as sizes and ids.
+
+    Spans are complete ("X") events timed in microseconds from when recording started, on the thread they were
+    recorded from, so overlapping requests show up side by side in a trace viewer. Nothing is recorded until start is
+    called.
+    """
+
+    def __init__(self):
+        """Create a recorder with no spans, that is not recording yet."""
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._events = []
+        self._thread_names = {}
+        self.recording = False
+
+    def start(self):
+        """Remove any recorded spans and start recording new ones."""
+        with self._lock:
+            self._start_time = time.perf_counter()
+            self._events = []
+            self._thread_names = {}
+            self.recording = True
+
+    def stop(self):
+        """Stop recording spans, keeping those already recorded."""
+        self.recording = False
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Record the enclosed block as a span while recording, yielding its arguments so more can be added."""
+        if not self.recording:
+            yield args
+            return
+
+        thread = threading.current_thread()
+        start_time = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end_time = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start_time - self._start_time) * 1e6, 3),
+                "dur": round((end_time - start_time) * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": args,
+            }
+
+            with self._lock:
+                self._events.append(event)
+                self._thread_names.setdefault(thread.ident, thread.name)
+
+    def get_events(self):
+        """Get every trace event recorded so far, starting with the name of each thread spans were recorded on."""
+        with self._lock:
+            thread_events = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": thread_name}}
+                for thread_id, thread_name in self._thread_names.items()
+            ]
+            return thread_events + sorted(self._events, key=lambda event: event["ts"])
+
+    def write(self, filename):
+        """Write every recorded span to a file in Chrome Trace Event JSON format."""
+        with open(filename, "w", encoding="utf-8") as trace_file:
+            json.dump({"traceEvents": self.get_events(), "displayTimeUnit": "ms"}, trace_file)
+
+
+_run_trace = TraceRecorder()
+
+
+def get_trace():
+    """Get the TraceRecorder for the current run, which records spans once started."""
+    return _run_trace
+
+
+def span(name, category, **args):
+    """Record the enclosed block as a span of the current run if it is being traced, see TraceRecorder.span."""
+    return _run_trace.span(name, category, **args)
@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 """Discourse Triage frontend."""
 
-import argparse
+# pylint: disable=too-many-lines
+
+import os
 import sys
 from enum import Enum
 from datetime import datetime, timedelta, timezone
 import time
 import re
 import logging
-import webbrowser
-from . import dscfinder
+from urllib.error import URLError
+from . import dscfinder, dschttp, dscstats, dsctrace, dscwatch
 from .dscconfig import Config
 
-try:
-    from alive_progress import alive_bar
-except ImportError:
-    alive_bar = None
+# Modules only needed by some commands, such as argparse, webbrowser, alive_progress, and the snapshot, webhook, and
+# profiling support, are imported where they are used to keep startup fast
 
 
 class PostStatus(Enum):
@@ -24,6 +24,7 @@ class PostStatus(Enum):
     UNCHANGED = 0
     NEW = 1
     UPDATED = 2
+    NOT_FETCHED = 3
 
 
 class PostWithMetadata:
@@ -43,7 +44,7 @@ class PostWithMetadata:
         meta_tags = ""
         if self.contains_relevant_posts:
             meta_tags += "r"
-        return f'{str(self.post)}: {("unchanged", "new", "updated")[self.status.value]} - {meta_tags}'
+        return f'{str(self.post)}: {("unchanged", "new", "updated", "not fetched")[self.status.value]} - {meta_tags}'
 
     def add_reply(self, meta_post):
         """Add a reply to the list of replies to this post."""
@@ -126,13 +127,18 @@ def parse_dates(start=None, end=None):
 
 def show_top_header(pretty_start_date, pretty_end_date, site=None):
     """Show initial header containing the date range and Discourse site."""
+    logging.info("Discourse Comment Triage")
+    show_date_range_header(pretty_start_date, pretty_end_date, site)
+
+
+def show_date_range_header(pretty_start_date, pretty_end_date, site=None):
+    """Show header containing a date range and Discourse site, for each range after the first in a report."""
     date_range_info = (
         ("on " + str(pretty_start_date))
         if pretty_start_date == pretty_end_date
         else ("between " + str(pretty_start_date) + " and " + str(pretty_end_date) + " inclusive")
     )
 
-    logging.info("Discourse Comment Triage")
     logging.info(
         "Showing comments%s, updated %s",
         f" on {site}" if site is not None else "",
@@ -155,20 +161,26 @@ def create_hyperlink(url, text):
 
 
 def set_relevant_post_metadata(post_with_meta):
-    """Recursively check if a post or its replies contain updates and mark its metadata accordingly."""
-    is_relevant = False
+    """Check if a post or its replies contain updates and mark the metadata of it and all of its replies accordingly."""
+    # replies are marked before the posts they reply to, without recursing so long chains cannot overflow the stack
+    stack = [(post_with_meta, False)]
 
-    for reply in post_with_meta.replies:
-        is_relevant = is_relevant or set_relevant_post_metadata(reply)
+    while len(stack) > 0:
+        current_post, replies_marked = stack.pop()
 
-    is_relevant = is_relevant or (post_with_meta.status != PostStatus.UNCHANGED)
-    post_with_meta.contains_relevant_posts = is_relevant
+        if replies_marked:
+            current_post.contains_relevant_posts = current_post.status != PostStatus.UNCHANGED or any(
+                reply.contains_relevant_posts for reply in current_post.replies
+            )
+        else:
+            stack.append((current_post, True))
+            stack.extend((reply, False) for reply in current_post.replies)
 
-    return is_relevant
+    return post_with_meta.contains_relevant_posts
 
 
-def print_single_comment(post, status, date_updated, post_url, shorten_links):
-    """Display info on a single post in readable format."""
+def format_single_comment(post, status, date_updated, post_url, shorten_links):
+    """Format info on a single post as a readable line."""
     status_str = ""
     if status == PostStatus.UPDATED:
         status_str = "*"
@@ -185,13 +197,16 @@ def print_single_comment(post, status, date_updated, post_url, shorten_links):
 
     date_str = "" if date_updated is None else f', {date_updated.strftime("%Y-%m-%d")}'
 
-    post_str = f"{status_str}{base_id_str} [{dscfinder.create_author_name_str(post)}{date_str}] {url_str}"
+    return f"{status_str}{base_id_str} [{dscfinder.create_author_name_str(post)}{date_str}] {url_str}"
 
-    print(post_str)
+
+def print_single_comment(post, status, date_updated, post_url, shorten_links):
+    """Display info on a single post in readable format."""
+    print(format_single_comment(post, status, date_updated, post_url, shorten_links))
 
 
 # pylint: disable=too-many-arguments
-def print_topic_post(
+def format_topic_post(
     topic,
     status,
     date_updated,
@@ -201,7 +216,7 @@ def print_topic_post(
     site=None,
     topic_name_length=25,
 ):
-    """Display a topic's name and recent update information if relevant."""
+    """Format a topic's name and recent update information as a readable line."""
     topic_string = topic.get_name()
     topic_url = dscfinder.get_topic_url(topic, site)
 
@@ -210,6 +225,8 @@ def print_topic_post(
         status_str = "*"
     elif status == PostStatus.NEW:
         status_str = "+"
+    elif status == PostStatus.NOT_FETCHED:
+        status_str = "!"
     else:
         topic_name_length += 1
 
@@ -226,88 +243,97 @@ def print_topic_post(
     date_str = "" if date_updated is None else f', {date_updated.strftime("%Y-%m-%d")}'
     url_str = "" if shorten_links else f"({topic_url})"
 
-    post_str = f"{status_str}{topic_string} [{author if editor is None else editor}{date_str}] {url_str}"
+    return f"{status_str}{topic_string} [{author if editor is None else editor}{date_str}] {url_str}"
 
-    print(post_str)
 
+# the indent continuing below a comment's branch symbol, for the replies of that comment
+CHAIN_CONTINUATIONS = {"├": "│", "└": " "}
 
-def print_comment_chain(post_with_meta, shorten_links, chain_list):
-    """Display a chain of comments recursively."""
-    if post_with_meta.contains_relevant_posts:
-        if len(chain_list) > 0:
-            indent_str = chain_list[0]
-            for indent in chain_list[1:]:
-                indent_str += "  " + indent
-            print(indent_str, end="─ ")
-        print_single_comment(
-            post_with_meta.post,
-            post_with_meta.status,
-            post_with_meta.update_date,
-            post_with_meta.url,
-            shorten_links,
-        )
 
-        # find all relevant replies and add to list
-        relevant_replies = []
-        for reply in post_with_meta.replies:
-            if reply.contains_relevant_posts:
-                relevant_replies.append(reply)
+def format_comment_chain(post_with_meta, shorten_links, indent="", branch="└"):
+    """
+    Format a chain of comments with relevant updates as a list of lines, starting from a post with metadata.
 
-        if len(relevant_replies) > 0:
-            if chain_list[-1] == "├":
-                chain_list[-1] = "│"
-            elif chain_list[-1] == "└":
-                chain_list[-1] = " "
+    The post's line starts with indent followed by its branch symbol, and each of its relevant replies is indented
+    under it. The chain is walked without recursion, extending the indent once per reply level.
+    """
+    lines = []
+    stack = [(post_with_meta, indent, branch)]
 
-            chain_list.append("├")
+    while len(stack) > 0:
+        current_post, current_indent, current_branch = stack.pop()
+        if not current_post.contains_relevant_posts:
+            continue
 
-            # iterate through relevant replies
-            for reply in relevant_replies[:-1]:
-                print_comment_chain(reply, shorten_links, chain_list)
+        lines.append(
+            current_indent
+            + current_branch
+            + "─ "
+            + format_single_comment(
+                current_post.post,
+                current_post.status,
+                current_post.update_date,
+                current_post.url,
+                shorten_links,
+            )
+        )
 
-            chain_list[-1] = "└"
-            print_comment_chain(relevant_replies[-1], shorten_links, chain_list)
+        relevant_replies = [reply for reply in current_post.replies if reply.contains_relevant_posts]
+        reply_indent = current_indent + CHAIN_CONTINUATIONS.get(current_branch, current_branch) + "  "
 
-            chain_list.pop()
+        # replies are pushed in reverse so the first is shown first, with the last closing the branch
+        for i in range(len(relevant_replies) - 1, -1, -1):
+            stack.append((relevant_replies[i], reply_indent, "└" if i == len(relevant_replies) - 1 else "├"))
 
+    return lines
 
-def print_comments_within_topic(topic, post_metadata_list, shorten_links, site=None):
-    """Display a topic and its relevant comments, if any."""
-    # start by finding the main topic post and removing unnecessary branches by iterating over a copy of the list
+
+def format_comments_within_topic(topic, post_metadata_list, shorten_links, site=None):
+    """Format a topic and its relevant comments, if any, as a list of lines."""
+    # start by finding the main topic post and leaving out branches without updates
     main_topic_post = None
+    relevant_posts = []
 
-    for post_with_meta in list(post_metadata_list):
+    for post_with_meta in post_metadata_list:
         if post_with_meta.post.is_main_post_for_topic():
             main_topic_post = post_with_meta
-        elif not post_with_meta.contains_relevant_posts:
-            post_metadata_list.remove(post_with_meta)
+        elif post_with_meta.contains_relevant_posts:
+            relevant_posts.append(post_with_meta)
 
     if main_topic_post is not None:
         main_post_author = dscfinder.create_author_name_str(main_topic_post.post)
         main_post_editor = None
 
+        # editors are looked up while downloading, so showing them never waits on the network
         if main_topic_post.status == PostStatus.UPDATED:
-            main_post_editor = dscfinder.create_editor_name_str(main_topic_post.post, site)
-
-        print_topic_post(
-            topic,
-            main_topic_post.status,
-            main_topic_post.update_date,
-            main_post_author,
-            main_post_editor,
-            shorten_links,
-            site,
-        )
-        post_metadata_list.remove(main_topic_post)
+            main_post_editor = main_topic_post.post.get_editor_name()
+
+        lines = [
+            format_topic_post(
+                topic,
+                main_topic_post.status,
+                main_topic_post.update_date,
+                main_post_author,
+                main_post_editor,
+                shorten_links,
+                site,
+            )
+        ]
     else:
-        print_topic_post(topic, PostStatus.UNCHANGED, None, None, None, shorten_links, site)
+        lines = [format_topic_post(topic, PostStatus.UNCHANGED, None, None, None, shorten_links, site)]
+
+    # add all additional comments that have either been updated or contain updated replies
+    for i, post_with_meta in enumerate(relevant_posts):
+        lines.extend(
+            format_comment_chain(post_with_meta, shorten_links, "", "└" if i == len(relevant_posts) - 1 else "├")
+        )
+
+    return lines
 
-    # print all additional comments that have either been updated or contain updated replies
-    for post_with_meta in post_metadata_list[:-1]:
-        print_comment_chain(post_with_meta, shorten_links, ["├"])
 
-    if len(post_metadata_list) > 0:
-        print_comment_chain(post_metadata_list[-1], shorten_links, ["└"])
+def print_comments_within_topic(topic, post_metadata_list, shorten_links, site=None):
+    """Display a topic and its relevant comments, if any, in a single write to stdout."""
+    sys.stdout.write("\n".join(format_comments_within_topic(topic, post_metadata_list, shorten_links, site)) + "\n")
 
 
 def create_post_with_metadata(post, start, end, url):
@@ -324,14 +350,31 @@ def create_post_with_metadata(post, start, end, url):
     return PostWithMetadata(post, PostStatus.UNCHANGED, url)
 
 
-def get_post_with_metadata_from_post_id(post_id, post_metadata_list):
-    """Find a post in a list of posts with metadata based on its id, return None if it does not exist."""
-    if post_id is not None:
-        for post_with_meta in post_metadata_list:
-            if post_with_meta.post.get_post_number() == post_id:
-                return post_with_meta
+def create_reply_tree(post_metadata_list):
+    """
+    Add each post with metadata to the replies of the post it replies to, and return the posts that start chains.
 
-    return None
+    Chains start at posts that are not replies, including the main post, and posts replying to the main post or to a
+    post that is not in the list.
+    """
+    posts_by_number = {}
+    for post_with_meta in post_metadata_list:
+        posts_by_number.setdefault(post_with_meta.post.get_post_number(), post_with_meta)
+
+    top_level_posts = []
+    for post_with_meta in post_metadata_list:
+        reply_to_number = post_with_meta.post.get_reply_to_number()
+        replied_to_post = None if reply_to_number is None else posts_by_number.get(reply_to_number)
+
+        # post is not a reply or is a reply to the main topic, add to top level to recurse through
+        if replied_to_post is None or replied_to_post.post.is_main_post_for_topic():
+            top_level_posts.append(post_with_meta)
+
+        # Add this post as a reply to the found reply-to post
+        if replied_to_post is not None:
+            replied_to_post.add_reply(post_with_meta)
+
+    return top_level_posts
 
 
 def get_metadata_for_posts_of_topic(topic, start, end, site=None):
@@ -349,76 +392,397 @@ def get_metadata_for_posts_of_topic(topic, start, end, site=None):
     return post_metadata_list, topic_is_relevant
 
 
+def format_unfetched_topic(topic, start, shorten_links, site=None):
+    """Format the mark of a topic whose posts were not downloaded, or an empty string if it had no relevant comments."""
+    update_time = topic.get_latest_update_time()
+
+    if update_time is None or start <= update_time:
+        return (
+            format_topic_post(topic, PostStatus.NOT_FETCHED, update_time, "not fetched", None, shorten_links, site)
+            + "\n"
+        )
+
+    return ""
+
+
+def format_topic_comments(topic, start, end, shorten_links=True, site=None):
+    """Format a topic and its comments created or updated within [start, end), or an empty string if there are none."""
+    if topic.get_fetch_failed():
+        return format_unfetched_topic(topic, start, shorten_links, site)
+
+    with dsctrace.span("classify posts", "report", topic_id=topic.get_id(), posts=len(topic.get_posts())):
+        post_metadata_list, print_topic = get_metadata_for_posts_of_topic(topic, start, end, site)
+    if not print_topic:
+        return ""
+
+    with dsctrace.span("render topic", "report", topic_id=topic.get_id()):
+        # organize reply structure, then reach every post from the start of its chain
+        final_meta_post_list = create_reply_tree(post_metadata_list)
+        for post_item in final_meta_post_list:
+            set_relevant_post_metadata(post_item)
+
+        return "\n".join(format_comments_within_topic(topic, final_meta_post_list, shorten_links, site)) + "\n"
+
+
+def open_comments_in_browser(post_metadata_list, initial_browser_open=True):
+    """
+    Open each new or updated post in a web browser, waiting for the browser to start if it is opened first.
+
+    Returns whether the browser has still not been opened.
+    """
+    for post_item in post_metadata_list:
+        if post_item.status != PostStatus.UNCHANGED:
+            import webbrowser  # pylint: disable=import-outside-toplevel
+
+            if initial_browser_open:
+                initial_browser_open = False
+                webbrowser.open(post_item.url)
+                time.sleep(5)
+            else:
+                webbrowser.open_new_tab(post_item.url)
+                time.sleep(1.2)
+
+    return initial_browser_open
+
+
 def print_comments(category, start, end, open_in_browser=False, shorten_links=True, site=None):
-    """Display relevant posts in a readable format."""
+    """Display relevant posts in a readable format, writing each topic to stdout at once."""
     initial_browser_open = True
 
     for topic in category.get_topics():
-        post_metadata_list, print_topic = get_metadata_for_posts_of_topic(topic, start, end, site)
+        if open_in_browser and not topic.get_fetch_failed():
+            post_metadata_list = get_metadata_for_posts_of_topic(topic, start, end, site)[0]
+            initial_browser_open = open_comments_in_browser(post_metadata_list, initial_browser_open)
+
+        topic_output = format_topic_comments(topic, start, end, shorten_links, site)
+        if topic_output != "":
+            sys.stdout.write(topic_output)
+
+
+def print_post_in_backlog_format(post_id, site=None):
+    """Print a Discourse comment to be copied to the backlog."""
+    print_posts_in_backlog_format([post_id], site)
+
 
-        # organize reply structure, remove replies from list, and open in browser if requested
-        final_meta_post_list = []
-        for post_item in post_metadata_list:
-            replied_to_post = get_post_with_metadata_from_post_id(
-                post_item.post.get_reply_to_number(), post_metadata_list
+def print_posts_in_backlog_format(post_ids, site=None):
+    """Print Discourse comments to be copied to the backlog in the order of their ids, downloading them together."""
+    backlog_posts = dscfinder.get_posts_by_id(post_ids, site)
+
+    for post_id in post_ids:
+        backlog_post = backlog_posts.get(str(post_id))
+
+        if not backlog_post:
+            print(f"No post found with id {post_id}")
+        else:
+            print_single_comment(
+                backlog_post,
+                PostStatus.UNCHANGED,
+                backlog_post.get_update_time(),
+                dscfinder.get_post_url_without_topic(backlog_post, site),
+                False,
             )
 
-            # post is not a reply or is a reply to the main topic, add to top level to recurse through
-            if replied_to_post is None or replied_to_post.post.is_main_post_for_topic():
-                final_meta_post_list.append(post_item)
-
-            # Add this post as a reply to the found reply-to post
-            if replied_to_post is not None:
-                replied_to_post.add_reply(post_item)
-
-            # open in browser if needed
-            if post_item.status != PostStatus.UNCHANGED and open_in_browser:
-                if initial_browser_open:
-                    initial_browser_open = False
-                    webbrowser.open(post_item.url)
-                    time.sleep(5)
-                else:
-                    webbrowser.open_new_tab(post_item.url)
-                    time.sleep(1.2)
-
-        for post_item in post_metadata_list:
-            set_relevant_post_metadata(post_item)
 
-        # print topic if it contains any updates
-        if print_topic:
-            print_comments_within_topic(topic, final_meta_post_list, shorten_links, site)
+def read_backlog_post_ids(backlog_args, stdin=None):
+    """Get post ids from backlog arguments, where "-" reads whitespace or comma separated ids from stdin."""
+    post_ids = []
 
+    for backlog_arg in backlog_args:
+        if backlog_arg == "-":
+            backlog_arg = (stdin or sys.stdin).read()
+        post_ids.extend(post_id for post_id in re.split(r"[\s,]+", backlog_arg) if post_id != "")
 
-def print_post_in_backlog_format(post_id, site=None):
-    """Print a Discourse comment to be copied to the backlog."""
-    backlog_post = dscfinder.get_post_by_id(post_id, site)
+    return post_ids
 
-    if not backlog_post:
-        print(f"No post found with id {post_id}")
-    else:
+
+def open_post_index(index_file, sites):
+    """Open the local search index in a file and fill it with every post downloaded from the given sites."""
+    from . import dscindex  # pylint: disable=import-outside-toplevel
+
+    post_index = dscindex.PostIndex(index_file)
+    for site in sites:
+        dscfinder.get_client(site).set_post_index(post_index)
+
+    return post_index
+
+
+def open_parse_pool(num_processes, sites):
+    """Start decoding large topic downloads from the given sites in up to num_processes worker processes, or 1/core."""
+    from . import dscparse  # pylint: disable=import-outside-toplevel
+
+    parse_pool = dscparse.ParsePool(num_processes or None)
+    for site in sites:
+        dscfinder.get_client(site).set_parse_pool(parse_pool)
+
+    return parse_pool
+
+
+def search_post_index(index_file, terms, start=None, end=None, site=None, limit=None):
+    """Print posts in the local search index containing every term in backlog format, without downloading anything."""
+    from . import dscindex  # pylint: disable=import-outside-toplevel
+
+    with dscindex.PostIndex(index_file) as post_index:
+        matches = post_index.search(terms, start, end, site, limit)
+
+    if len(matches) == 0:
+        print("No posts found")
+
+    for post_site, post in matches:
         print_single_comment(
-            backlog_post,
+            post,
             PostStatus.UNCHANGED,
-            backlog_post.get_update_time(),
-            dscfinder.get_post_url_without_topic(backlog_post, site),
+            post.get_update_time(),
+            dscfinder.get_post_url_without_topic(post, post_site),
             False,
         )
 
 
-def fill_topics(topics, progress_bar, site=None, tag=None):
-    """Download posts related to a list of topics and display progress if desired and available."""
-    if progress_bar and alive_bar is not None:
-        with alive_bar(len(topics), receipt=False) as bar_view:
-            for topic in topics:
-                if not tag or topic.has_tag(tag):
-                    dscfinder.add_posts_to_topic(topic, site)
-                bar_view()
-    else:
-        for topic in topics:
-            if not tag or topic.has_tag(tag):
-                dscfinder.add_posts_to_topic(topic, site)
+def fill_topic(topic, site=None, editors_since=None):
+    """
+    Download the posts of a topic, then the editor of its main post if edited on or after editors_since, or ever.
+
+    If the site's client keeps only relevant posts, only posts changed on or after editors_since and the posts they
+    reply to are kept, see DiscourseClient.add_relevant_posts. Returns whether every post of the topic was downloaded.
+    """
+    with dsctrace.span("download topic", "topic", topic_id=topic.get_id()):
+        client = dscfinder.get_client(site)
+        if editors_since is not None and client.get_relevant_posts_only():
+            complete = client.add_relevant_posts(topic, editors_since)
+        else:
+            complete = client.add_posts_to_topic(topic)
+
+        dscfinder.add_editor_name_to_topic(topic, editors_since, site)
+        return complete
+
+
+def get_topic_fetch_priority(topic, start=None, end=None):
+    """
+    Get a sort key ranking a topic by how likely it is to have posts created or updated within [start, end).
+
+    Topics bumped within the range come first, most recently bumped first, with pinned topics after the others since
+    they are listed whatever their activity. Topics bumped after the range follow, those with the most posts in the
+    topic listing first as they are the most likely to still have some in range, then topics with no known bump time,
+    and finally topics bumped before the range.
+    """
+    update_time = topic.get_latest_update_time()
+    posts_count = topic.get_posts_count() or 0
+
+    if update_time is None:
+        return 3, 0, 0
+    if start is not None and update_time < start:
+        return 4, 0, -update_time.timestamp()
+    if end is not None and update_time >= end:
+        return 2, -posts_count, update_time.timestamp()
+    return 1 if topic.get_pinned() else 0, 0, -update_time.timestamp()
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def fill_topics(topics, progress_bar, site=None, tag=None, editors_since=None, end=None):
+    """
+    Download posts related to a list of topics and display progress if desired and available.
+
+    Topics are downloaded concurrently, up to the site's connection limit, with the main post editor lookups of each
+    topic queued along with the other topics' downloads. Downloads start with the topics most likely to have posts
+    within [editors_since, end), see get_topic_fetch_priority, so the most useful topics are fetched first if the run
+    deadline passes. Topics not yet downloaded by then are cancelled, and they and any topics whose download failed or
+    left out some of their posts are marked as not fetched.
+    """
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+    alive_bar = None
+    if progress_bar:
+        try:
+            from alive_progress import alive_bar  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            pass
+
+    topics = [topic for topic in topics if not tag or topic.has_tag(tag)]
+    if len(topics) == 0:
+        return
+
+    topics.sort(key=lambda topic: get_topic_fetch_priority(topic, editors_since, end))
+
+    with ThreadPoolExecutor(max_workers=dscfinder.get_client(site).get_max_connections()) as executor:
+        futures = {executor.submit(fill_topic, topic, site, editors_since): topic for topic in topics}
+        fetched_topics = set()
+
+        def wait_for_topics(on_topic_done):
+            try:
+                for future in as_completed(futures, timeout=dschttp.get_deadline().get_time_remaining()):
+                    try:
+                        if future.result():
+                            fetched_topics.add(futures[future])
+                        else:
+                            logging.debug("Some posts of topic %s were not downloaded", futures[future].get_id())
+                    except URLError as error:
+                        logging.debug("Failed to download topic %s: %s", futures[future].get_id(), error)
+                    on_topic_done()
+            except FuturesTimeoutError:
+                # the builtin TimeoutError is only the same class from Python 3.11
+                for future in futures:
+                    future.cancel()
+
+        if alive_bar is not None:
+            with alive_bar(len(topics), receipt=False) as bar_view:
+                wait_for_topics(bar_view)
+        else:
+            wait_for_topics(lambda: None)
+
+    num_unfetched = 0
+    for topic in topics:
+        if topic not in fetched_topics:
+            topic.set_fetch_failed(True)
+            num_unfetched += 1
+
+    if num_unfetched > 0:
+        logging.warning(
+            "%d of %d topics were not fetched%s and are marked with !",
+            num_unfetched,
+            len(topics),
+            " before the time limit" if dschttp.get_deadline().is_expired() else "",
+        )
+
+
+def is_topic_relevant(topic, start, tag=None):
+    """Check if a topic has the given tag, if any, and may contain posts created or updated on or after start."""
+    update_time = topic.get_latest_update_time()
+    return (not tag or topic.has_tag(tag)) and (update_time is None or update_time >= start)
+
+
+# pylint: disable=too-many-arguments
+def download_categories(category_names, start, progress_bar=False, site=None, tag=None, end=None, shard=None):
+    """
+    Download each category in a comma separated list along with its recently updated topics and their posts.
+
+    Topics most likely to have posts before end, if given, are downloaded first, see fill_topics. If shard is given
+    as an (index, count) pair, every topic is listed but only the posts of topics in that shard are downloaded.
+    """
+    for category_name in category_names.split(","):
+        category_name = category_name.strip()
+        category = dscfinder.get_category_by_name(category_name, site)
+
+        if category is None:
+            logging.warning("Unable to find category: %s", str(category_name))
+            continue
+
+        dscfinder.add_topics_to_category(category, start, site)
+        topics = category.get_topics()
+
+        if shard is not None:
+            from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+            topics = [topic for topic in topics if dscsnapshot.get_topic_shard(topic.get_id(), shard[1]) == shard[0]]
+
+        fill_topics(topics, progress_bar, site, tag, start, end)
+
+        yield category_name, category
+
+
+def load_categories_from_snapshot(snapshot_file, category_names, start, tag=None):
+    """Load each category in a comma separated list, or all if None, with its relevant topics from a snapshot file."""
+    from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+    return dscsnapshot.iter_snapshot_categories(
+        snapshot_file,
+        None if category_names is None else category_names.split(","),
+        lambda topic: is_topic_relevant(topic, start, tag),
+    )
+
+
+# pylint: disable=too-many-arguments
+def save_shard(shard_file, shard, category_names, date_ranges, progress_bar=False, site=None, tag=None):
+    """
+    Download one shard of the topics in a comma separated list of categories and save it to a file for 'merge'.
+
+    The shard is an (index, count) pair. The file is a snapshot of every listed topic, with posts for the shard's
+    topics only, and its header holds the shard, date ranges, and tag so the merged report matches a normal run.
+    """
+    from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+    header = {
+        "shard": list(shard),
+        "date_ranges": [[start.isoformat(), end.isoformat()] for start, end in date_ranges],
+        "tag": tag,
+    }
+    categories = download_categories(
+        category_names,
+        min(start for start, _ in date_ranges),
+        progress_bar,
+        site,
+        tag,
+        max(end for _, end in date_ranges),
+        shard,
+    )
+    dscsnapshot.write_snapshot(shard_file, categories, site, header)
+    logging.info("Shard %d/%d saved to %s", shard[0] + 1, shard[1], str(shard_file))
 
 
+def parse_shard(shard_str):
+    """Convert a shard argument of the form i/N, with i from 1 to N, to a 0-based (index, count) pair."""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    index_str, _, count_str = shard_str.partition("/")
+    if not index_str.isdigit() or not count_str.isdigit() or not 1 <= int(index_str) <= int(count_str):
+        raise argparse.ArgumentTypeError(f"invalid shard: {shard_str}, expected i/N with i from 1 to N")
+
+    return int(index_str) - 1, int(count_str)
+
+
+def create_snapshot(snapshot_file, category_names, since=None, progress_bar=False, site=None):
+    """Download categories with all topics updated since a given date, or ever, and save them to a snapshot file."""
+    from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+    def download_snapshot_categories():
+        for category_name in category_names.split(","):
+            category_name = category_name.strip()
+            category = dscfinder.get_category_by_name(category_name, site)
+
+            if category is None:
+                logging.warning("Unable to find category: %s", str(category_name))
+                continue
+
+            logging.info("Downloading the %s category", str(category_name))
+            dscfinder.add_topics_to_category(category, since, site)
+            fill_topics(category.get_topics(), progress_bar, site, editors_since=since)
+
+            yield category_name, category
+
+    dscsnapshot.write_snapshot(snapshot_file, download_snapshot_categories(), site)
+    logging.info("Snapshot saved to %s", str(snapshot_file))
+
+
+def create_date_ranges(date_ranges, per_day=False):
+    """
+    Validate a list of date range dictionaries with "start" and "end" keys and convert them to datetime pairs.
+
+    The end of each pair is exclusive, at the start of the day after the inclusive end date. If per_day is set then
+    each range is split into one range per day.
+    """
+    datetime_ranges = []
+
+    for date_range in date_ranges:
+        date_range["start"], date_range["end"] = parse_dates(date_range["start"], date_range["end"])
+        start = datetime.strptime(date_range["start"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        end = datetime.strptime(date_range["end"], "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+
+        if per_day:
+            while start < end:
+                datetime_ranges.append((start, start + timedelta(days=1)))
+                start += timedelta(days=1)
+        else:
+            datetime_ranges.append((start, end))
+
+    return datetime_ranges
+
+
+def get_pretty_date_range(start, end):
+    """Get readable inclusive start and end dates for a datetime range with an exclusive end."""
+    return start.strftime("%Y-%m-%d (%A)"), (end - timedelta(days=1)).strftime("%Y-%m-%d (%A)")
+
+
+# pylint: disable=too-many-locals
 def main(
     category_names,
     date_range=None,
@@ -429,44 +793,596 @@ def main(
     site=None,
     tag=None,
     log_stream=sys.stdout,
+    snapshot_file=None,
+    additional_date_ranges=None,
+    per_day=False,
+    additional_sites=None,
+    shard=None,
+    shard_file=None,
+    report_cache=None,
 ):
-    """Download contents of a given category or set of categories, find relevant posts, print them to console."""
+    """
+    Download contents of a given category or set of categories, find relevant posts, print them to console.
+
+    If a snapshot file is given then categories are loaded from it instead, with no network requests. In this case
+    category_names can be None to show every category in the snapshot.
+
+    Additional date ranges, or splitting every range per day, show a report for each range in turn. Everything is
+    downloaded once, back to the earliest start date, and each report is created from the same data.
+
+    Additional sites are given as a list of (site, comma separated category names) pairs. All sites are downloaded
+    concurrently, then shown one after another.
+
+    If a shard (index, count) pair is given then only that shard of the topics is downloaded, and it is saved to
+    shard_file instead of being shown, see save_shard and launch_merge.
+
+    If a dsccache.ReportCache is given then a report for a single date range and site is shown from it, downloading
+    and rendering only topics bumped since it was cached, see show_cached_report.
+    """
     logging.basicConfig(
         stream=log_stream,
         format="%(message)s",
         level=logging.DEBUG if debug else logging.INFO,
     )
 
-    date_range["start"], date_range["end"] = parse_dates(date_range["start"], date_range["end"])
-    start = datetime.strptime(date_range["start"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
-    end = datetime.strptime(date_range["end"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
-    pretty_start = start.strftime("%Y-%m-%d (%A)")
-    pretty_end = end.strftime("%Y-%m-%d (%A)")
-    end += timedelta(days=1)
+    date_ranges = create_date_ranges([date_range] + list(additional_date_ranges or []), per_day)
+    earliest_start = min(start for start, _ in date_ranges)
+    latest_end = max(end for _, end in date_ranges)
+
+    if shard is not None:
+        save_shard(shard_file, shard, category_names, date_ranges, progress_bar, site, tag)
+        return
+
+    # opening comments in a browser needs every topic's posts, so those runs are never served from the cache
+    if report_cache is not None and len(date_ranges) == 1 and not (snapshot_file or additional_sites or open_browser):
+        show_cached_report(report_cache, category_names, *date_ranges[0], progress_bar, shorten_links, site, tag)
+        return
+
+    if snapshot_file is not None:
+        from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+        site = dscsnapshot.read_snapshot_header(snapshot_file)["site"]
+        reports = [(site, load_categories_from_snapshot(snapshot_file, category_names, earliest_start, tag))]
+    elif not additional_sites:
+        reports = [(site, download_categories(category_names, earliest_start, progress_bar, site, tag, latest_end))]
+    else:
+        reports = download_sites([(site, category_names)] + list(additional_sites), earliest_start, tag, latest_end)
+
+    for report_site, categories in reports:
+        show_report(categories, date_ranges, open_browser, shorten_links, report_site, tag)
+
+
+def download_sites(site_categories, start, tag=None, end=None):
+    """
+    Download categories from several sites concurrently, each within its own connection and rate limits.
+
+    Takes a list of (site, comma separated category names) pairs, and yields (site, list of (name,
+    DiscourseCategory)) pairs in the same order, each once that site's categories have finished downloading.
+    """
+    from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    executor = ThreadPoolExecutor(max_workers=len(site_categories))
+    futures = [
+        executor.submit(lambda site, names: list(download_categories(names, start, False, site, tag, end)), site, names)
+        for site, names in site_categories
+    ]
+    executor.shutdown(wait=False)
 
-    show_top_header(pretty_start, pretty_end, site)
+    for (site, _), future in zip(site_categories, futures):
+        yield site, future.result()
+
+
+# pylint: disable=too-many-arguments
+def show_report(categories, date_ranges, open_browser=False, shorten_links=True, site=None, tag=None):
+    """Print relevant comments in a list of (name, DiscourseCategory) pairs for each (start, end) date range."""
+    # a single range is shown while categories download, multiple ranges need every category kept for each report
+    if len(date_ranges) > 1:
+        categories = list(categories)
+
+    for i, (start, end) in enumerate(date_ranges):
+        if i == 0:
+            show_top_header(*get_pretty_date_range(start, end), site)
+        else:
+            show_date_range_header(*get_pretty_date_range(start, end), site)
+
+        for category_name, category in categories:
+            show_category_header(category_name, tag)
+
+            with dscstats.get_stats().timer("render"):
+                print_comments(category, start, end, open_browser, shorten_links, site)
+
+
+def get_topic_bump_time_str(topic):
+    """Get the time a topic was last bumped as a string to compare with a cached report, or None if unknown."""
+    update_time = topic.get_latest_update_time()
+    return None if update_time is None else update_time.isoformat()
+
+
+def get_changed_topics(category, cached_category, start, site=None, tag=None):
+    """
+    Check only the first page of a category's topics for topics bumped since the category's report was cached.
+
+    Returns the relevant topics on the first page in listing order, along with those not in the cached report, bumped
+    since, or not fetched for it, see get_uncached_topics. Returns None if topics after the first page may also need
+    to be downloaded, which is when every unpinned topic on it was bumped after the newest topic listed for the cached
+    report, or a topic that was not fetched for it is not on the first page.
+    """
+    topics, next_page_url = dscfinder.get_topics_from_category_page(
+        dscfinder.get_first_category_page_url(category, site), site
+    )
+
+    update_times = [topic.get_latest_update_time() for topic in topics if not topic.get_pinned()]
+    watermark = cached_category["watermark"]
+    if next_page_url is not None and (
+        len(update_times) == 0 or update_times[-1] is None or update_times[-1] > datetime.fromisoformat(watermark)
+    ):
+        return None
+
+    # topics that were not fetched are cached without a bump time, and can only be downloaded again once listed
+    unfetched_topic_ids = {
+        topic_json["id"] for topic_json in cached_category["topics"] if topic_json["bumped_at"] is None
+    }
+    if next_page_url is not None and not unfetched_topic_ids <= {topic.get_id() for topic in topics}:
+        return None
+
+    listed_topics = [topic for topic in topics if is_topic_relevant(topic, start, tag)]
+    return listed_topics, get_uncached_topics(listed_topics, cached_category["topics"])
+
+
+def get_uncached_topics(topics, cached_topics):
+    """Get the topics in a list that are not in a cached report's topics, were bumped since, or were not fetched."""
+    cached_bump_times = {topic_json["id"]: topic_json["bumped_at"] for topic_json in cached_topics}
+    return [
+        topic
+        for topic in topics
+        if cached_bump_times.get(topic.get_id()) is None
+        or cached_bump_times[topic.get_id()] != get_topic_bump_time_str(topic)
+    ]
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def update_cached_category(
+    category_name, cached_category, start, end, progress_bar=False, shorten_links=True, site=None, tag=None
+):
+    """
+    Bring the cached report of a category for [start, end) up to date, or create it if cached_category is None.
+
+    Only topics bumped since the report was cached, or not fetched for it, are downloaded and rendered again, see
+    get_changed_topics. If they cannot all be found on the first page of topics, every page is listed to find them.
+    Returns the category's report, see dsccache.ReportCache, or None if the category cannot be found.
+    """
+    from .discourse_category import DiscourseCategory  # pylint: disable=import-outside-toplevel
+
+    first_page = None
+    if cached_category is not None:
+        category = DiscourseCategory(cached_category["category"])
+        first_page = get_changed_topics(category, cached_category, start, site, tag)
+    else:
+        category = dscfinder.get_category_by_name(category_name, site)
+        if category is None:
+            logging.warning("Unable to find category: %s", str(category_name))
+            return None
+
+    cached_topics = cached_category["topics"] if cached_category is not None else []
+    if first_page is None:
+        dscfinder.add_topics_to_category(category, start, site)
+        listed_topics = [topic for topic in category.get_topics() if not tag or topic.has_tag(tag)]
+        changed_topics = get_uncached_topics(listed_topics, cached_topics)
+        # every relevant topic is listed, so cached topics that are not have left the report
+        unlisted_cached_topics = []
+        watermark = None
+    else:
+        listed_topics, changed_topics = first_page
+        unlisted_cached_topics = cached_topics
+        watermark = cached_category["watermark"]
+
+    fill_topics(changed_topics, progress_bar, site, tag, start, end)
+
+    rendered_topics = {}
+    with dscstats.get_stats().timer("render"):
+        for topic in changed_topics:
+            rendered_topics[topic.get_id()] = {
+                "id": topic.get_id(),
+                "bumped_at": None if topic.get_fetch_failed() else get_topic_bump_time_str(topic),
+                "output": format_topic_comments(topic, start, end, shorten_links, site),
+            }
+
+    listed_topic_ids = {topic.get_id() for topic in listed_topics}
+    cached_topics_by_id = {topic_json["id"]: topic_json for topic_json in cached_topics}
+    topics_json = [
+        rendered_topics.get(topic.get_id()) or cached_topics_by_id[topic.get_id()] for topic in listed_topics
+    ] + [topic_json for topic_json in unlisted_cached_topics if topic_json["id"] not in listed_topic_ids]
+
+    # no topic after the first page of the listing was bumped after the newest topic the report has seen
+    update_times = [start.isoformat(), watermark] + [get_topic_bump_time_str(topic) for topic in listed_topics]
+    update_times = [datetime.fromisoformat(update_time) for update_time in update_times if update_time is not None]
+
+    return {
+        "name": category_name,
+        "category": category.to_json(),
+        "watermark": max(update_times).isoformat(),
+        "topics": topics_json,
+    }
+
+
+# pylint: disable=too-many-arguments
+def show_cached_report(
+    report_cache, category_names, start, end, progress_bar=False, shorten_links=True, site=None, tag=None
+):
+    """
+    Print relevant comments in each category of a comma separated list for [start, end), using a report cache.
+
+    Each category is shown from its cached report, after downloading and rendering only the topics bumped since it
+    was cached, see update_cached_category. The updated report is then saved to the cache.
+    """
+    from . import dsccache  # pylint: disable=import-outside-toplevel
+
+    key = dsccache.create_report_key(site, category_names, tag, start, end, shorten_links)
+    cached_categories = {
+        category_json["name"]: category_json
+        for category_json in (report_cache.get_report(key) or {"categories": []})["categories"]
+    }
+    report = {"categories": []}
+
+    show_top_header(*get_pretty_date_range(start, end), site)
 
+    for category_name in category_names.split(","):
+        category_name = category_name.strip()
+        category_report = update_cached_category(
+            category_name, cached_categories.get(category_name), start, end, progress_bar, shorten_links, site, tag
+        )
+
+        if category_report is not None:
+            show_category_header(category_name, tag)
+            sys.stdout.write("".join(topic_json["output"] for topic_json in category_report["topics"]))
+            report["categories"].append(category_report)
+
+    report_cache.set_report(key, report)
+    report_cache.save()
+
+
+def watch(
+    category_names,
+    interval,
+    since=None,
+    retention=dscwatch.DEFAULT_RETENTION,
+    shorten_links=True,
+    site=None,
+    tag=None,
+    max_polls=None,
+):
+    """
+    Poll categories every interval seconds, printing posts created or updated since the previous poll.
+
+    The first poll shows posts from since onwards, defaulting to when watching started. Polling continues until
+    interrupted, or max_polls polls have been made.
+    """
+    categories = []
     for category_name in category_names.split(","):
         category_name = category_name.strip()
         category = dscfinder.get_category_by_name(category_name, site)
 
         if category is None:
             logging.warning("Unable to find category: %s", str(category_name))
-            continue
+        else:
+            categories.append((category_name, category))
 
-        show_category_header(category_name, tag)
+    watcher = dscwatch.CategoryWatcher(categories, since or datetime.now(timezone.utc), retention, site, tag)
+    end = datetime.max.replace(tzinfo=timezone.utc)
+    num_polls = 0
 
-        dscfinder.add_topics_to_category(category, start, site)
-        fill_topics(category.get_topics(), progress_bar, site, tag)
+    logging.info("Watching for comments%s every %d seconds", f" on {site}" if site is not None else "", interval)
 
-        print_comments(category, start, end, open_browser, shorten_links, site)
+    while max_polls is None or num_polls < max_polls:
+        if num_polls > 0:
+            time.sleep(interval)
 
+        for category_name, category, start in watcher.poll():
+            show_category_header(category_name, tag)
+            print_comments(category, start, end, False, shorten_links, site)
 
-def launch():
-    """Launch discourse-triage via the command line with given arguments and active configuration."""
-    config = Config()
+        num_polls += 1
+
+
+def launch_watch(args):
+    """Watch categories for new comments using parsed command line arguments, until interrupted."""
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.DEBUG if args.debug else logging.INFO)
+
+    since = None
+    if args.start_date is not None:
+        since = datetime.strptime(parse_dates(args.start_date)[0], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+    try:
+        watch(
+            args.category_name,
+            args.watch_interval,
+            since,
+            timedelta(days=args.retention_days),
+            not args.fullurls,
+            args.site_url,
+            args.tag_name,
+        )
+    except KeyboardInterrupt:
+        pass
 
-    parser = argparse.ArgumentParser()
+
+def launch_snapshot(argv, config):
+    """Save categories to a snapshot file via the command line with given arguments and active configuration."""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="dsctriage snapshot",
+        description="Download categories with all of their topics and posts into a compressed snapshot file",
+    )
+    parser.add_argument("snapshot_file", help="file to save the snapshot to (e.g. server.jsonl.gz)")
+    parser.add_argument(
+        "--since",
+        dest="since_date",
+        default=None,
+        help="only include topics updated on or after this date (e.g. 2022-04-13)",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="debug output")
+    parser.add_argument(
+        "-s",
+        "--site",
+        dest="site_url",
+        default=config.site,
+        help="The discourse website or server to download categories from",
+    )
+    parser.add_argument(
+        "-c",
+        "--category",
+        dest="category_name",
+        default=config.category,
+        help="Comma separated list of discourse categories or subcategories to download",
+    )
+    parser.add_argument(
+        "--index",
+        dest="index_file",
+        default=config.index,
+        help="Also add every downloaded post to this local search index, see 'dsctriage search'",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.DEBUG if args.debug else logging.INFO)
+
+    since = None
+    if args.since_date is not None:
+        since = datetime.strptime(args.since_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+    post_index = open_post_index(args.index_file, [args.site_url]) if args.index_file else None
+
+    try:
+        create_snapshot(args.snapshot_file, args.category_name, since, config.progress_bar, args.site_url)
+    finally:
+        if post_index is not None:
+            post_index.close()
+
+
+def launch_search(argv, config):
+    """Search posts in the local index via the command line with given arguments and active configuration."""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="dsctriage search",
+        description="Find downloaded posts containing every search term in the local index, without going online",
+    )
+    parser.add_argument("terms", nargs="+", help="words or phrases that matching posts must all contain")
+    parser.add_argument(
+        "--index",
+        dest="index_file",
+        default=config.index,
+        help="local search index filled by downloads run with --index",
+    )
+    parser.add_argument(
+        "--since",
+        dest="since_date",
+        default=None,
+        help="only include posts created or updated on or after this date (e.g. 2022-04-13)",
+    )
+    parser.add_argument(
+        "--until",
+        dest="until_date",
+        default=None,
+        help="only include posts created or updated on or before this date (e.g. 2022-04-27)",
+    )
+    parser.add_argument(
+        "-s",
+        "--site",
+        dest="site_url",
+        default=None,
+        help="only include posts from this discourse website or server",
+    )
+    parser.add_argument("-n", "--limit", type=int, default=None, help="maximum number of posts to show")
+    args = parser.parse_args(argv)
+
+    if not args.index_file:
+        parser.error("an index file is required, set one with --index or the index configuration option")
+
+    start = None
+    if args.since_date is not None:
+        start = datetime.strptime(args.since_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+    end = None
+    if args.until_date is not None:
+        end = datetime.strptime(args.until_date, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+
+    search_post_index(args.index_file, args.terms, start, end, args.site_url, args.limit)
+
+
+def launch_merge(argv, config):
+    """Show the report of shard files saved with --shard via the command line with given arguments and configuration."""
+    import argparse  # pylint: disable=import-outside-toplevel
+    from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="dsctriage merge",
+        description="Combine the shard files of a run split with --shard into one report, in the normal order",
+    )
+    parser.add_argument("shard_files", nargs="+", help="shard files to combine (e.g. shard-*-of-4.jsonl.gz)")
+    parser.add_argument("-d", "--debug", action="store_true", help="debug output")
+    parser.add_argument(
+        "--fullurls",
+        default=not config.shorten_links,
+        action="store_true",
+        help="show full URLs instead of shortcuts",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.DEBUG if args.debug else logging.INFO)
+
+    try:
+        header, categories = dscsnapshot.merge_shards(args.shard_files)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    date_ranges = [
+        (datetime.fromisoformat(start_str), datetime.fromisoformat(end_str))
+        for start_str, end_str in header["date_ranges"]
+    ]
+    show_report(categories, date_ranges, False, not args.fullurls, header["site"], header.get("tag"))
+
+
+def launch_listen(argv, config):
+    """Receive Discourse webhooks into a snapshot file via the command line with given arguments and configuration."""
+    import argparse  # pylint: disable=import-outside-toplevel
+    from . import dscwebhook  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="dsctriage listen",
+        description="Receive Discourse post and topic webhooks, keeping an always-current snapshot file that can be "
+        + "read with --from-snapshot",
+    )
+    parser.add_argument("snapshot_file", help="file to keep the snapshot in (e.g. webhooks.jsonl.gz)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument(
+        "--secret",
+        default=os.environ.get("DSCTRIAGE_WEBHOOK_SECRET"),
+        help="webhook secret used to verify signatures, defaults to the DSCTRIAGE_WEBHOOK_SECRET environment variable",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="debug output")
+    parser.add_argument(
+        "-s",
+        "--site",
+        dest="site_url",
+        default=config.site,
+        help="The discourse website or server sending webhooks, used to look up category names",
+    )
+    args = parser.parse_args(argv)
+
+    if not args.secret:
+        parser.error("a webhook secret is required")
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.DEBUG if args.debug else logging.INFO)
+
+    state = dscwebhook.WebhookState(args.site_url, resolve_category_names=True)
+    if os.path.exists(args.snapshot_file):
+        state.load(args.snapshot_file)
+
+    server = dscwebhook.WebhookServer((args.host, args.port), args.secret, state, args.snapshot_file)
+    logging.info("Listening for webhooks on %s:%d", args.host, server.server_address[1])
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.save_state()
+
+
+def show_activity_stats(categories, start, end, top=10, site=None):
+    """Print post activity analytics for every post in a list of (name, DiscourseCategory) pairs within [start, end)."""
+    from . import dscanalytics  # pylint: disable=import-outside-toplevel
+
+    activity = dscanalytics.PostActivity()
+    activity.add_categories(categories)
+
+    activity_stats = dscanalytics.compute_activity_stats(activity, start, end)
+
+    logging.info(
+        "Activity%s between %s and %s inclusive, from %d posts",
+        f" on {site}" if site is not None else "",
+        *get_pretty_date_range(start, end),
+        len(activity),
+    )
+    print(activity_stats.format_report(top))
+
+
+def launch_stats(argv, config):
+    """Show post activity analytics via the command line with given arguments and active configuration."""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="dsctriage stats",
+        description="Count new and updated posts by author, topic, and day, and show how quickly topics are answered",
+    )
+    parser.add_argument("start_date", nargs="?", help="date or day name to start from (e.g. 2022-04-13, monday)")
+    parser.add_argument("end_date", nargs="?", help="date to end at (inclusive) (e.g. 2022-07-13)")
+    parser.add_argument("-d", "--debug", action="store_true", help="debug output")
+    parser.add_argument(
+        "-s",
+        "--site",
+        dest="site_url",
+        default=config.site,
+        help="The discourse website or server to download categories from",
+    )
+    parser.add_argument(
+        "-c",
+        "--category",
+        dest="category_name",
+        default=None,
+        help="Comma separated list of discourse categories or subcategories to count posts in",
+    )
+    parser.add_argument("-t", "--tag", dest="tag_name", default=None, help="Only count topics that have this tag")
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=10,
+        help="number of contributors and topics to show",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        dest="snapshot_file",
+        default=None,
+        help="Count posts in a file saved with 'dsctriage snapshot' instead of downloading them",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stdout, format="%(message)s", level=logging.DEBUG if args.debug else logging.INFO)
+
+    start, end = create_date_ranges([{"start": args.start_date, "end": args.end_date}])[0]
+
+    if args.snapshot_file is not None:
+        from . import dscsnapshot  # pylint: disable=import-outside-toplevel
+
+        site = dscsnapshot.read_snapshot_header(args.snapshot_file)["site"]
+        categories = load_categories_from_snapshot(args.snapshot_file, args.category_name, start, args.tag_name)
+    else:
+        site = args.site_url
+        categories = download_categories(
+            args.category_name or config.category, start, config.progress_bar, site, args.tag_name, end
+        )
+
+    show_activity_stats(categories, start, end, args.top, site)
+
+
+SUBCOMMANDS = {
+    "snapshot": launch_snapshot,
+    "listen": launch_listen,
+    "merge": launch_merge,
+    "search": launch_search,
+    "stats": launch_stats,
+}
+
+
+def create_parser(config):
+    """Create the command line argument parser for finding comments, using the active configuration for defaults."""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(epilog=f"Additional commands: {', '.join(SUBCOMMANDS)}")
     parser.add_argument(
         "start_date",
         nargs="?",
@@ -477,6 +1393,21 @@ def launch():
         nargs="?",
         help="date to end finding comments (inclusive) " + "(e.g. 2022-04-27)",
     )
+    parser.add_argument(
+        "-r",
+        "--range",
+        dest="date_ranges",
+        action="append",
+        default=[],
+        help="additional date or day name, or start:end dates, to report on from the same download "
+        + "(e.g. 2022-04-14, 2022-04-18:2022-04-20)",
+    )
+    parser.add_argument(
+        "--per-day",
+        dest="per_day",
+        action="store_true",
+        help="split every date range into a separate report for each day",
+    )
     parser.add_argument("-d", "--debug", action="store_true", help="debug output")
     parser.add_argument(
         "-o",
@@ -495,15 +1426,81 @@ def launch():
     parser.add_argument(
         "-s",
         "--site",
-        dest="site_url",
-        default=config.site,
-        help="The discourse website or server to find comments from",
+        dest="site_urls",
+        action="append",
+        default=[],
+        help="The discourse website or server to find comments from, can be given multiple times with an optional "
+        + "=category list for each (e.g. https://discourse.ubuntu.com=project/server)",
+    )
+    parser.add_argument(
+        "--max-connections",
+        dest="max_connections",
+        type=int,
+        default=dschttp.DEFAULT_MAX_CONNECTIONS,
+        help="Maximum number of concurrent connections to each site",
+    )
+    parser.add_argument(
+        "--rate",
+        dest="requests_per_second",
+        type=float,
+        default=None,
+        help="Maximum number of requests per second to each site",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=dschttp.DEFAULT_TIMEOUT,
+        help="Number of seconds to wait for each request before retrying it",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=dschttp.DEFAULT_RETRIES,
+        help="Number of times to retry requests that time out, fail to connect, or find the site busy",
+    )
+    parser.add_argument(
+        "--hedge",
+        dest="hedge_percentile",
+        type=float,
+        nargs="?",
+        const=dschttp.DEFAULT_HEDGE_PERCENTILE,
+        default=None,
+        help="Send a duplicate of requests slower than this percentile of recent ones, default %(const)s, and use the "
+        + "first response, adding at most 10%% more requests",
+    )
+    parser.add_argument(
+        "--max-time",
+        dest="max_time",
+        type=float,
+        default=None,
+        help="Stop downloading after this many seconds and show what was found, marking topics not fetched with !",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Download only shard i of N of the topics, split by topic id, and save it for 'dsctriage merge', e.g. 2/4",
+    )
+    parser.add_argument(
+        "--shard-file",
+        dest="shard_file",
+        default=None,
+        help="File to save the shard to, shard-i-of-N.jsonl.gz by default",
+    )
+    parser.add_argument(
+        "--parse-processes",
+        dest="parse_processes",
+        type=int,
+        nargs="?",
+        const=0,
+        default=None,
+        help="Decode large topic downloads in this many worker processes, default one per core",
     )
     parser.add_argument(
         "-c",
         "--category",
         dest="category_name",
-        default=config.category,
+        default=None,
         help="Comma separated list of discourse categories or subcategories to find comments from",
     )
 
@@ -512,8 +1509,10 @@ def launch():
     parser.add_argument(
         "-b",
         "--backlog",
-        dest="backlog_post_id",
-        help="Display a post of a given ID in a standard backlog format",
+        dest="backlog_post_ids",
+        nargs="+",
+        default=None,
+        help="Display posts of the given IDs in a standard backlog format, use - to read IDs from stdin",
     )
     parser.add_argument(
         "--set-defaults",
@@ -521,19 +1520,147 @@ def launch():
         action="store_true",
         help="Update the default configuration to use the provided site and category",
     )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Show a summary of requests made to each Discourse endpoint and time spent parsing and rendering",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_dir",
+        default=None,
+        help="Profile the run, writing pstats, memory allocation, and hot function reports to this directory",
+    )
+    parser.add_argument(
+        "--from-snapshot",
+        dest="snapshot_file",
+        default=None,
+        help="Find comments in a file saved with 'dsctriage snapshot' instead of downloading them",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch_interval",
+        type=int,
+        default=None,
+        help="Keep running, checking for new comments every WATCH_INTERVAL seconds",
+    )
+    parser.add_argument(
+        "--retention",
+        dest="retention_days",
+        type=int,
+        default=dscwatch.DEFAULT_RETENTION.days,
+        help="Number of days without updates before a topic is no longer kept in memory when watching",
+    )
+    parser.add_argument(
+        "--index",
+        dest="index_file",
+        default=config.index,
+        help="Add every downloaded post to this local search index, see 'dsctriage search'",
+    )
+    parser.add_argument(
+        "--relevant-posts-only",
+        dest="relevant_posts_only",
+        action="store_true",
+        help="Keep only the posts changed within the dates, the posts they reply to, and main posts of each topic, "
+        + "for long topics",
+    )
+    parser.add_argument(
+        "--trace",
+        dest="trace_file",
+        default=None,
+        help="Write a timeline of requests, decoding, and rendering to this file in Chrome Trace Event format",
+    )
+    parser.add_argument(
+        "--cache",
+        dest="cache_file",
+        default=config.cache,
+        help="Keep reports in this file, so running the same report again only downloads topics bumped since",
+    )
+
+    return parser
+
+
+# pylint: disable=too-many-branches
+def launch():
+    """Launch discourse-triage via the command line with given arguments and active configuration."""
+    config = Config()
+
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:], config)
+
+    parser = create_parser(config)
     args = parser.parse_args()
 
+    if args.category_name is None and args.snapshot_file is None:
+        args.category_name = config.category
+
+    # the first site is the main one, any others are shown after it with their own categories if given
+    sites = []
+    for site_str in args.site_urls or [config.site]:
+        site_url, _, site_category_names = site_str.partition("=")
+        sites.append((site_url, site_category_names or args.category_name))
+        dschttp.set_site_limits(site_url, args.max_connections, args.requests_per_second, args.timeout, args.retries)
+        dschttp.set_site_hedging(site_url, args.hedge_percentile)
+        dscfinder.get_client(site_url).set_relevant_posts_only(args.relevant_posts_only)
+
+    args.site_url, args.category_name = sites[0]
+
+    if args.shard is not None:
+        if len(sites) > 1 or args.snapshot_file is not None or args.backlog_post_ids or args.watch_interval:
+            parser.error("--shard only splits a report downloaded from a single site")
+        if args.shard_file is None:
+            args.shard_file = f"shard-{args.shard[0] + 1}-of-{args.shard[1]}.jsonl.gz"
+
     if args.set_defaults:
         config.site = args.site_url
-        config.category = args.category_name
+        config.category = args.category_name or config.category
         config.save()
 
     date_range = {"start": args.start_date, "end": args.end_date}
+    additional_date_ranges = []
+    for range_str in args.date_ranges:
+        range_start, _, range_end = range_str.partition(":")
+        additional_date_ranges.append({"start": range_start, "end": range_end or None})
+
+    if args.start_date is None and len(additional_date_ranges) > 0:
+        date_range = additional_date_ranges.pop(0)
+
+    dschttp.get_deadline().set(args.max_time)
+
+    post_index = None
+    if args.index_file and args.snapshot_file is None:
+        post_index = open_post_index(args.index_file, [site_url for site_url, _ in sites])
+
+    parse_pool = None
+    if args.parse_processes is not None and args.snapshot_file is None:
+        parse_pool = open_parse_pool(args.parse_processes, [site_url for site_url, _ in sites])
+
+    if args.trace_file:
+        dsctrace.get_trace().start()
+
+    try:
+        run_command(args, config, date_range, additional_date_ranges, sites)
+    finally:
+        if post_index is not None:
+            post_index.close()
+        if parse_pool is not None:
+            parse_pool.close()
+        if args.trace_file:
+            dsctrace.get_trace().stop()
+            dsctrace.get_trace().write(args.trace_file)
+
+    return None
 
-    if args.backlog_post_id:
-        print_post_in_backlog_format(args.backlog_post_id, args.site_url)
+
+# pylint: disable=too-many-arguments
+def run_command(args, config, date_range, additional_date_ranges, sites):
+    """Run the backlog, watch, or report command chosen by the parsed command line arguments."""
+    if args.backlog_post_ids:
+        print_posts_in_backlog_format(read_backlog_post_ids(args.backlog_post_ids), args.site_url)
+    elif args.watch_interval:
+        launch_watch(args)
     else:
-        main(
+        main_args = (
             args.category_name,
             date_range,
             args.debug,
@@ -543,3 +1670,27 @@ def launch():
             args.site_url,
             args.tag_name,
         )
+
+        main_kwargs = {
+            "snapshot_file": args.snapshot_file,
+            "additional_date_ranges": additional_date_ranges,
+            "per_day": args.per_day,
+            "additional_sites": sites[1:],
+            "shard": args.shard,
+            "shard_file": args.shard_file,
+        }
+
+        if args.cache_file:
+            from . import dsccache  # pylint: disable=import-outside-toplevel
+
+            main_kwargs["report_cache"] = dsccache.ReportCache(args.cache_file)
+
+        if args.profile_dir:
+            from . import dscprofile  # pylint: disable=import-outside-toplevel
+
+            dscprofile.run_profiled(args.profile_dir, main, *main_args, **main_kwargs)
+        else:
+            main(*main_args, **main_kwargs)
+
+    if args.stats:
+        print(dscstats.get_stats().format_table())
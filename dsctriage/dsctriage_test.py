@@ -1,10 +1,25 @@
 """Test discourse-triage modules with pytest."""
 
+# pylint: disable=too-many-lines
+
 import datetime
+import io
 import json
+import pstats
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
 import pytest
 
-from dsctriage import DiscoursePost, DiscourseTopic, DiscourseCategory, dscfinder
+from dsctriage import DiscoursePost, DiscourseTopic, DiscourseCategory
+from dsctriage import dscanalytics, dscbenchmark, dsccache, dscfinder, dschttp, dscindex, dscjson, dscparse
+from dsctriage import dscprofile, dscsnapshot, dscstats, dsctrace, dsctriage, dscwatch, dscwebhook
 
 
 EXAMPLE_USER_STRING = (
@@ -102,6 +117,60 @@ EXAMPLE_SUBCATEGORY_SET_STRING = (
 )
 
 
+class FakeDiscourseHandler(BaseHTTPRequestHandler):
+    """Serve canned JSON responses for Discourse API paths registered on the server, keeping connections alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Respond with the registered JSON for the requested path, or a 404, after any delay registered for it.
+
+        A list of responses or delays is given out in turn, repeating the last.
+        """
+        self.server.requested_paths.append(self.path)
+        self.server.client_addresses.add(self.client_address)
+        response = self.server.responses.get(self.path, (404, {"errors": ["not found"]}))
+        if isinstance(response, list):
+            response = response.pop(0) if len(response) > 1 else response[0]
+        status, body = response
+        delay = self.server.delays.get(self.path, 0)
+        if isinstance(delay, list):
+            delay = delay.pop(0) if len(delay) > 1 else delay[0]
+        time.sleep(delay)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep test output clean."""
+
+
+def start_fake_discourse_server():
+    """Start a local stand-in Discourse server in a thread, with its base URL set as site_url."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDiscourseHandler)
+    server.responses = {}
+    server.delays = {}
+    server.requested_paths = []
+    server.client_addresses = set()
+    server.site_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture(name="discourse_server")
+def fixture_discourse_server():
+    """Run a local stand-in Discourse server for the duration of a test."""
+    server = start_fake_discourse_server()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 # pylint: disable=too-many-arguments
 @pytest.mark.parametrize(
     "post_id, name, username, data, post_number, created, updated, rep_cnt, rep_to, post_string",
@@ -404,3 +473,1318 @@ def test_add_topics_to_category():
 def test_dscfinder_create_url(url_out, template, id_var, site):
     """Test that dscfinder creates urls correctly."""
     assert url_out == dscfinder.create_url(template, id_var, site)
+
+
+def test_run_stats_records_requests_and_timings():
+    """Test that RunStats groups requests by endpoint template and accumulates named timings."""
+    stats = dscstats.RunStats()
+    stats.record_request(dscfinder.POST_JSON_URL, 0.01, 100)
+    stats.record_request(dscfinder.POST_JSON_URL, 0.3, 50, error=True)
+    stats.record_request(dscfinder.USER_JSON_URL, 20, 10)
+    stats.add_time("render", 0.5)
+
+    post_stats = stats.get_endpoint_stats(dscfinder.POST_JSON_URL)
+    assert post_stats.requests == 2
+    assert post_stats.errors == 1
+    assert post_stats.bytes == 150
+    assert post_stats.histogram[0] == 1
+    assert post_stats.histogram[3] == 1
+    assert stats.get_endpoint_stats(dscfinder.USER_JSON_URL).histogram[-1] == 1
+    assert stats.get_endpoint_stats(dscfinder.TOPIC_POST_LIST_JSON_URL) is None
+
+    stats_dict = stats.as_dict()
+    assert stats_dict["endpoints"][dscfinder.POST_JSON_URL]["requests"] == 2
+    assert stats_dict["timings"]["render"]["count"] == 1
+
+    table = stats.format_table()
+    assert "/posts/#id.json" in table
+    assert "Render time: 0.50s over 1 call" in table
+
+    stats.reset()
+    assert not stats.get_endpoints()
+
+
+def test_dscfinder_records_request_stats(discourse_server):
+    """Test that downloads through dscfinder are recorded per endpoint template."""
+    discourse_server.responses["/posts/10.json"] = (200, json.loads(EXAMPLE_USER_STRING))
+    dscstats.get_stats().reset()
+
+    assert dscfinder.get_post_by_id(10, discourse_server.site_url).get_id() == 4592175
+    assert dscfinder.get_post_by_id(11, discourse_server.site_url) is None
+
+    post_stats = dscstats.get_stats().get_endpoint_stats(dscfinder.POST_JSON_URL)
+    assert post_stats.requests == 2
+    assert post_stats.errors == 1
+    assert post_stats.bytes > 0
+    assert dscstats.get_stats().as_dict()["timings"]["parse"]["count"] == 1
+
+    with pytest.raises(HTTPError):
+        dschttp.get_json_from_url(f"{discourse_server.site_url}/missing.json", dscfinder.POST_JSON_URL)
+
+
+def test_run_profiled_writes_reports(tmp_path):
+    """Test that a profiled run writes pstats, allocation, and hot function reports and returns the result."""
+
+    def create_posts():
+        return [DiscoursePost(json.loads(EXAMPLE_USER_STRING)) for _ in range(100)]
+
+    posts = dscprofile.run_profiled(tmp_path / "profile", create_posts, top=5)
+    assert len(posts) == 100
+
+    assert (tmp_path / "profile" / dscprofile.PSTATS_FILENAME).stat().st_size > 0
+    assert "discourse_post" in (tmp_path / "profile" / dscprofile.ALLOCATIONS_FILENAME).read_text(encoding="utf-8")
+    assert "create_posts" in (tmp_path / "profile" / dscprofile.HOT_FUNCTIONS_FILENAME).read_text(encoding="utf-8")
+
+
+def test_run_profiled_includes_worker_threads(tmp_path):
+    """Test that functions run in worker threads started during a profiled run show up in its reports."""
+
+    def create_posts_in_worker():
+        return [DiscoursePost(json.loads(EXAMPLE_USER_STRING)) for _ in range(100)]
+
+    def create_posts_in_workers():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return [post for posts in executor.map(lambda _: create_posts_in_worker(), range(2)) for post in posts]
+
+    posts = dscprofile.run_profiled(tmp_path / "profile", create_posts_in_workers, top=50)
+    assert len(posts) == 200
+
+    hot_functions = (tmp_path / "profile" / dscprofile.HOT_FUNCTIONS_FILENAME).read_text(encoding="utf-8")
+    assert "create_posts_in_worker)" in hot_functions
+    stats = pstats.Stats(str(tmp_path / "profile" / dscprofile.PSTATS_FILENAME))
+    assert any(function_name == "create_posts_in_worker" for _, _, function_name in stats.stats)
+
+
+def create_test_category():
+    """Create a category containing the example topics, with example posts in the first one."""
+    category = DiscourseCategory(json.loads(EXAMPLE_SUBCATEGORY_SET_STRING))
+    topic = DiscourseTopic(json.loads(EXAMPLE_TOPIC_STRING))
+    main_post = json.loads(EXAMPLE_USER_STRING)
+    main_post.update(
+        {"id": 4592174, "post_number": 1, "reply_to_post_number": None, "updated_at": "2022-05-16T13:59:43.661Z"}
+    )
+    topic.add_post(DiscoursePost(main_post))
+    topic.add_post(DiscoursePost(json.loads(EXAMPLE_USER_STRING)))
+    category.add_topic(topic)
+    category.add_topic(DiscourseTopic(json.loads(EXAMPLE_TOPIC_STRING_WITH_TAGS)))
+    return category
+
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that categories written to a snapshot are loaded back with their topics and posts."""
+    snapshot_file = tmp_path / "snapshot.jsonl.gz"
+    dscsnapshot.write_snapshot(snapshot_file, [("kubernetes", create_test_category())], "https://test")
+
+    assert dscsnapshot.read_snapshot_header(snapshot_file)["site"] == "https://test"
+
+    loaded = list(dscsnapshot.iter_snapshot_categories(snapshot_file))
+    assert len(loaded) == 1
+    category_name, category = loaded[0]
+    assert category_name == "kubernetes"
+    assert category.get_name() == "General Discussions"
+    assert category.get_subcategory_by_name("microk8s").get_id() == 26
+
+    topics = category.get_topics()
+    assert [topic.get_id() for topic in topics] == [11522, 10648]
+    assert topics[0].get_latest_update_time() == datetime.datetime(
+        2022, 6, 13, 17, 56, 31, 210000, tzinfo=datetime.timezone.utc
+    )
+    assert topics[1].get_tags() == ["k8s", "mongodb", "doc", "charmed-mongodb"]
+
+    posts = topics[0].get_posts()
+    assert [post.get_post_number() for post in posts] == [1, 2]
+    assert posts[1].get_update_time() == datetime.datetime(
+        2022, 5, 19, 15, 32, 33, 361000, tzinfo=datetime.timezone.utc
+    )
+    assert posts[1].get_reply_to_number() == 1
+
+    filtered = list(
+        dscsnapshot.iter_snapshot_categories(snapshot_file, ["General-Discussions"], lambda topic: topic.has_tag("k8s"))
+    )
+    assert [topic.get_id() for topic in filtered[0][1].get_topics()] == [10648]
+    assert not list(dscsnapshot.iter_snapshot_categories(snapshot_file, ["other"]))
+
+
+def test_main_from_snapshot(tmp_path, capsys):
+    """Test that main finds relevant posts in a snapshot file."""
+    snapshot_file = tmp_path / "snapshot.jsonl.gz"
+    dscsnapshot.write_snapshot(snapshot_file, [("kubernetes", create_test_category())], "https://test")
+
+    dsctriage.main(None, {"start": "2022-05-16", "end": "2022-05-19"}, shorten_links=False, snapshot_file=snapshot_file)
+
+    output = capsys.readouterr().out
+    assert "Virtualization - libvirt" in output
+    assert "*4592175 [User Name, 2022-05-19] (https://test/t/11522/2)" in output
+    assert "Charmed MongoDB" not in output
+
+
+def register_test_category(server):
+    """Register responses on a stand-in server for a category with two topics, the first containing two posts."""
+    category = create_test_category()
+    topics = category.get_topics()
+    server.responses["/categories.json?include_subcategories=true"] = (
+        200,
+        {"category_list": {"categories": [json.loads(EXAMPLE_SUBCATEGORY_SET_STRING)]}},
+    )
+    server.responses["/c/6.json?state=muted"] = (
+        200,
+        {"topic_list": {"topics": [json.loads(EXAMPLE_TOPIC_STRING), json.loads(EXAMPLE_TOPIC_STRING_WITH_TAGS)]}},
+    )
+    for topic in topics:
+        server.responses[f"/t/{topic.get_id()}.json"] = (
+            200,
+            {
+                "post_stream": {
+                    "posts": [post.to_json() for post in topic.get_posts()],
+                    "stream": [post.get_id() for post in topic.get_posts()],
+                }
+            },
+        )
+    return category
+
+
+def test_create_snapshot(discourse_server, tmp_path):
+    """Test that a snapshot downloaded from a site is saved with all topics and posts of a category."""
+    register_test_category(discourse_server)
+    _, topic_json = discourse_server.responses["/t/11522.json"]
+    topic_json["post_stream"]["posts"][0]["updated_at"] = "2022-05-17T10:00:00+00:00"
+    discourse_server.responses["/posts/4592174/revisions/latest.json"] = (200, {"username": "editor1"})
+    discourse_server.responses["/u/editor1.json"] = (200, {"user": {"name": "Editor Name"}})
+    snapshot_file = tmp_path / "snapshot.jsonl.gz"
+
+    dsctriage.create_snapshot(snapshot_file, "general discussions", site=discourse_server.site_url)
+
+    loaded = list(dscsnapshot.iter_snapshot_categories(snapshot_file))
+    assert loaded[0][0] == "general discussions"
+    assert [len(topic.get_posts()) for topic in loaded[0][1].get_topics()] == [2, 0]
+    assert loaded[0][1].get_topics()[0].get_posts()[0].get_editor_name() == "Editor Name"
+    assert dscsnapshot.read_snapshot_header(snapshot_file)["site"] == discourse_server.site_url
+
+
+def test_create_date_ranges():
+    """Test that date ranges are converted to datetimes with an exclusive end and split per day if requested."""
+    utc = datetime.timezone.utc
+    ranges = dsctriage.create_date_ranges(
+        [{"start": "2022-05-16", "end": "2022-05-18"}, {"start": "2022-06-01", "end": None}]
+    )
+    assert ranges == [
+        (datetime.datetime(2022, 5, 16, tzinfo=utc), datetime.datetime(2022, 5, 19, tzinfo=utc)),
+        (datetime.datetime(2022, 6, 1, tzinfo=utc), datetime.datetime(2022, 6, 2, tzinfo=utc)),
+    ]
+
+    per_day_ranges = dsctriage.create_date_ranges([{"start": "2022-05-16", "end": "2022-05-18"}], per_day=True)
+    assert [start.day for start, _ in per_day_ranges] == [16, 17, 18]
+    assert all(end - start == datetime.timedelta(days=1) for start, end in per_day_ranges)
+
+
+def test_main_multiple_date_ranges_single_download(discourse_server, capsys):
+    """Test that reports for several date ranges are created from a single download."""
+    register_test_category(discourse_server)
+
+    dsctriage.main(
+        "general discussions",
+        {"start": "2022-05-16", "end": None},
+        shorten_links=False,
+        site=discourse_server.site_url,
+        additional_date_ranges=[{"start": "2022-05-19", "end": None}],
+    )
+
+    output = capsys.readouterr().out
+    assert "+4592175 [User Name, 2022-05-16]" in output
+    assert "*4592175 [User Name, 2022-05-19]" in output
+    assert output.index("+4592175") < output.index("*4592175")
+    assert discourse_server.requested_paths.count("/t/11522.json") == 1
+
+
+def test_category_watcher_polls_incrementally(discourse_server):
+    """Test that the watcher only downloads bumped topics and posts, and evicts topics outside its retention."""
+    utc = datetime.timezone.utc
+    category = register_test_category(discourse_server)
+    since = datetime.datetime(2022, 6, 1, tzinfo=utc)
+    watcher = dscwatch.CategoryWatcher(
+        [("discussions", category)], since, datetime.timedelta(days=3), discourse_server.site_url
+    )
+
+    updates = watcher.poll(now=datetime.datetime(2022, 6, 14, tzinfo=utc))
+    assert [topic.get_id() for topic in updates[0][1].get_topics()] == [11522, 10648]
+    assert updates[0][2] == since
+    assert discourse_server.requested_paths.count("/t/11522.json") == 1
+
+    assert not watcher.poll(now=datetime.datetime(2022, 6, 14, tzinfo=utc))
+    assert discourse_server.requested_paths.count("/t/11522.json") == 1
+
+    # bump the first topic with a new reply, only sending the main post along with the topic
+    bumped_topic = json.loads(EXAMPLE_TOPIC_STRING)
+    bumped_topic["bumped_at"] = bumped_topic["last_posted_at"] = "2023-06-01T10:00:00.000Z"
+    new_reply = json.loads(EXAMPLE_USER_STRING)
+    new_reply.update({"id": 4592176, "post_number": 3, "created_at": "2023-06-01T10:00:00.000Z"})
+    new_reply["updated_at"] = new_reply["created_at"]
+    posts = category.get_topics()[0].get_posts()
+    discourse_server.responses["/c/6.json?state=muted"] = (
+        200,
+        {"topic_list": {"topics": [bumped_topic, json.loads(EXAMPLE_TOPIC_STRING_WITH_TAGS)]}},
+    )
+    discourse_server.responses["/t/11522.json"] = (
+        200,
+        {"post_stream": {"posts": [posts[0].to_json()], "stream": [4592174, 4592175, 4592176]}},
+    )
+    known_main_post = watcher.get_topics(category)[0].get_posts()[0]
+    edited_reply = posts[1].to_json()
+    edited_reply["updated_at"] = "2023-06-01T09:00:00.000Z"
+    discourse_server.responses[dscfinder.create_post_batch_url(11522, [4592175, 4592176], "")] = (
+        200,
+        {"post_stream": {"posts": [edited_reply, new_reply]}},
+    )
+
+    updates = watcher.poll(now=datetime.datetime(2023, 6, 2, tzinfo=utc))
+    updated_topics = updates[0][1].get_topics()
+    assert [topic.get_id() for topic in updated_topics] == [11522]
+    assert [post.get_id() for post in updated_topics[0].get_posts()] == [4592174, 4592175, 4592176]
+    assert updated_topics[0].get_posts()[0] is known_main_post
+    assert updated_topics[0].get_posts()[1].get_update_time() == datetime.datetime(2023, 6, 1, 9, tzinfo=utc)
+    assert updates[0][2] == datetime.datetime(2023, 5, 25, 10, 13, 7, 753001, tzinfo=utc)
+    assert [topic.get_id() for topic in watcher.get_topics(category)] == [11522]
+
+
+EXAMPLE_WEBHOOK_TOPIC_STRING = (
+    '{"topic":{"tags":["lxd"],"id":11600,"title":"Webhook topic","fancy_title":"Webhook topic","posts_count":1,'
+    '"created_at":"2022-05-16T09:00:00.000Z","views":0,"reply_count":0,"like_count":0,'
+    '"last_posted_at":"2022-05-16T09:00:00.000Z","visible":true,"closed":false,"archived":false,'
+    '"archetype":"regular","slug":"webhook-topic","category_id":17,"word_count":10,"deleted_at":null,"user_id":1,'
+    '"featured_link":null,"pinned_globally":false,"pinned_at":null,"pinned_until":null,"unpinned":null,"pinned":false,'
+    '"highest_post_number":1,"deleted_by":null,"bookmarked":null,"participant_count":1,"thumbnails":null,'
+    '"created_by":{"id":1,"username":"username1","name":"User Name"}}}'
+)
+
+EXAMPLE_WEBHOOK_POST_STRING = (
+    '{"post":{"id":4600001,"name":"Other User","username":"username2","created_at":"2022-05-17T10:00:00.000Z",'
+    '"cooked":"<p>A reply</p>","post_number":2,"post_type":1,"updated_at":"2022-05-17T10:00:00.000Z",'
+    '"reply_count":0,"reply_to_post_number":null,"quote_count":0,"incoming_link_count":0,"reads":0,"score":0,'
+    '"topic_id":11600,"topic_slug":"webhook-topic","topic_title":"Webhook topic","category_id":17,'
+    '"display_username":"Other User","primary_group_name":null,"version":1,"user_title":null,"raw":"A reply",'
+    '"moderator":false,"admin":false,"staff":false,"user_id":2,"hidden":false,"trust_level":0,"deleted_at":null,'
+    '"user_deleted":false,"edit_reason":null,"wiki":false,"reviewable_id":null,"reviewable_score_count":0,'
+    '"reviewable_score_pending_count":0,"topic_posts_count":2,"topic_filtered_posts_count":2,'
+    '"topic_archetype":"regular","category_slug":"server"}}'
+)
+
+
+def send_webhook(server_url, body, event_type, event, signature):
+    """Send a recorded webhook payload to a local webhook server, returning the response status."""
+    webhook_request = urllib.request.Request(
+        server_url,
+        data=body,
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            dscwebhook.EVENT_TYPE_HEADER: event_type,
+            dscwebhook.EVENT_HEADER: event,
+            dscwebhook.SIGNATURE_HEADER: signature,
+        },
+    )
+    try:
+        with urllib.request.urlopen(webhook_request) as response:
+            return response.status
+    except HTTPError as error:
+        return error.code
+
+
+def test_webhook_server_builds_state(tmp_path, capsys):
+    """Test that signed webhooks are filed under their category and saved to a snapshot that can be triaged."""
+    server = dscwebhook.WebhookServer(("127.0.0.1", 0), "secret", dscwebhook.WebhookState("https://test"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        topic_body = EXAMPLE_WEBHOOK_TOPIC_STRING.encode()
+        post_body = EXAMPLE_WEBHOOK_POST_STRING.encode()
+        assert send_webhook(server_url, topic_body, "topic", "topic_created", "sha256=bad") == 403
+        assert not server.state.get_categories()
+
+        signature = dscwebhook.create_signature(topic_body, "secret")
+        assert send_webhook(server_url, topic_body, "topic", "topic_created", signature) == 200
+        signature = dscwebhook.create_signature(post_body, "secret")
+        assert send_webhook(server_url, post_body, "post", "post_created", signature) == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    categories = server.state.get_categories()
+    assert [category.get_id() for _, category in categories] == [17]
+    topic = categories[0][1].get_topics()[0]
+    assert topic.get_name() == "Webhook topic"
+    assert topic.get_tags() == ["lxd"]
+    assert topic.get_latest_update_time() == datetime.datetime(2022, 5, 17, 10, tzinfo=datetime.timezone.utc)
+    assert [post.get_id() for post in topic.get_posts()] == [4600001]
+
+    snapshot_file = tmp_path / "webhooks.jsonl.gz"
+    server.state.save(snapshot_file)
+    dsctriage.main(None, {"start": "2022-05-17", "end": None}, shorten_links=False, snapshot_file=snapshot_file)
+    assert "+4600001 [Other User, 2022-05-17] (https://test/t/11600/2)" in capsys.readouterr().out
+
+    restored_state = dscwebhook.WebhookState()
+    restored_state.load(snapshot_file)
+    restored_state.handle_post(json.loads(EXAMPLE_WEBHOOK_POST_STRING)["post"], "post_destroyed")
+    assert not restored_state.get_categories()[0][1].get_topics()[0].get_posts()
+
+
+def test_webhook_state_category_lookup_and_save_do_not_lose_events(discourse_server, tmp_path, monkeypatch):
+    """Test that a slow category name lookup does not hold up other events, and events during a save are kept."""
+    discourse_server.responses["/c/17/show.json"] = (200, {"category": {"id": 17, "name": "Server", "slug": "server"}})
+    discourse_server.delays["/c/17/show.json"] = 1
+    state = dscwebhook.WebhookState(discourse_server.site_url, resolve_category_names=True)
+    topic_thread = threading.Thread(
+        target=state.handle_topic, args=(json.loads(EXAMPLE_WEBHOOK_TOPIC_STRING)["topic"], "topic_created")
+    )
+    topic_thread.start()
+    time.sleep(0.2)
+
+    post_json = json.loads(EXAMPLE_WEBHOOK_POST_STRING)["post"]
+    del post_json["category_id"]
+    start_time = time.perf_counter()
+    state.handle_post(post_json, "post_created")
+    assert time.perf_counter() - start_time < 0.5
+    topic_thread.join()
+    assert [name for name, _ in state.get_categories()] == ["server"]
+
+    write_snapshot = dscsnapshot.write_snapshot
+
+    def write_snapshot_during_event(*args):
+        write_snapshot(*args)
+        state.handle_post(dict(post_json, id=4600002, post_number=3), "post_created")
+
+    monkeypatch.setattr(dscsnapshot, "write_snapshot", write_snapshot_during_event)
+    state.save(tmp_path / "webhooks.jsonl.gz")
+    assert state.has_changed()
+
+    monkeypatch.setattr(dscsnapshot, "write_snapshot", write_snapshot)
+    state.save(tmp_path / "webhooks.jsonl.gz")
+    assert not state.has_changed()
+
+
+def test_site_limiter_limits_connections_and_rate():
+    """Test that a SiteLimiter bounds concurrent requests and spaces them by its request rate."""
+    limiter = dschttp.SiteLimiter(max_connections=2, requests_per_second=100)
+    active = []
+    max_active = []
+    lock = threading.Lock()
+
+    def limited_request():
+        with limiter.limit():
+            with lock:
+                active.append(1)
+                max_active.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+
+    start_time = time.monotonic()
+    threads = [threading.Thread(target=limited_request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(max_active) == 2
+    assert time.monotonic() - start_time >= 0.05
+
+    dschttp.set_site_limits("http://example.test:8000/", 3)
+    assert dschttp.get_site_limiter("http://example.test:8000/t/1.json").max_connections == 3
+
+
+def test_main_multiple_sites(discourse_server, capsys):
+    """Test that several sites are downloaded and then shown grouped by site."""
+    other_server = start_fake_discourse_server()
+
+    try:
+        register_test_category(discourse_server)
+        register_test_category(other_server)
+
+        dsctriage.main(
+            "general discussions",
+            {"start": "2022-05-16", "end": "2022-05-19"},
+            shorten_links=False,
+            site=discourse_server.site_url,
+            additional_sites=[(other_server.site_url, "general-discussions")],
+        )
+    finally:
+        other_server.shutdown()
+        other_server.server_close()
+
+    output = capsys.readouterr().out
+    first_post = output.index(f"({discourse_server.site_url}/t/11522/2)")
+    second_post = output.index(f"({other_server.site_url}/t/11522/2)")
+    assert first_post < second_post
+    assert other_server.requested_paths.count("/t/11522.json") == 1
+
+
+# Maximum cumulative time, in seconds, to import the cli before it can show its help, with headroom for slow shared
+# runners since importing a deferred module is caught by DEFERRED_MODULES rather than by time
+IMPORT_TIME_BUDGET = 0.5
+
+DEFERRED_MODULES = ("alive_progress", "webbrowser", "urllib.request", "http.server", "cProfile", "concurrent.futures")
+
+
+def test_cli_import_time():
+    """Test that showing the cli help stays within the import time budget without importing deferred modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "dsctriage", "--help"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    # each line is "import time: self [us] | cumulative | imported package", nested imports are indented
+    import_times = {}
+    for line in result.stderr.splitlines():
+        fields = line.partition("import time:")[2].split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            import_times[fields[2].strip()] = int(fields[1]) / 1e6
+
+    assert "dsctriage.dsctriage" in import_times
+    assert import_times["dsctriage.dsctriage"] < IMPORT_TIME_BUDGET
+    for module_name in DEFERRED_MODULES:
+        assert module_name not in import_times
+
+
+def test_pooled_connections(discourse_server):
+    """Test that sequential requests to a site reuse a single keep-alive connection."""
+    discourse_server.responses["/c/1/show.json"] = (200, {"category": {"id": 1, "name": "One"}})
+    discourse_server.responses["/c/3/show.json"] = (500, {})
+
+    for _ in range(3):
+        assert dscfinder.get_category_by_id(1, discourse_server.site_url).get_name() == "One"
+
+    assert len(discourse_server.client_addresses) == 1
+
+    with pytest.raises(HTTPError) as err:
+        dschttp.get_json_from_url(f"{discourse_server.site_url}/c/3/show.json", dscfinder.CATEGORY_JSON_URL)
+    assert err.value.code == 500
+
+    dschttp.close_connections()
+
+
+def test_backlog_multiple_posts(discourse_server, capsys):
+    """Test that backlog posts sharing a topic are found through its batch endpoint and shown in the order given."""
+    for post_id, topic_id in ((101, 1), (102, 1), (103, 1), (201, 2)):
+        discourse_server.responses[f"/posts/{post_id}.json"] = (
+            200,
+            {"id": post_id, "username": f"user{post_id}", "topic_id": topic_id, "post_number": post_id % 100},
+        )
+    discourse_server.responses["/t/1/posts.json?post_ids[]=201&post_ids[]=102&post_ids[]=999"] = (
+        200,
+        {"post_stream": {"posts": [{"id": 102, "username": "user102", "topic_id": 1, "post_number": 2}]}},
+    )
+    dschttp.set_site_limits(discourse_server.site_url, 1)
+
+    post_ids = dsctriage.read_backlog_post_ids(["101", "103", "-"], io.StringIO("201,102\n999\n"))
+    assert post_ids == ["101", "103", "201", "102", "999"]
+
+    dsctriage.print_posts_in_backlog_format(post_ids, discourse_server.site_url)
+
+    output = capsys.readouterr().out.splitlines()
+    assert [line.split(" ")[0] for line in output[:4]] == ["101", "103", "201", "102"]
+    assert output[4] == "No post found with id 999"
+    assert "/posts/102.json" not in discourse_server.requested_paths
+    assert "/posts/999.json" in discourse_server.requested_paths
+    assert len(discourse_server.requested_paths) == 5
+
+
+def test_backlog_posts_in_different_topics(discourse_server):
+    """Test that backlog posts each in a different topic are downloaded one request per post, without batches."""
+    post_ids = [str(1000 + i) for i in range(40)]
+    for i, post_id in enumerate(post_ids):
+        discourse_server.responses[f"/posts/{post_id}.json"] = (
+            200,
+            {"id": int(post_id), "username": "user", "topic_id": i + 1, "post_number": 2},
+        )
+    client = dscfinder.DiscourseClient(discourse_server.site_url, max_connections=4)
+
+    posts = client.get_posts(post_ids)
+
+    assert list(sorted(posts)) == post_ids
+    assert len(discourse_server.requested_paths) == 40
+    assert all(path.startswith("/posts/") for path in discourse_server.requested_paths)
+
+    client.close()
+
+
+def test_split_post_ids_into_batches():
+    """Test that post batches keep their order and stay within both the batch size and maximum URL length."""
+    post_ids = list(range(1000000, 1000500))
+    batches = dscfinder.split_post_ids_into_batches(11522, post_ids, 1000, "https://example.test")
+
+    assert sum(batches, []) == post_ids
+    assert len(batches) > 1
+    for batch in batches:
+        assert len(dscfinder.create_post_batch_url(11522, batch, "https://example.test")) <= dscfinder.MAX_URL_LENGTH
+
+    assert [len(batch) for batch in dscfinder.split_post_ids_into_batches(1, post_ids[:5], 2)] == [2, 2, 1]
+
+
+def test_get_posts_in_batches_learns_batch_size(discourse_server):
+    """Test that a refused batch lowers the site's batch size and its posts are fetched in smaller parallel batches."""
+    for batch in ([1, 2, 3], [4, 5, 6]):
+        discourse_server.responses[dscfinder.create_post_batch_url(5, batch, "")] = (
+            200,
+            {"post_stream": {"posts": [{"id": post_id, "topic_id": 5} for post_id in reversed(batch)]}},
+        )
+    discourse_server.responses[dscfinder.create_post_batch_url(5, [1, 2, 3, 4, 5, 6], "")] = (414, {})
+
+    posts = dscfinder.get_posts_in_batches(5, [1, 2, 3, 4, 5, 6], discourse_server.site_url)
+
+    assert list(posts) == ["1", "2", "3", "4", "5", "6"]
+    assert dscfinder.get_post_batch_size(discourse_server.site_url) == 3
+    assert len(discourse_server.requested_paths) == 3
+
+
+def test_get_posts_in_batches_keeps_batch_size_on_other_errors(discourse_server):
+    """Test that batches failing for reasons other than their size are dropped without lowering the batch size."""
+    client = dscfinder.DiscourseClient(discourse_server.site_url)
+    client.reduce_post_batch_size(4)
+    discourse_server.responses[dscfinder.create_post_batch_url(5, [5, 6], "")] = (
+        200,
+        {"post_stream": {"posts": [{"id": 5, "topic_id": 5}, {"id": 6, "topic_id": 5}]}},
+    )
+
+    posts = client.get_posts_in_batches(5, [1, 2, 3, 4, 5, 6])
+
+    assert list(posts) == ["5", "6"]
+    assert client.get_post_batch_size() == 4
+    assert len(discourse_server.requested_paths) == 2
+
+    client.close()
+
+
+def test_editor_names_resolved_while_downloading(discourse_server, capsys):
+    """Test that edited main posts have their editor looked up while downloading, so rendering makes no requests."""
+    register_test_category(discourse_server)
+    _, topic_json = discourse_server.responses["/t/11522.json"]
+    topic_json["post_stream"]["posts"][0]["updated_at"] = "2022-05-17T10:00:00+00:00"
+    discourse_server.responses["/posts/4592174/revisions/latest.json"] = (200, {"username": "editor1"})
+    discourse_server.responses["/u/editor1.json"] = (200, {"user": {"name": "Editor Name"}})
+
+    start = datetime.datetime(2022, 5, 16, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2022, 5, 20, tzinfo=datetime.timezone.utc)
+    categories = list(dsctriage.download_categories("general discussions", start, site=discourse_server.site_url))
+    assert "/u/editor1.json" in discourse_server.requested_paths
+    assert categories[0][1].get_topics()[0].get_posts()[0].get_editor_name() == "Editor Name"
+
+    discourse_server.requested_paths.clear()
+    dsctriage.print_comments(categories[0][1], start, end, shorten_links=False, site=discourse_server.site_url)
+
+    assert discourse_server.requested_paths == []
+    assert "[Editor Name, 2022-05-17]" in capsys.readouterr().out
+
+
+def test_discourse_client_iterates_lazily(discourse_server):
+    """Test that a DiscourseClient streams topics and posts page by page, downloading only what is used."""
+    stats = dscstats.RunStats()
+    client = dscfinder.DiscourseClient(discourse_server.site_url, max_connections=2, stats=stats)
+    category = DiscourseCategory({"id": 6, "name": "General Discussions"})
+    discourse_server.responses["/c/6.json?state=muted"] = (
+        200,
+        {
+            "topic_list": {
+                "topics": [
+                    {"id": 1, "title": "New", "last_posted_at": "2022-05-18T00:00:00Z"},
+                    {"id": 2, "title": "Pinned", "last_posted_at": "2021-01-01T00:00:00Z", "pinned": True},
+                    {"id": 3, "title": "Old", "last_posted_at": "2022-01-01T00:00:00Z"},
+                ],
+                "more_topics_url": "/c/6?page=1",
+            }
+        },
+    )
+    since = datetime.datetime(2022, 5, 1, tzinfo=datetime.timezone.utc)
+    assert [topic.get_id() for topic in client.iter_topics(category, since)] == [1]
+    assert "/c/6.json?page=1" not in discourse_server.requested_paths
+
+    posts_json = [
+        {"id": 100 + i, "post_number": i, "created_at": f"2022-05-{i + 10}T00:00:00Z", "topic_id": 1}
+        for i in range(1, 8)
+    ]
+    discourse_server.responses["/t/1.json"] = (
+        200,
+        {"post_stream": {"posts": posts_json[:2], "stream": [post["id"] for post in posts_json]}},
+    )
+    for batch in ([103, 104], [105, 106], [107]):
+        discourse_server.responses[dscfinder.create_post_batch_url(1, batch, "")] = (
+            200,
+            {"post_stream": {"posts": [post for post in posts_json if post["id"] in batch]}},
+        )
+    client.reduce_post_batch_size(2)
+
+    posts = client.iter_posts(DiscourseTopic({"id": 1}), datetime.datetime(2022, 5, 13, tzinfo=datetime.timezone.utc))
+    assert next(posts).get_id() == 103
+    assert dscfinder.create_post_batch_url(1, [105, 106], "") not in discourse_server.requested_paths
+    assert [post.get_id() for post in posts] == [104, 105, 106, 107]
+    assert stats.get_endpoint_stats(dscfinder.TOPIC_POST_BATCH_JSON_URL).requests == 3
+
+    client.close()
+
+
+def test_json_backend_decodes_bytes():
+    """Test that the chosen JSON backend decodes response bytes the same as the standard library."""
+    payload = dscbenchmark.create_sample_topic_payload(5)
+
+    assert dscjson.BACKEND in ("json", "orjson")
+    assert dscjson.loads(payload) == json.loads(payload.decode())
+    assert len(dscjson.loads(payload)["post_stream"]["posts"]) == 5
+
+
+def test_benchmark_json_decoding():
+    """Test that every installed JSON backend is timed and shown, with the one used for downloads marked."""
+    payloads = [dscbenchmark.create_sample_topic_payload(10)]
+    results = dscbenchmark.benchmark_json_decoding(payloads, repeat=2)
+
+    assert {"json", "json (str)"} <= set(results)
+    assert all(seconds > 0 for seconds in results.values())
+
+    table = dscbenchmark.format_json_benchmark(results, payloads)
+    assert f"{dscjson.BACKEND} " in table
+    assert table.count(" *") == 1
+
+
+def test_search_index(discourse_server, tmp_path, capsys):
+    """Test that downloaded posts are indexed and can then be searched offline by terms and date."""
+    index_file = str(tmp_path / "posts.db")
+    discourse_server.responses["/posts/101.json"] = (
+        200,
+        {
+            "id": 101,
+            "username": "user1",
+            "topic_id": 1,
+            "created_at": "2022-05-10T10:00:00.000Z",
+            "cooked": "<p>libvirt fails to start <b>qemu</b> guests</p>",
+        },
+    )
+    discourse_server.responses["/posts/102.json"] = (
+        200,
+        {
+            "id": 102,
+            "username": "user2",
+            "topic_id": 1,
+            "created_at": "2022-05-20T10:00:00.000Z",
+            "raw": "qemu works after a libvirt restart",
+        },
+    )
+    discourse_server.responses["/t/1/posts.json?post_ids[]=103"] = (
+        200,
+        {
+            "post_stream": {
+                "posts": [{"id": 103, "username": "user3", "topic_id": 1, "created_at": "2022-05-21T10:00:00.000Z"}]
+            }
+        },
+    )
+    dschttp.set_site_limits(discourse_server.site_url, 1)
+
+    post_index = dsctriage.open_post_index(index_file, [discourse_server.site_url])
+    try:
+        dsctriage.print_posts_in_backlog_format(["101", "102", "103"], discourse_server.site_url)
+    finally:
+        dscfinder.get_client(discourse_server.site_url).set_post_index(None)
+        post_index.close()
+    capsys.readouterr()
+
+    with dscindex.PostIndex(index_file) as post_index:
+        assert post_index.get_num_posts() == 3
+        assert [post.get_id() for _, post in post_index.search(["libvirt", "qemu"])] == [102, 101]
+        assert post_index.search(["<b>"]) == []
+
+    requests_made = len(discourse_server.requested_paths)
+    since = datetime.datetime(2022, 5, 15, tzinfo=datetime.timezone.utc)
+    dsctriage.search_post_index(index_file, ["libvirt"], start=since)
+    dsctriage.search_post_index(index_file, ["missing"])
+
+    output = capsys.readouterr().out.splitlines()
+    assert output[0] == f"102 [user2] ({discourse_server.site_url}/p/102)"
+    assert output[1] == "No posts found"
+    assert len(discourse_server.requested_paths) == requests_made
+
+
+def create_sample_activity(num_posts, num_authors=50, posts_per_topic=10, seed=1):
+    """Create PostActivity with random creation and edit times over 2022, in topics opened by their first post."""
+    random_generator = random.Random(seed)
+    activity = dscanalytics.PostActivity()
+    year_start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    topic_created = year_start
+
+    for i in range(num_posts):
+        post_number = i % posts_per_topic + 1
+        if post_number == 1:
+            topic_created = year_start + random_generator.uniform(0, 360 * 86400)
+        created = topic_created + (post_number - 1) * random_generator.uniform(0, 3 * 86400)
+        updated = created + random_generator.choice([0, 0, 0, random_generator.uniform(0, 10 * 86400)])
+
+        author = f"user{random_generator.randrange(num_authors)}"
+        activity.add(created, updated, author, i // posts_per_topic, post_number)
+
+    return activity
+
+
+def test_activity_stats():
+    """Test that posts are counted as new or updated by author, topic, and day, along with topic response times."""
+    activity = dscanalytics.PostActivity()
+    topic = DiscourseTopic({"id": 7, "title": "Help"})
+    topic.add_post(
+        DiscoursePost({"id": 1, "username": "a", "post_number": 1, "created_at": "2022-05-02T10:00:00.000Z"})
+    )
+    topic.add_post(
+        DiscoursePost(
+            {
+                "id": 2,
+                "username": "a",
+                "post_number": 2,
+                "created_at": "2022-05-02T11:00:00.000Z",
+                "updated_at": "2022-05-02T11:00:00.000Z",
+            }
+        )
+    )
+    topic.add_post(
+        DiscoursePost(
+            {
+                "id": 3,
+                "username": "b",
+                "post_number": 3,
+                "created_at": "2022-05-02T13:00:00.000Z",
+                "updated_at": "2022-05-03T09:00:00.000Z",
+            }
+        )
+    )
+    activity.add_topic(topic)
+    activity.add(datetime.datetime(2022, 5, 3, tzinfo=datetime.timezone.utc).timestamp(), None, "c", 8, 1)
+
+    start = datetime.datetime(2022, 5, 2, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2022, 5, 4, tzinfo=datetime.timezone.utc)
+
+    for use_numpy in (False, True) if dscanalytics.numpy is not None else (False,):
+        stats = dscanalytics.compute_activity_stats(activity, start, end, use_numpy)
+
+        assert stats.get_num_new() == 3
+        assert stats.get_num_updated() == 1
+        assert stats.new_by_day == [2, 1]
+        assert stats.updated_by_day == [0, 1]
+        assert stats.get_top_contributors(2) == [("a", 2, 0), ("b", 0, 1)]
+        assert stats.get_busiest_topics(1) == [(7, "Help", 2, 1)]
+        assert stats.response_times == [3 * 3600]
+        assert stats.unanswered_topics == 1
+        assert dict(stats.get_response_time_histogram())["< 1 day"] == 1
+
+    report = stats.format_report()
+    assert "New posts: 3, updated posts: 1" in report
+    assert "median 3.0h" in report
+
+
+@pytest.mark.skipif(dscanalytics.numpy is None, reason="NumPy is not installed")
+def test_activity_stats_vectorized():
+    """Test that vectorized activity statistics match plain loops, and take well under a second for many posts."""
+    start = datetime.datetime(2022, 3, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2022, 6, 1, tzinfo=datetime.timezone.utc)
+    activity = create_sample_activity(20000)
+
+    expected = dscanalytics.compute_activity_stats(activity, start, end, use_numpy=False)
+    stats = dscanalytics.compute_activity_stats(activity, start, end, use_numpy=True)
+    for attribute in ("new_by_author", "updated_by_author", "new_by_topic", "updated_by_day", "unanswered_topics"):
+        assert getattr(stats, attribute) == getattr(expected, attribute)
+    assert stats.response_times == pytest.approx(expected.response_times)
+
+    activity = create_sample_activity(300000)
+    start_time = time.perf_counter()
+    dscanalytics.compute_activity_stats(activity, start, end, use_numpy=True)
+    assert time.perf_counter() - start_time < 0.5
+
+
+def test_transient_errors_retried(discourse_server, monkeypatch):
+    """Test that busy responses and timeouts are retried, while other error responses fail straight away."""
+    monkeypatch.setattr(dschttp, "RETRY_DELAY", 0.01)
+    stats = dscstats.RunStats()
+    limiter = dschttp.SiteLimiter(timeout=0.2, retries=2)
+    discourse_server.responses["/posts/1.json"] = [(503, {}), (429, {}), (200, {"id": 1})]
+    discourse_server.responses["/posts/3.json"] = (200, {"id": 3})
+    discourse_server.delays["/posts/3.json"] = 0.5
+
+    assert dschttp.get_json_from_url(f"{discourse_server.site_url}/posts/1.json", "post", limiter, stats=stats) == {
+        "id": 1
+    }
+    assert stats.get_endpoint_stats("post").requests == 3
+    assert stats.get_endpoint_stats("post").errors == 2
+
+    with pytest.raises(HTTPError):
+        dschttp.get_json_from_url(f"{discourse_server.site_url}/posts/2.json", "post", limiter, stats=stats)
+    assert discourse_server.requested_paths.count("/posts/2.json") == 1
+
+    with pytest.raises(URLError):
+        dschttp.get_json_from_url(f"{discourse_server.site_url}/posts/3.json", "post", limiter, stats=stats)
+    assert discourse_server.requested_paths.count("/posts/3.json") == 3
+
+    dschttp.close_connections()
+
+
+def test_partly_downloaded_topics_marked_unfetched(discourse_server):
+    """Test that topics whose post stream or some posts could not be downloaded are marked as not fetched."""
+    for topic_id in (1, 2):
+        discourse_server.responses[f"/t/{topic_id}.json"] = (
+            200,
+            {
+                "post_stream": {
+                    "posts": [{"id": topic_id * 100 + 1, "username": "user", "post_number": 1}],
+                    "stream": [topic_id * 100 + post_number for post_number in (1, 2, 3)],
+                }
+            },
+        )
+    discourse_server.responses[dscfinder.create_post_batch_url(1, [102, 103], "")] = (
+        200,
+        {"post_stream": {"posts": [{"id": 102, "post_number": 2}, {"id": 103, "post_number": 3}]}},
+    )
+    discourse_server.responses[dscfinder.create_post_batch_url(2, [202, 203], "")] = (500, {})
+    discourse_server.responses["/t/3.json"] = (404, {})
+    discourse_server.responses["/t/4.json"] = (200, {"post_stream": {"posts": [], "stream": []}})
+    topics = [DiscourseTopic({"id": topic_id, "title": f"Topic {topic_id}"}) for topic_id in (1, 2, 3, 4)]
+
+    dsctriage.fill_topics(topics, False, discourse_server.site_url)
+
+    assert [len(topic.get_posts()) for topic in topics] == [3, 1, 0, 0]
+    assert [topic.get_fetch_failed() for topic in topics] == [False, True, True, False]
+
+    not_fetched_post = dsctriage.PostWithMetadata(topics[1].get_posts()[0], dsctriage.PostStatus.NOT_FETCHED, "")
+    assert "not fetched" in str(not_fetched_post)
+
+
+def test_max_time_marks_unfetched_topics(discourse_server, capsys):
+    """Test that topics not downloaded before the run deadline are cancelled, and marked when comments are shown."""
+    for topic_id in (1, 2):
+        discourse_server.responses[f"/t/{topic_id}.json"] = (
+            200,
+            {
+                "post_stream": {
+                    "posts": [
+                        {
+                            "id": topic_id * 100,
+                            "username": "user",
+                            "post_number": 1,
+                            "created_at": "2022-05-13T10:00:00.000Z",
+                            "updated_at": "2022-05-13T10:00:00.000Z",
+                        }
+                    ]
+                }
+            },
+        )
+    discourse_server.delays["/t/2.json"] = 2
+    topics = [
+        DiscourseTopic({"id": topic_id, "title": f"Topic {topic_id}", "last_posted_at": "2022-05-13T10:00:00.000Z"})
+        for topic_id in (1, 2, 3)
+    ]
+    category = DiscourseCategory({"id": 1, "name": "Server"})
+    for topic in topics:
+        category.add_topic(topic)
+    dschttp.set_site_limits(discourse_server.site_url, 1)
+
+    dschttp.get_deadline().set(0.5)
+    start_time = time.perf_counter()
+    try:
+        dsctriage.fill_topics(topics, False, discourse_server.site_url)
+    finally:
+        dschttp.get_deadline().set(None)
+
+    assert time.perf_counter() - start_time < 1.5
+    assert [topic.get_fetch_failed() for topic in topics] == [False, True, True]
+    assert "/t/3.json" not in discourse_server.requested_paths
+
+    start = datetime.datetime(2022, 5, 13, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(days=1)
+    dsctriage.print_comments(category, start, end, False, False, discourse_server.site_url)
+    output = capsys.readouterr().out.splitlines()
+
+    assert output[0].startswith("+Topic 1")
+    assert output[1].startswith("!Topic 2") and "[not fetched, 2022-05-13]" in output[1]
+    assert output[2].startswith("!Topic 3")
+    dschttp.close_connections()
+
+
+def test_hedged_requests(discourse_server):
+    """Test that a request slower than its learned percentile is hedged, the first response wins, and load is capped."""
+    stats = dscstats.RunStats()
+    url = f"{discourse_server.site_url}/t/1.json"
+    discourse_server.responses["/t/1.json"] = (200, {"id": 1})
+
+    hedge_policy = dschttp.HedgePolicy(percentile=50, max_extra=1)
+    assert dschttp.read_url_hedged(url, "topic", hedge_policy, stats=stats) == b'{"id": 1}'
+    assert stats.get_endpoint_stats("topic") is None
+
+    for _ in range(dschttp.MIN_HEDGE_SAMPLES):
+        hedge_policy.record_latency("topic", 0.05)
+    discourse_server.delays["/t/1.json"] = [2, 0]
+
+    start_time = time.perf_counter()
+    assert dschttp.read_url_hedged(url, "topic", hedge_policy, stats=stats) == b'{"id": 1}'
+    assert time.perf_counter() - start_time < 1
+    assert stats.get_endpoint_stats("topic").hedges == 1
+    assert stats.get_endpoint_stats("topic").hedges_won == 1
+    assert "Hedged" in stats.format_table()
+
+    capped_policy = dschttp.HedgePolicy(percentile=50, max_extra=0)
+    for _ in range(dschttp.MIN_HEDGE_SAMPLES):
+        capped_policy.record_latency("topic", 0.05)
+    discourse_server.delays["/t/1.json"] = [0.3, 0]
+
+    assert dschttp.read_url_hedged(url, "topic", capped_policy, stats=stats) == b'{"id": 1}'
+    assert stats.get_endpoint_stats("topic").hedges == 1
+
+    # hedges need a free connection within the site's limits
+    limiter = dschttp.SiteLimiter(max_connections=1)
+    discourse_server.delays["/t/1.json"] = [0.3, 0]
+    with limiter.limit():
+        assert dschttp.read_url_hedged(url, "topic", hedge_policy, stats=stats, limiter=limiter) == b'{"id": 1}'
+    assert stats.get_endpoint_stats("topic").hedges == 1
+
+    # a won hedge cancels the first request, and the policy learns how long the first request had taken by then
+    learning_policy = dschttp.HedgePolicy(percentile=100, max_extra=1)
+    for _ in range(dschttp.MIN_HEDGE_SAMPLES):
+        learning_policy.record_latency("topic", 0.05)
+    discourse_server.delays["/t/1.json"] = [2, 0]
+    start_time = time.perf_counter()
+    assert dschttp.read_url_hedged(url, "topic", learning_policy, stats=stats, limiter=limiter) == b'{"id": 1}'
+    assert time.perf_counter() - start_time < 1
+    assert stats.get_endpoint_stats("topic").hedges == 2
+    assert learning_policy.get_hedge_delay("topic") > 0.05
+    time.sleep(0.1)
+    assert limiter.try_acquire()
+    limiter.release()
+    dschttp.close_connections()
+
+
+def test_benchmark_report_stages():
+    """Test that synthetic topics follow the requested reply shape, every stage is timed, and quadratic growth shows."""
+    topics_json = dscbenchmark.create_synthetic_topics_json(2, 40, reply_depth=2, fan_out=3, edit_ratio=0.5)
+    assert len(topics_json) == 2
+    posts_json = topics_json[0][1]
+    assert [post_json["reply_to_post_number"] for post_json in posts_json[:8]] == [None, None, None, None, 2, 2, 2, 3]
+    assert posts_json[20]["reply_to_post_number"] is None
+
+    post_metadata_list = dsctriage.get_metadata_for_posts_of_topic(
+        dscbenchmark.create_synthetic_category(topics_json).get_topics()[0], *dscbenchmark.get_synthetic_date_range()
+    )[0]
+    top_level_posts = dsctriage.create_reply_tree(post_metadata_list)
+    assert sum(len(post_with_meta.replies) for post_with_meta in post_metadata_list) == 9
+    assert top_level_posts[0].post.get_post_number() == 1
+
+    results = dscbenchmark.benchmark_scaling((10, 40), num_topics=2, repeat=1)
+    assert [num_posts for num_posts, _ in results] == [10, 40]
+    assert set(results[0][1]) == set(dscbenchmark.BENCHMARK_STAGES)
+
+    quadratic_results = [(1000, dict.fromkeys(dscbenchmark.BENCHMARK_STAGES, 0.01))]
+    quadratic_results.append((10000, dict(quadratic_results[0][1], tree=1.0)))
+    assert dscbenchmark.find_quadratic_stages(quadratic_results) == ["tree"]
+    assert "! quadratic scaling in: tree" in dscbenchmark.format_scaling_benchmark(quadratic_results)
+
+
+def test_comment_chains_rendered_in_one_write(monkeypatch):
+    """Test that a topic's comment chains are indented under their branches and written to stdout all at once."""
+    topic = DiscourseTopic({"id": 5, "title": "Chains", "slug": "chains"})
+    for post_number, reply_to in ((1, None), (2, None), (3, 2), (4, 3), (5, 2), (6, 2), (7, None)):
+        topic.add_post(
+            DiscoursePost(
+                {
+                    "id": 500 + post_number,
+                    "username": f"user{post_number}",
+                    "post_number": post_number,
+                    "reply_to_post_number": reply_to,
+                    "created_at": "2022-05-13T10:00:00.000Z",
+                    "updated_at": "2022-05-13T10:00:00.000Z",
+                }
+            )
+        )
+    category = DiscourseCategory({"id": 1, "name": "Server"})
+    category.add_topic(topic)
+    writes = []
+    monkeypatch.setattr(sys, "stdout", type("Output", (), {"write": lambda self, data: writes.append(data)})())
+
+    start = datetime.datetime(2022, 5, 13, tzinfo=datetime.timezone.utc)
+    dsctriage.print_comments(category, start, start + datetime.timedelta(days=1), False, False, "https://example.test")
+
+    assert len(writes) == 1
+    assert [line.split(" [")[0] for line in writes[0].splitlines()] == [
+        "+Chains                   ",
+        "├─ +502",
+        "│  ├─ +503",
+        "│  │  └─ +504",
+        "│  ├─ +505",
+        "│  └─ +506",
+        "└─ +507",
+    ]
+
+
+def test_large_post_streams_parsed_in_process_pool(discourse_server):
+    """Test that post streams over the cutover are decoded in worker processes into the same posts as in-process."""
+    posts_json = [
+        {
+            "id": 100 + i,
+            "username": f"user{i}",
+            "post_number": i,
+            "created_at": "2022-05-10T00:00:00Z",
+            "raw": "Reply",
+            "cooked": "<p>Reply</p>" * 50,
+            "reply_to_post_number": 1 if i > 1 else None,
+            "topic_id": 1,
+        }
+        for i in range(1, 6)
+    ]
+    topic_json = {"id": 1, "post_stream": {"posts": posts_json, "stream": [101, 102, 103, 104, 105]}}
+    discourse_server.responses["/t/1.json"] = (200, topic_json)
+    body = json.dumps(topic_json).encode()
+
+    with dscparse.ParsePool(1, cutover_bytes=len(body) // 2) as parse_pool:
+        assert [post.to_json() for post in parse_pool.parse_post_stream(json.dumps({}).encode())[0]] == []
+        assert not parse_pool.is_started()
+
+        with dscfinder.DiscourseClient(discourse_server.site_url) as client:
+            client.set_parse_pool(parse_pool)
+            posts, stream = client.get_topic_post_stream(DiscourseTopic({"id": 1}))
+            assert parse_pool.is_started()
+
+    assert stream == [101, 102, 103, 104, 105]
+    assert [post.to_json() for post in posts] == [DiscoursePost(post_json).to_json() for post_json in posts_json]
+    assert posts[1].get_reply_to_number() == 1
+
+
+def test_topics_fetched_by_priority(discourse_server):
+    """Test that topics bumped within the range are downloaded first, then later topics with the most posts."""
+    listing = [
+        (1, "2022-01-01T00:00:00Z", True, 5),
+        (2, "2022-05-13T09:00:00Z", True, 5),
+        (3, "2022-06-01T00:00:00Z", False, 3),
+        (4, "2022-06-02T00:00:00Z", False, 40),
+        (5, "2022-05-12T00:00:00Z", False, 2),
+        (6, "2022-05-13T10:00:00Z", False, 2),
+        (7, None, False, 1),
+    ]
+    topics = []
+    for topic_id, bumped_at, pinned, posts_count in listing:
+        topic_json = {"id": topic_id, "title": f"Topic {topic_id}", "pinned": pinned, "posts_count": posts_count}
+        if bumped_at is not None:
+            topic_json.update(bumped=True, bumped_at=bumped_at)
+        topics.append(DiscourseTopic(topic_json))
+        discourse_server.responses[f"/t/{topic_id}.json"] = (
+            200,
+            {"post_stream": {"posts": [{"id": topic_id * 100, "post_number": 1, "topic_id": topic_id}]}},
+        )
+
+    start = datetime.datetime(2022, 5, 10, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2022, 5, 20, tzinfo=datetime.timezone.utc)
+    assert topics[3].get_posts_count() == 40
+    assert [topic.get_id() for topic in sorted(topics, key=dsctriage.get_topic_fetch_priority)] == [4, 3, 6, 5, 2, 1, 7]
+
+    dschttp.set_site_limits(discourse_server.site_url, 1)
+    discourse_server.requested_paths.clear()
+    dsctriage.fill_topics(topics, False, discourse_server.site_url, editors_since=start, end=end)
+
+    topic_paths = [path for path in discourse_server.requested_paths if path.startswith("/t/")]
+    assert topic_paths == [f"/t/{topic_id}.json" for topic_id in (6, 5, 2, 4, 3, 7, 1)]
+    assert [topic.get_id() for topic in topics] == [1, 2, 3, 4, 5, 6, 7]
+    dschttp.close_connections()
+
+
+def test_shards_merged_into_normal_report(discourse_server, tmp_path, capsys):
+    """Test that shards each download a disjoint set of topics, and merging them shows the same report as one run."""
+    category = register_test_category(discourse_server)
+    topic_ids = [topic.get_id() for topic in category.get_topics()]
+    assert [dscsnapshot.get_topic_shard(topic_id, 5) for topic_id in topic_ids] == [4, 3]
+    report_args = ("general discussions", {"start": "2022-05-16", "end": None})
+
+    dsctriage.main(*report_args, shorten_links=False, site=discourse_server.site_url)
+    expected_output = capsys.readouterr().out
+
+    shard_files = [str(tmp_path / f"shard-{index + 1}-of-5.jsonl.gz") for index in range(5)]
+    for index, shard_file in enumerate(shard_files):
+        discourse_server.requested_paths.clear()
+        dsctriage.main(*report_args, site=discourse_server.site_url, shard=(index, 5), shard_file=shard_file)
+
+        fetched_ids = [topic_id for topic_id in topic_ids if f"/t/{topic_id}.json" in discourse_server.requested_paths]
+        assert fetched_ids == [topic_id for topic_id in topic_ids if dscsnapshot.get_topic_shard(topic_id, 5) == index]
+    capsys.readouterr()
+
+    dsctriage.launch_merge(list(reversed(shard_files)) + ["--fullurls"], dsctriage.Config())
+    assert capsys.readouterr().out == expected_output
+
+    _, categories = dscsnapshot.merge_shards(shard_files[4:])
+    assert [topic.get_fetch_failed() for topic in categories[0][1].get_topics()] == [False, True]
+
+    dscsnapshot.write_snapshot(tmp_path / "snapshot.jsonl.gz", [("server", category)], discourse_server.site_url)
+    with pytest.raises(ValueError):
+        dscsnapshot.merge_shards(shard_files[4:] + [tmp_path / "snapshot.jsonl.gz"])
+
+
+def test_cached_report_redownloads_only_bumped_topics(discourse_server, tmp_path, capsys):
+    """Test that a cached report is shown after checking only the topic list, and only bumped topics are updated."""
+    register_test_category(discourse_server)
+    discourse_server.responses["/t/10648.json"] = (
+        200,
+        {
+            "post_stream": {
+                "posts": [
+                    {
+                        "id": 1,
+                        "post_number": 1,
+                        "created_at": "2023-05-17T08:06:53Z",
+                        "updated_at": "2023-05-17T08:06:53Z",
+                    }
+                ]
+            }
+        },
+    )
+    report_args = ("general discussions", {"start": "2022-05-16", "end": "2022-05-19"})
+    report_kwargs = {"shorten_links": False, "site": discourse_server.site_url}
+    cache_file = tmp_path / "cache" / "reports.json"
+
+    dsctriage.main(*report_args, **report_kwargs)
+    expected_output = capsys.readouterr().out
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert capsys.readouterr().out == expected_output
+
+    discourse_server.requested_paths.clear()
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert capsys.readouterr().out == expected_output
+    assert discourse_server.requested_paths == ["/c/6.json?state=muted"]
+
+    topics_json = discourse_server.responses["/c/6.json?state=muted"][1]["topic_list"]["topics"]
+    topics_json[0]["last_posted_at"] = "2022-06-14T10:00:00.000Z"
+    posts_json = discourse_server.responses["/t/11522.json"][1]["post_stream"]["posts"]
+    posts_json[1]["updated_at"] = "2022-05-18T10:00:00.000Z"
+
+    dsctriage.main(*report_args, **report_kwargs)
+    expected_output = capsys.readouterr().out
+    assert "*4592175 [User Name, 2022-05-18]" in expected_output
+
+    discourse_server.requested_paths.clear()
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert capsys.readouterr().out == expected_output
+    assert "/t/11522.json" in discourse_server.requested_paths
+    assert "/t/10648.json" not in discourse_server.requested_paths
+
+
+def test_cached_report_refetches_unfetched_topics(discourse_server, tmp_path, capsys):
+    """Test that a topic that was not fetched for a cached report is downloaded again even beyond the first page."""
+    register_test_category(discourse_server)
+    discourse_server.responses["/t/10648.json"] = (
+        200,
+        {
+            "post_stream": {
+                "posts": [
+                    {
+                        "id": 1,
+                        "post_number": 1,
+                        "created_at": "2023-05-17T08:06:53Z",
+                        "updated_at": "2023-05-17T08:06:53Z",
+                    }
+                ]
+            }
+        },
+    )
+    first_page_topic, second_page_topic = discourse_server.responses["/c/6.json?state=muted"][1]["topic_list"]["topics"]
+    discourse_server.responses["/c/6.json?state=muted"] = (
+        200,
+        {"topic_list": {"topics": [second_page_topic], "more_topics_url": "/c/6?page=1"}},
+    )
+    discourse_server.responses["/c/6.json?page=1"] = (200, {"topic_list": {"topics": [first_page_topic]}})
+    topic_response = discourse_server.responses.pop("/t/11522.json")
+    report_args = ("general discussions", {"start": "2022-05-16", "end": "2022-05-19"})
+    report_kwargs = {"shorten_links": False, "site": discourse_server.site_url}
+    cache_file = tmp_path / "reports.json"
+
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert "[not fetched" in capsys.readouterr().out
+
+    discourse_server.responses["/t/11522.json"] = topic_response
+    dsctriage.main(*report_args, **report_kwargs)
+    expected_output = capsys.readouterr().out
+    assert "[not fetched" not in expected_output
+
+    discourse_server.requested_paths.clear()
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert capsys.readouterr().out == expected_output
+    assert "/c/6.json?page=1" in discourse_server.requested_paths
+    assert "/t/11522.json" in discourse_server.requested_paths
+    assert "/t/10648.json" not in discourse_server.requested_paths
+
+    discourse_server.requested_paths.clear()
+    dsctriage.main(*report_args, **report_kwargs, report_cache=dsccache.ReportCache(cache_file))
+    assert capsys.readouterr().out == expected_output
+    assert discourse_server.requested_paths == ["/c/6.json?state=muted"]
+
+
+def test_trace_records_spans(discourse_server, tmp_path, capsys):
+    """Test that a traced run writes request, decoding, model, classification, and rendering spans for a viewer."""
+    register_test_category(discourse_server)
+    trace_file = tmp_path / "trace.json"
+
+    dsctrace.get_trace().start()
+    try:
+        dsctriage.main("general discussions", {"start": "2022-05-16", "end": None}, site=discourse_server.site_url)
+    finally:
+        dsctrace.get_trace().stop()
+    dsctrace.get_trace().write(trace_file)
+    capsys.readouterr()
+
+    with open(trace_file, encoding="utf-8") as trace:
+        events = json.load(trace)["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+
+    assert {span["cat"] for span in spans} == {"http", "json", "model", "topic", "report"}
+    topic_request = next(span for span in spans if span["name"] == "/t/#id.json")
+    assert topic_request["args"]["status"] == 200 and topic_request["args"]["bytes"] > 0
+    assert {span["args"]["topic_id"] for span in spans if span["name"] == "download topic"} == {11522, 10648}
+    assert any(span["name"] == "render topic" and span["args"]["topic_id"] == 11522 for span in spans)
+    assert all(span["ts"] >= 0 and span["dur"] >= 0 for span in spans)
+    assert {event["tid"] for event in events if event["ph"] == "M"} == {span["tid"] for span in spans}
+
+    with dsctrace.span("not recorded", "test"):
+        pass
+    assert len(dsctrace.get_trace().get_events()) == len(events)
+
+
+def test_relevant_posts_only_keeps_reply_ancestors(discourse_server):
+    """Test that a long topic keeps only changed posts and their ancestors, downloading dropped ancestors by number."""
+    client = dscfinder.DiscourseClient(discourse_server.site_url, max_connections=2)
+    reply_to = {20: 3, 27: 1, 30: 20}
+    posts_json = [
+        {
+            "id": 100 + i,
+            "post_number": i,
+            "username": f"user{i}",
+            "raw": f"Post {i}",
+            "created_at": "2022-05-20T00:00:00Z" if i >= 25 else "2022-04-01T00:00:00Z",
+            "updated_at": "2022-05-20T00:00:00Z" if i >= 25 else "2022-04-01T00:00:00Z",
+            "reply_to_post_number": reply_to.get(i),
+            "topic_id": 1,
+        }
+        for i in range(1, 31)
+    ]
+    discourse_server.responses["/t/1.json"] = (
+        200,
+        {"post_stream": {"posts": posts_json[:5], "stream": [post["id"] for post in posts_json]}},
+    )
+    for batch in dscfinder.split_post_ids_into_batches(1, [post["id"] for post in posts_json[5:]], 10, ""):
+        discourse_server.responses[dscfinder.create_post_batch_url(1, batch, "")] = (
+            200,
+            {"post_stream": {"posts": [post for post in posts_json if post["id"] in batch]}},
+        )
+    for post_number in (3, 20):
+        discourse_server.responses[f"/posts/by_number/1/{post_number}.json"] = (200, posts_json[post_number - 1])
+    client.reduce_post_batch_size(10)
+
+    since = datetime.datetime(2022, 5, 16, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2022, 6, 1, tzinfo=datetime.timezone.utc)
+    relevant_topic = DiscourseTopic({"id": 1, "title": "Long", "slug": "long"})
+    client.add_relevant_posts(relevant_topic, since)
+    full_topic = DiscourseTopic({"id": 1, "title": "Long", "slug": "long"})
+    client.add_posts_to_topic(full_topic)
+
+    assert [post.get_post_number() for post in relevant_topic.get_posts()] == [1, 3, 20, 25, 26, 27, 28, 29, 30]
+    assert "/posts/by_number/1/20.json" in discourse_server.requested_paths
+    assert "/posts/by_number/1/3.json" in discourse_server.requested_paths
+    assert "/posts/by_number/1/1.json" not in discourse_server.requested_paths
+    report = dsctriage.format_topic_comments(relevant_topic, since, end)
+    assert "user20" in report and report == dsctriage.format_topic_comments(full_topic, since, end)
+
+    client.close()
@@ -0,0 +1,102 @@
+"""Incremental polling of Discourse categories for long-running triage."""
+
+from datetime import datetime, timedelta, timezone
+from . import dscfinder
+from .discourse_category import DiscourseCategory
+
+DEFAULT_RETENTION = timedelta(days=7)
+
+
+class CategoryWatcher:
+    """
+    Keep categories with their topics and posts in memory, downloading only topics bumped since they were last seen.
+
+    Each poll checks just the first topic list page of every category, since any newly updated topic is moved to the
+    top of the list.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, categories, since, retention=DEFAULT_RETENTION, site=None, tag=None):
+        """
+        Watch a list of (name, DiscourseCategory) pairs for posts created or updated at or after since.
+
+        Topics not updated within the retention period are removed from memory.
+        """
+        self._categories = categories
+        self._retention = retention
+        self._site = site
+        self._tag = tag
+        self._topics = {category.get_id(): {} for _, category in categories}
+        self._watermarks = {category.get_id(): since for _, category in categories}
+
+    def get_topics(self, category):
+        """Get the topics currently held in memory for a watched category."""
+        return list(self._topics[category.get_id()].values())
+
+    def get_watermark(self, category):
+        """Get the time after which new or updated posts in a category have not been reported yet."""
+        return self._watermarks[category.get_id()]
+
+    def evict(self, now=None):
+        """Remove topics that have not been updated within the retention period."""
+        cutoff = (now or datetime.now(timezone.utc)) - self._retention
+
+        for topics in self._topics.values():
+            for topic_id, topic in list(topics.items()):
+                update_time = topic.get_latest_update_time()
+                if update_time is not None and update_time < cutoff:
+                    del topics[topic_id]
+
+    def poll_category(self, category):
+        """
+        Download topics of a category bumped since the last poll, keeping posts already held in memory.
+
+        Returns a DiscourseCategory containing only the updated topics, and the time from which their posts are new.
+        """
+        category_topics = self._topics[category.get_id()]
+        watermark = self._watermarks[category.get_id()]
+        updated_category = DiscourseCategory(category.to_json())
+        new_watermark = watermark
+
+        topics, _ = dscfinder.get_topics_from_category_page(
+            dscfinder.get_first_category_page_url(category, self._site), self._site
+        )
+
+        for topic in topics:
+            update_time = topic.get_latest_update_time()
+            if update_time is None or update_time < watermark or (self._tag and not topic.has_tag(self._tag)):
+                continue
+
+            known_topic = category_topics.get(topic.get_id())
+            if known_topic is not None and known_topic.get_latest_update_time() == update_time:
+                continue
+
+            known_posts = None
+            if known_topic is not None:
+                known_posts = {post.get_id(): post for post in known_topic.get_posts()}
+
+            dscfinder.add_posts_to_topic(topic, self._site, known_posts)
+            dscfinder.add_editor_name_to_topic(topic, watermark, self._site)
+            category_topics[topic.get_id()] = topic
+            updated_category.add_topic(topic)
+            new_watermark = max(new_watermark, update_time + timedelta(microseconds=1))
+
+        self._watermarks[category.get_id()] = new_watermark
+        return updated_category, watermark
+
+    def poll(self, now=None):
+        """
+        Poll every watched category, then remove topics outside the retention period.
+
+        Returns a list of (name, DiscourseCategory, start) for categories with updated topics, where the category
+        holds only those topics and start is the time from which their posts are newly relevant.
+        """
+        updates = []
+
+        for category_name, category in self._categories:
+            updated_category, start = self.poll_category(category)
+            if len(updated_category.get_topics()) > 0:
+                updates.append((category_name, updated_category, start))
+
+        self.evict(now)
+        return updates
@@ -0,0 +1,272 @@
+"""Discourse webhook listener keeping categories, topics, and posts up to date without crawling."""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import dscfinder, dscsnapshot
+from .discourse_post import DiscoursePost
+from .discourse_topic import DiscourseTopic
+from .discourse_category import DiscourseCategory
+
+SIGNATURE_HEADER = "X-Discourse-Event-Signature"
+
+EVENT_TYPE_HEADER = "X-Discourse-Event-Type"
+
+EVENT_HEADER = "X-Discourse-Event"
+
+DEFAULT_SAVE_INTERVAL = 10
+
+
+def create_signature(body, secret):
+    """Create the signature header value Discourse sends for a webhook body signed with a secret."""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def is_valid_signature(body, secret, signature):
+    """Check if a webhook signature header matches the body and secret."""
+    return signature is not None and hmac.compare_digest(create_signature(body, secret), signature)
+
+
+class WebhookState:
+    """Categories, topics, and posts built from webhook events, which can be saved as a snapshot."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, site=None, resolve_category_names=False):
+        """
+        Create an empty state for a site.
+
+        If resolve_category_names is set then the name of each new category is downloaded from the site, otherwise
+        categories are named by their id until a snapshot with their names is loaded.
+        """
+        self._site = site
+        self._resolve_category_names = resolve_category_names
+        self._lock = threading.Lock()
+        self._categories = {}
+        self._category_names = {}
+        self._topics = {}
+        self._topic_categories = {}
+        self._posts = {}
+        self._num_changes = 0
+        self._num_saved_changes = 0
+
+    def load(self, filename):
+        """Load categories, topics, and posts from a snapshot, such as one saved previously from this state."""
+        with self._lock:
+            for category_name, category in dscsnapshot.iter_snapshot_categories(filename):
+                self._categories[category.get_id()] = category
+                self._category_names[category.get_id()] = category_name
+
+                for topic in category.get_topics():
+                    self._topics[topic.get_id()] = topic.to_json()
+                    self._topic_categories[topic.get_id()] = category.get_id()
+                    self._posts[topic.get_id()] = {post.get_id(): post for post in topic.get_posts()}
+
+    def has_changed(self):
+        """Check if any events have been handled since the state was last saved."""
+        with self._lock:
+            return self._num_changes != self._num_saved_changes
+
+    def get_category(self, category_id):
+        """
+        Get the category with a given id, creating it if it has not been seen before.
+
+        The name of a new category is downloaded without holding the state's lock, so other events are not held up.
+        """
+        with self._lock:
+            if category_id in self._categories:
+                return self._categories[category_id]
+
+        category = None
+        if self._resolve_category_names:
+            category = dscfinder.get_category_by_id(category_id, self._site)
+
+        if category is None:
+            category = DiscourseCategory({"id": category_id, "name": str(category_id)})
+
+        with self._lock:
+            if category_id not in self._categories:
+                self._categories[category_id] = category
+                self._category_names[category_id] = category.get_slug() or category.get_name()
+            return self._categories[category_id]
+
+    def handle_topic(self, topic_json, event=None):
+        """Add or update a topic from a topic webhook payload, or remove it if it was destroyed."""
+        if "id" not in topic_json:
+            return
+
+        if event != "topic_destroyed" and "category_id" in topic_json:
+            self.get_category(topic_json["category_id"])
+
+        with self._lock:
+            topic_id = topic_json["id"]
+
+            if event == "topic_destroyed":
+                self._topics.pop(topic_id, None)
+                self._posts.pop(topic_id, None)
+                self._topic_categories.pop(topic_id, None)
+            else:
+                self._topics[topic_id] = DiscourseTopic(topic_json).to_json()
+                self._posts.setdefault(topic_id, {})
+                if "category_id" in topic_json:
+                    self._topic_categories[topic_id] = topic_json["category_id"]
+
+            self._num_changes += 1
+
+    def handle_post(self, post_json, event=None):
+        """Add or update a post from a post webhook payload, or remove it if it was destroyed."""
+        if "id" not in post_json or "topic_id" not in post_json:
+            return
+
+        if event != "post_destroyed" and "category_id" in post_json:
+            self.get_category(post_json["category_id"])
+
+        with self._lock:
+            topic_id = post_json["topic_id"]
+            topic_posts = self._posts.setdefault(topic_id, {})
+
+            if event == "post_destroyed":
+                topic_posts.pop(post_json["id"], None)
+            else:
+                post = DiscoursePost(post_json)
+                topic_posts[post.get_id()] = post
+
+                # keep the topic's update time current, creating it from the post's topic details if it is new
+                topic_json = self._topics.setdefault(
+                    topic_id,
+                    {
+                        "id": topic_id,
+                        "title": post_json.get("topic_title") or f"Topic {topic_id}",
+                        "slug": post_json.get("topic_slug"),
+                    },
+                )
+                post_times = [
+                    post_time
+                    for post_time in (post.get_creation_time(), post.get_update_time())
+                    if post_time is not None
+                ]
+                topic_update_time = DiscourseTopic(topic_json).get_latest_update_time()
+                if topic_update_time is not None:
+                    post_times.append(topic_update_time)
+                if len(post_times) > 0:
+                    topic_json["bumped"] = True
+                    topic_json["bumped_at"] = max(post_times).isoformat()
+
+                if "category_id" in post_json:
+                    self._topic_categories[topic_id] = post_json["category_id"]
+
+            self._num_changes += 1
+
+    def get_categories(self):
+        """
+        Get a list of (name, DiscourseCategory) pairs holding every topic and post received so far.
+
+        Topics are ordered by most recent update first, and posts by their number within the topic.
+        """
+        with self._lock:
+            return self.create_categories()
+
+    def create_categories(self):
+        """Create the list of categories returned by get_categories, while holding the state's lock."""
+        categories = {}
+        for category_id, category in self._categories.items():
+            categories[category_id] = DiscourseCategory(category.to_json())
+
+        topics = []
+        for topic_id, category_id in self._topic_categories.items():
+            topic = DiscourseTopic(self._topics[topic_id])
+            for post in sorted(self._posts.get(topic_id, {}).values(), key=lambda post: post.get_post_number() or 0):
+                topic.add_post(post)
+            topics.append((category_id, topic))
+
+        oldest_time = datetime.min.replace(tzinfo=timezone.utc)
+        for category_id, topic in sorted(
+            topics, key=lambda item: item[1].get_latest_update_time() or oldest_time, reverse=True
+        ):
+            categories[category_id].add_topic(topic)
+
+        return [(self._category_names[category_id], category) for category_id, category in categories.items()]
+
+    def save(self, filename):
+        """
+        Save the state as a snapshot, replacing the file at once so readers never see a partial snapshot.
+
+        Events handled while the snapshot is written are left to be saved the next time.
+        """
+        with self._lock:
+            num_changes = self._num_changes
+            categories = self.create_categories()
+
+        temporary_filename = f"{filename}.tmp"
+        dscsnapshot.write_snapshot(temporary_filename, categories, self._site)
+        os.replace(temporary_filename, filename)
+
+        with self._lock:
+            self._num_saved_changes = max(self._num_saved_changes, num_changes)
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Handle Discourse webhook POST requests, verifying their signature before updating the server's state."""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Verify and apply a webhook event."""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if not is_valid_signature(body, self.server.secret, self.headers.get(SIGNATURE_HEADER)):
+            logging.debug("Rejected webhook with an invalid signature")
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        event_type = self.headers.get(EVENT_TYPE_HEADER)
+        event = self.headers.get(EVENT_HEADER)
+        logging.debug("Received %s webhook event", event)
+
+        if event_type == "post" and "post" in payload:
+            self.server.state.handle_post(payload["post"], event)
+        elif event_type == "topic" and "topic" in payload:
+            self.server.state.handle_topic(payload["topic"], event)
+
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests at debug level rather than printing them."""
+        logging.debug(format, *args)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """HTTP server receiving Discourse webhooks into a WebhookState, periodically saving it to a snapshot file."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, address, secret, state=None, state_file=None, save_interval=DEFAULT_SAVE_INTERVAL):
+        """Listen on a (host, port) address for webhooks signed with the given secret."""
+        super().__init__(address, WebhookRequestHandler)
+        self.secret = secret
+        self.state = state if state is not None else WebhookState()
+        self.state_file = state_file
+        self.save_interval = save_interval
+        self._last_save_time = time.monotonic()
+
+    def save_state(self):
+        """Save the state to the state file, if there is one and it has changed."""
+        if self.state_file is not None and self.state.has_changed():
+            self.state.save(self.state_file)
+            self._last_save_time = time.monotonic()
+
+    def service_actions(self):
+        """Save the state between requests once the save interval has passed."""
+        if time.monotonic() - self._last_save_time >= self.save_interval:
+            self.save_state()
@@ -23,5 +23,6 @@ setup(
     packages=["dsctriage"],
     entry_points={"console_scripts": ["dsctriage=dsctriage.dsctriage:launch"]},
     install_requires=["alive-progress"],
+    extras_require={"fast": ["orjson"], "analytics": ["numpy"]},
     zip_safe=False,
 )